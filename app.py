@@ -1,17 +1,76 @@
 import streamlit as st
 import pandas as pd
 import os
+import time
+from io import BytesIO
 
 # Set max upload size to 2GB (Streamlit's absolute maximum)
 os.environ['STREAMLIT_SERVER_MAX_UPLOAD_SIZE'] = "2048"
 
 # Import modules from src
 from src.ui import (
-    setup_page, render_header, render_file_upload_section,
-    render_comparison_results, render_download_section
+    setup_page, render_header, render_file_upload_section, render_settings_sidebar,
+    render_comparison_results, render_download_section, render_profile_download, render_job_status,
+    render_schema_report, render_mode_selector, render_baseline_upload_section, render_difference_matrix,
+    render_quick_check_settings, render_quick_check_report, COMPARISON_MODES
 )
-from src.file_handler import read_file
-from src.comparison import compare_files
+from src.pipeline import run_comparison_to_store
+from src.multi_compare import compare_many
+from src.result_store import load_result, diff_store_path
+from src.schema import inspect_schemas
+from src.sampling import quick_check, format_quick_check_report
+from src.jobs import submit_job, get_job, cancel_job
+
+# Seconds between status checks of a running comparison
+JOB_POLL_SECONDS = 1
+
+def copy_upload(file):
+    """Copy an uploaded file into a new buffer that keeps its name"""
+    buffer = BytesIO(file.getvalue())
+    buffer.name = file.name
+    return buffer
+
+def poll_pending_job(job):
+    """
+    Show the status of a queued or running job and check it again shortly.
+    Warns when the cancel button was clicked after the job had started.
+    """
+    if render_job_status(job) and not cancel_job(job["id"]):
+        st.session_state.uncancellable_job_id = job["id"]
+    if st.session_state.get("uncancellable_job_id") == job["id"]:
+        st.warning("The comparison had already started and can no longer be cancelled.")
+
+    time.sleep(JOB_POLL_SECONDS)
+    st.experimental_rerun()
+
+def run_baseline_mode(settings):
+    """Compare many candidate files against one baseline in a background job"""
+    baseline, candidates, compare_clicked = render_baseline_upload_section()
+
+    if baseline and candidates and compare_clicked:
+        st.session_state.baseline_job_id = submit_job(
+            compare_many, copy_upload(baseline), [copy_upload(file) for file in candidates],
+            settings["dtype_backend"], settings["scope"], track_progress=True
+        )
+
+    # Poll the background job and show the difference matrix when it finishes
+    job_id = st.session_state.get("baseline_job_id")
+    if not job_id:
+        return
+
+    job = get_job(job_id)
+    if job is None:
+        st.warning("The candidate comparison has expired. Please compare the files again.")
+        st.session_state.baseline_job_id = None
+    elif job["status"] in ["queued", "running"]:
+        poll_pending_job(job)
+    elif job["status"] == "cancelled":
+        st.info("The candidate comparison was cancelled.")
+        st.session_state.baseline_job_id = None
+    elif job["status"] == "failed":
+        st.error(f"Error comparing files: {job['error']}")
+    elif job["status"] == "done":
+        render_difference_matrix(job["result"])
 
 def main():
     """Main application function"""
@@ -21,70 +80,109 @@ def main():
     # Render header
     render_header()
 
+    # Render comparison settings
+    mode = render_mode_selector()
+    settings = render_settings_sidebar()
+
+    if mode == COMPARISON_MODES[1]:
+        run_baseline_mode(settings)
+        return
+
+    sampling = render_quick_check_settings()
+
     # Render file upload section
-    file1, file2, compare_clicked = render_file_upload_section()
-
-    # Initialize session state for comparison results
-    if "comparison_done" not in st.session_state:
-        st.session_state.comparison_done = False
-    if "detailed_report" not in st.session_state:
-        st.session_state.detailed_report = []
-    if "summary_report" not in st.session_state:
-        st.session_state.summary_report = []
-    if "error_details" not in st.session_state:
-        st.session_state.error_details = {
-            "missing_sheets": [],
-            "extra_sheets": [],
-            "column_differences": {},
-            "row_differences": {},
-            "value_differences": {}
-        }
-    if "data1" not in st.session_state:
-        st.session_state.data1 = None
-    if "data2" not in st.session_state:
-        st.session_state.data2 = None
-
-    # Compare files if both are uploaded and compare button is clicked
+    file1, file2, compare_clicked, inspect_clicked, quick_check_clicked = render_file_upload_section()
+
+    # The session only keeps a handle to its results, which live in the result store
+    if "result_handle" not in st.session_state:
+        st.session_state.result_handle = None
+
+    # Inspect the schemas from a sample of each file, before committing to a full load
+    if file1 and file2 and inspect_clicked:
+        try:
+            schema1, schema2, _, report = inspect_schemas(file1, file2)
+            st.session_state.schema_inspection = {"schema1": schema1, "schema2": schema2, "report": report}
+        except Exception as e:
+            st.error(f"Error inspecting files: {str(e)}")
+
+    if st.session_state.get("schema_inspection"):
+        render_schema_report(st.session_state.schema_inspection)
+
+    # Estimate the differences from a sample of the keys, to decide what to compare in full
+    if file1 and file2 and quick_check_clicked:
+        try:
+            with st.spinner("Comparing a sample of the keys..."):
+                result = quick_check(
+                    file1, file2, sampling["fraction"], sampling["method"], confidence=sampling["confidence"],
+                    scope=settings["scope"]
+                )
+            st.session_state.quick_check = {"result": result, "report": format_quick_check_report(result)}
+        except Exception as e:
+            st.error(f"Error checking files: {str(e)}")
+
+    if st.session_state.get("quick_check"):
+        render_quick_check_report(st.session_state.quick_check["result"], st.session_state.quick_check["report"])
+
+    # Recover the running job from the URL after a browser refresh
+    if "job_id" not in st.session_state:
+        st.session_state.job_id = st.experimental_get_query_params().get("job", [None])[0]
+
+    # Start a background comparison if both files are uploaded and compare button is clicked
     if file1 and file2 and compare_clicked:
-        with st.spinner("Comparing files..."):
-            try:
-                # Read files
-                data1 = read_file(file1)
-                data2 = read_file(file2)
-
-                # Compare files
-                detailed_report, summary_report, error_details = compare_files(data1, data2)
-
-                # Store results in session state
-                st.session_state.comparison_done = True
-                st.session_state.detailed_report = detailed_report
-                st.session_state.summary_report = summary_report
-                st.session_state.error_details = error_details
-                st.session_state.data1 = data1
-                st.session_state.data2 = data2
-
-                # Force a rerun to display the results
-                st.experimental_rerun()
-            except Exception as e:
-                st.error(f"Error comparing files: {str(e)}")
+        # Give the job its own copies of the uploads, which the session may replace
+        job_id = submit_job(run_comparison_to_store, copy_upload(file1), copy_upload(file2), settings, track_progress=True)
+        st.session_state.job_id = job_id
+        st.session_state.result_handle = None
+        st.experimental_set_query_params(job=job_id)
+
+    # Poll the background job and collect its results when it finishes
+    if st.session_state.job_id:
+        job = get_job(st.session_state.job_id)
+
+        if job is None:
+            # The job expired or the server was restarted
+            st.session_state.job_id = None
+            st.experimental_set_query_params()
+        elif job["status"] in ["queued", "running"]:
+            poll_pending_job(job)
+        elif job["status"] == "cancelled":
+            st.info("The comparison was cancelled.")
+            st.session_state.job_id = None
+            st.experimental_set_query_params()
+        elif job["status"] == "failed":
+            st.error(f"Error comparing files: {job['error']}")
+        elif job["status"] == "done":
+            st.session_state.result_handle = job["result"]
 
     # Display comparison results if available
-    if st.session_state.comparison_done:
-        render_comparison_results(
-            st.session_state.detailed_report,
-            st.session_state.summary_report,
-            st.session_state.error_details,
-            st.session_state.data1
-        )
+    if st.session_state.result_handle:
+        result = load_result(st.session_state.result_handle)
 
-        # Render download section
-        render_download_section(
-            st.session_state.data1,
-            st.session_state.data2,
-            st.session_state.error_details,
-            st.session_state.detailed_report,
-            st.session_state.summary_report
-        )
+        if result is None:
+            st.warning("The comparison results have expired. Please compare the files again.")
+            st.session_state.result_handle = None
+        else:
+            render_comparison_results(
+                result["detailed_report"],
+                result["summary_report"],
+                result["error_details"],
+                result["data1"],
+                result["error_details"].get("performance"),
+                diff_store_path(st.session_state.result_handle)
+            )
+
+            # Render download section
+            render_download_section(
+                result["data1"],
+                result["data2"],
+                result["error_details"],
+                result["detailed_report"],
+                result["summary_report"]
+            )
+
+            # Render the profile download if the run was profiled
+            if result["profile_artifact"]:
+                render_profile_download(result["profile_artifact"])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""
+Benchmark suite for ingestion, comparison and highlighting throughput.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --rows 1000 10000 --diff-rates 0 0.01 0.1 \
+        --output benchmark_results.json --baseline baseline.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+
+from src.sample_generator import generate_benchmark_data, write_benchmark_file
+from src.file_handler import read_file
+from src.comparison import compare_files, compare_sheets, compare_rows, compare_values
+from src.highlighting import (
+    highlight_differences_excel, highlight_differences_csv, highlight_both_files, highlight_side_by_side
+)
+
+DEFAULT_ROWS = [1000, 5000]
+DEFAULT_DIFF_RATES = [0.0, 0.01, 0.1]
+DEFAULT_TOLERANCE = 0.25
+
+def named_buffer(content, name):
+    """Wrap bytes in a buffer that looks like an uploaded file"""
+    buffer = BytesIO(content)
+    buffer.name = name
+    return buffer
+
+def measure(func, repeat=1, track_memory=True):
+    """
+    Run a function and return its best wall time and peak traced memory.
+
+    Memory is traced in a separate run so tracemalloc overhead does not
+    distort the timings.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    peak_memory_mb = None
+    if track_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    return min(timings), peak_memory_mb
+
+def build_case(rows, columns, diff_rate, seed):
+    """Generate the inputs shared by all benchmarks of one grid point"""
+    sheets1, sheets2 = generate_benchmark_data(
+        rows=rows, columns=columns, sheets=1, seed=seed,
+        cell_diff_rate=diff_rate, row_diff_rate=diff_rate
+    )
+
+    files = {}
+    for file_format in ["xlsx", "csv"]:
+        for index, sheets in [(1, sheets1), (2, sheets2)]:
+            output = BytesIO()
+            write_benchmark_file(sheets, output, file_format)
+            files[(file_format, index)] = output.getvalue()
+
+    excel1 = read_file(named_buffer(files[("xlsx", 1)], "file1.xlsx"))
+    excel2 = read_file(named_buffer(files[("xlsx", 2)], "file2.xlsx"))
+    csv1 = read_file(named_buffer(files[("csv", 1)], "file1.csv"))
+    csv2 = read_file(named_buffer(files[("csv", 2)], "file2.csv"))
+
+    return {"files": files, "excel": (excel1, excel2), "csv": (csv1, csv2)}
+
+def benchmark_functions(case):
+    """Return the benchmarked callables for one grid point"""
+    files = case["files"]
+    excel1, excel2 = case["excel"]
+    csv1, csv2 = case["csv"]
+    df1 = csv1["data"]
+    df2 = csv2["data"]
+    common_columns = [col for col in df1.columns if col in df2.columns]
+    row_differences = compare_rows(df1, df2, common_columns)
+    excel_error_details = compare_files(excel1, excel2)[2]
+    csv_error_details = compare_files(csv1, csv2)[2]
+
+    return {
+        "read_file_xlsx": lambda: read_file(named_buffer(files[("xlsx", 1)], "file1.xlsx")),
+        "read_file_csv": lambda: read_file(named_buffer(files[("csv", 1)], "file1.csv")),
+        "compare_files": lambda: compare_files(excel1, excel2),
+        "compare_sheets": lambda: compare_sheets("data", df1, df2),
+        "compare_rows": lambda: compare_rows(df1, df2, common_columns),
+        "compare_values": lambda: compare_values(df1, df2, common_columns, row_differences),
+        "highlight_differences_excel": lambda: highlight_differences_excel(excel1, excel2, excel_error_details),
+        "highlight_differences_csv": lambda: highlight_differences_csv(csv1, csv2, csv_error_details),
+        "highlight_both_files": lambda: highlight_both_files(csv1, csv2, csv_error_details),
+        "highlight_side_by_side": lambda: highlight_side_by_side(csv1, csv2, csv_error_details),
+    }
+
+def run_benchmarks(rows_grid, diff_rates, columns=10, repeat=1, seed=0, only=None,
+                   track_memory=True):
+    """
+    Run every benchmark across the grid of sizes and diff densities
+    """
+    results = []
+
+    for rows in rows_grid:
+        for diff_rate in diff_rates:
+            case = build_case(rows, columns, diff_rate, seed)
+
+            for name, func in benchmark_functions(case).items():
+                if only and name not in only:
+                    continue
+
+                seconds, peak_memory_mb = measure(func, repeat, track_memory)
+                results.append({
+                    "benchmark": name,
+                    "rows": rows,
+                    "columns": columns,
+                    "diff_rate": diff_rate,
+                    "seconds": seconds,
+                    "rows_per_second": rows / seconds if seconds > 0 else None,
+                    "peak_memory_mb": peak_memory_mb
+                })
+                print(f"{name:30} rows={rows:<10} diff_rate={diff_rate:<6} "
+                      f"{seconds:10.4f}s  {peak_memory_mb or 0:10.1f} MB")
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results
+    }
+
+def find_regressions(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare a run against a baseline run and list the regressed measurements.
+
+    A measurement regresses when its time or peak memory exceeds the baseline
+    value by more than the tolerance fraction.
+    """
+    def result_key(result):
+        return (result["benchmark"], result["rows"], result["columns"], result["diff_rate"])
+
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+
+    for result in current["results"]:
+        previous = baseline_results.get(result_key(result))
+        if previous is None:
+            continue
+
+        for metric in ["seconds", "peak_memory_mb"]:
+            old_value = previous.get(metric)
+            new_value = result.get(metric)
+            if old_value and new_value and new_value > old_value * (1 + tolerance):
+                regressions.append({
+                    "benchmark": result["benchmark"],
+                    "rows": result["rows"],
+                    "diff_rate": result["diff_rate"],
+                    "metric": metric,
+                    "baseline": old_value,
+                    "current": new_value,
+                    "change": new_value / old_value - 1
+                })
+
+    return regressions
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the data integrity checker")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="Row counts to benchmark")
+    parser.add_argument("--diff-rates", type=float, nargs="+", default=DEFAULT_DIFF_RATES,
+                        help="Fractions of changed cells and rows to benchmark")
+    parser.add_argument("--columns", type=int, default=10, help="Number of columns per sheet")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per measurement (best is kept)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated data")
+    parser.add_argument("--only", nargs="+", help="Only run the named benchmarks")
+    parser.add_argument("--no-memory", action="store_true", help="Skip peak memory measurement")
+    parser.add_argument("--output", default="benchmark_results.json", help="Path of the JSON results file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown or memory growth before flagging a regression")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(
+        args.rows, args.diff_rates, columns=args.columns, repeat=args.repeat,
+        seed=args.seed, only=args.only, track_memory=not args.no_memory
+    )
+
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(current, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['benchmark']} rows={regression['rows']} "
+                  f"diff_rate={regression['diff_rate']} {regression['metric']}: "
+                  f"{regression['baseline']:.4f} -> {regression['current']:.4f} "
+                  f"(+{regression['change']:.0%})")
+
+        if regressions:
+            return 1
+        print("No regressions against the baseline")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Startup benchmarks: cold import time of the comparison core and start time of
+the process workers, checked against fixed targets.
+
+Run from the repository root:
+
+    python -m benchmarks.run_startup_benchmarks --output startup_results.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from src.parallel_csv import worker_context, sniff_encoding
+
+# Modules imported by the command line, the HTTP service, the benchmarks and
+# worker processes, none of which may load the UI or the Excel writer
+CORE_MODULES = ["src.pipeline", "src.sample_generator", "cli", "server"]
+
+# Modules the core must not import when it is loaded
+FORBIDDEN_MODULES = ["streamlit", "openpyxl"]
+
+# Seconds a fresh interpreter may take to import each core module
+IMPORT_TARGET_SECONDS = 1.0
+
+# Seconds a pool may take to start its workers and run a first task, once the
+# first pool of the process has started
+WORKER_START_TARGET_SECONDS = 0.25
+
+# Reports the import time of a module in a fresh interpreter, and the forbidden
+# modules it loaded
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {forbidden!r} if name in sys.modules]}}))
+"""
+
+def measure_import(module, repeat=3):
+    """Return the best import time of a module in fresh interpreters and the forbidden modules it loaded"""
+    timings = []
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module, forbidden=FORBIDDEN_MODULES)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        timings.append(probe["seconds"])
+        loaded = probe["loaded"]
+    return min(timings), loaded
+
+def measure_worker_start(context, workers=2):
+    """Return the seconds taken to start a pool of workers and get a result from each"""
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        list(executor.map(sniff_encoding, [b"a,b\n"] * workers))
+    return time.perf_counter() - start
+
+def run_startup_benchmarks(repeat=3, workers=2):
+    """
+    Measure the cold import of every core module and the start of worker pools
+    with the worker context (see worker_context) and, for reference, with spawned
+    workers
+    """
+    results = []
+
+    for module in CORE_MODULES:
+        seconds, loaded = measure_import(module, repeat)
+        results.append({
+            "benchmark": f"import {module}",
+            "seconds": seconds,
+            "target": IMPORT_TARGET_SECONDS,
+            "forbidden_modules": loaded
+        })
+        print(f"{'import ' + module:30} {seconds:10.4f}s  target {IMPORT_TARGET_SECONDS}s"
+              + (f"  loaded {', '.join(loaded)}" if loaded else ""))
+
+    for name, context in [("workers", worker_context()), ("spawned workers", multiprocessing.get_context("spawn"))]:
+        # The first pool of the worker context also starts the process workers are forked from
+        first = measure_worker_start(context, workers)
+        seconds = min(measure_worker_start(context, workers) for _ in range(repeat))
+        results.append({
+            "benchmark": f"start {name}",
+            "workers": workers,
+            "first_seconds": first,
+            "seconds": seconds,
+            "target": WORKER_START_TARGET_SECONDS if name == "workers" else None
+        })
+        print(f"{'start ' + name:30} {seconds:10.4f}s  (first pool {first:.4f}s)")
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "start_method": worker_context().get_start_method(),
+        "results": results
+    }
+
+def find_missed_targets(current):
+    """List the measurements over their target or loading forbidden modules"""
+    return [
+        result for result in current["results"]
+        if (result["target"] is not None and result["seconds"] > result["target"])
+        or result.get("forbidden_modules")
+    ]
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the startup of the data integrity checker")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement (best is kept)")
+    parser.add_argument("--workers", type=int, default=2, help="Workers started per pool")
+    parser.add_argument("--output", default="startup_results.json", help="Path of the JSON results file")
+    args = parser.parse_args(argv)
+
+    current = run_startup_benchmarks(args.repeat, args.workers)
+
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    missed = find_missed_targets(current)
+    for result in missed:
+        problem = f"loads {', '.join(result['forbidden_modules'])}" if result.get("forbidden_modules") else (
+            f"{result['seconds']:.4f}s over the {result['target']}s target"
+        )
+        print(f"MISSED {result['benchmark']}: {problem}")
+
+    if missed:
+        return 1
+    print("All startup targets met")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import argparse
+import sys
+
+from src.file_handler import DTYPE_BACKENDS
+from src.sql_backend import SQL_ENGINES
+from src.streaming import KEY_ORDERS
+from src.instrumentation import metrics_to_json
+from src.pipeline import run_comparison
+from src.schema import SAMPLE_ROWS, inspect_schemas
+from src.sampling import SAMPLE_METHODS, SAMPLE_FRACTION, CONFIDENCE, quick_check, format_quick_check_report
+from src.exporters import EXPORT_FORMATS, export_format, export_differences
+from src.profiling import PROFILE_MODES, get_profile_mode, write_profile_artifact
+
+def _split_columns(value):
+    """Split a comma-separated column list"""
+    if not value:
+        return None
+    return [col.strip() for col in value.split(",") if col.strip()]
+
+def build_parser():
+    """Build the command line argument parser"""
+    parser = argparse.ArgumentParser(description="Compare two Excel, CSV, Parquet, Feather or Arrow IPC files (or dataset directories, gzip or Zstandard compressed CSV files and zip archives)")
+    parser.add_argument("file1", help="Base file")
+    parser.add_argument("file2", help="Comparison file")
+    parser.add_argument("--detailed", action="store_true", help="Print the detailed report instead of the summary")
+    parser.add_argument("--backend", choices=["pandas", "sql", "sorted"], default="pandas",
+                        help="Compare in memory with pandas, in an on-disk embedded database for files larger than memory, "
+                             "or by streaming inputs already sorted by their key column")
+    parser.add_argument("--sql-engine", choices=SQL_ENGINES,
+                        help="Embedded engine for the SQL backend (defaults to DuckDB if installed, otherwise SQLite)")
+    parser.add_argument("--database", help="Database file for the SQL backend (defaults to a temporary file)")
+    parser.add_argument("--key-order", choices=KEY_ORDERS, default="auto",
+                        help="Order of the keys of the sorted backend's inputs (auto detects numeric keys)")
+    parser.add_argument("--dtype-backend", choices=DTYPE_BACKENDS, default="numpy",
+                        help="In-memory representation of the loaded data")
+    parser.add_argument("--sheet-workers", type=int,
+                        help="Processes used to parse the sheets of each large workbook or the rows of each large CSV file (defaults to half the CPU count)")
+    parser.add_argument("--max-diffs-per-sheet", type=int, help="Maximum number of differences stored per sheet")
+    parser.add_argument("--max-diffs-per-column", type=int, help="Maximum number of differences stored per column")
+    parser.add_argument("--fail-fast-threshold", type=float,
+                        help="Stop storing value differences for sheets whose mismatch rate is above this fraction")
+    parser.add_argument("--schema-only", action="store_true",
+                        help="Only compare the schemas (columns, types, null rates, row counts) from a sample of each file")
+    parser.add_argument("--sample-rows", type=int, default=SAMPLE_ROWS, help="Rows sampled per sheet by --schema-only")
+    parser.add_argument("--quick-check", action="store_true",
+                        help="Only compare a sample of the keys and estimate the mismatch rate of each column")
+    parser.add_argument("--sample-fraction", type=float, default=SAMPLE_FRACTION,
+                        help="Fraction of the keys compared by --quick-check")
+    parser.add_argument("--sample-method", choices=SAMPLE_METHODS, default="key_hash",
+                        help="Sample keys by their hash, picking the same keys in both files, or draw rows of file 1 at random")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the --quick-check sample")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE,
+                        help="Confidence level of the --quick-check intervals")
+    parser.add_argument("--include-columns", help="Comma-separated columns to compare (the first column is always kept)")
+    parser.add_argument("--exclude-columns", help="Comma-separated columns to leave out of the comparison")
+    parser.add_argument("--row-filter",
+                        help="Filter selecting the rows to compare: comparisons of columns with values joined by "
+                             "and/or/not, e.g. \"Date >= '2024-05-01' and Region in ['EU', 'US']\"")
+    parser.add_argument("--sheet-row-filter", nargs=2, action="append", metavar=("SHEET", "EXPRESSION"),
+                        help="Row filter for one sheet, overriding --row-filter (can be repeated)")
+    parser.add_argument("--diff-output",
+                        help="Write every stored difference (sheet, key or row, column, old and new value, type) to this file")
+    parser.add_argument("--diff-format", choices=EXPORT_FORMATS,
+                        help="Format of --diff-output (defaults to the file extension, or jsonl)")
+    parser.add_argument("--metrics-output", help="Write per-stage performance metrics to this JSON file")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help="Profile the run (defaults to the DATA_INTEGRITY_PROFILE environment variable)")
+    parser.add_argument("--profile-output", help="Path of the profile artifact (defaults to a name based on the mode)")
+    return parser
+
+def main(argv=None):
+    """
+    Command line entry point. Exits with 1 when differences are found.
+    """
+    args = build_parser().parse_args(argv)
+
+    # Only inspect the schemas, without loading the files
+    if args.schema_only:
+        _, _, _, report = inspect_schemas(args.file1, args.file2, args.sample_rows)
+        if not report:
+            print("No schema drift found in the sampled rows.")
+        for line in report:
+            print(line)
+        return 1 if report else 0
+
+    scope = {
+        "include_columns": _split_columns(args.include_columns),
+        "exclude_columns": _split_columns(args.exclude_columns),
+        "row_filter": args.row_filter,
+        "sheet_row_filters": dict(args.sheet_row_filter or [])
+    }
+
+    # Only estimate the differences from a sample of the keys
+    if args.quick_check:
+        result = quick_check(
+            args.file1, args.file2, args.sample_fraction, args.sample_method, args.seed, args.confidence, scope
+        )
+        for line in format_quick_check_report(result):
+            print(line)
+        differs = result["type_change"] or result["missing_sheets"] or result["extra_sheets"] or any(
+            sheet["needs_full_comparison"] for sheet in result["sheets"].values()
+        )
+        return 1 if differs else 0
+
+    settings = {
+        "record_performance": bool(args.metrics_output),
+        "profile_mode": get_profile_mode(args.profile),
+        "backend": args.backend,
+        "sql_engine": args.sql_engine,
+        "database": args.database,
+        "key_order": args.key_order,
+        "dtype_backend": args.dtype_backend,
+        "sheet_workers": args.sheet_workers,
+        "limits": {
+            "max_diffs_per_sheet": args.max_diffs_per_sheet,
+            "max_diffs_per_column": args.max_diffs_per_column,
+            "fail_fast_threshold": args.fail_fast_threshold
+        },
+        "scope": scope
+    }
+    result = run_comparison(args.file1, args.file2, settings)
+    detailed_report, summary_report = result["detailed_report"], result["summary_report"]
+
+    # Print the report
+    report = detailed_report if args.detailed else summary_report
+    if not report:
+        print("No differences found! The files are identical.")
+    for line in report:
+        print(line)
+
+    if args.diff_output:
+        file_format = args.diff_format or export_format(args.diff_output) or "jsonl"
+        count = export_differences(
+            result["error_details"], args.diff_output, file_format, result["error_details"].get("performance")
+        )
+        print(f"{count} differences written to {args.diff_output}", file=sys.stderr)
+
+    if args.metrics_output:
+        with open(args.metrics_output, "w") as f:
+            f.write(metrics_to_json(result["error_details"]["performance"]))
+        print(f"Performance metrics written to {args.metrics_output}", file=sys.stderr)
+
+    if result["profile_artifact"] is not None:
+        path = write_profile_artifact(result["profile_artifact"], args.profile_output)
+        print(f"Profile written to {path}", file=sys.stderr)
+
+    return 1 if summary_report else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
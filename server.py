@@ -0,0 +1,423 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+
+from src.comparison import DEFAULT_LIMITS
+from src.file_handler import DTYPE_BACKENDS
+from src.filters import check_row_filters
+from src.service import submit_comparison
+from src.result_store import load_result
+from src.jobs import get_job, cancel_job
+from src.exporters import EXPORT_FORMATS, export_differences
+
+# Largest request body accepted, matching the upload limit of the Streamlit app
+MAX_REQUEST_BYTES = int(os.environ.get("DATA_INTEGRITY_MAX_REQUEST_MB", "2048")) * 1024 * 1024
+
+# Seconds between progress events streamed while a job runs
+EVENT_POLL_SECONDS = 0.5
+
+# Content type of each export format streamed back
+EXPORT_CONTENT_TYPES = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+# Settings a request can choose; the others (the database file, profiling,
+# the SQL engine, ...) stay with the server's defaults
+REQUEST_SETTINGS = ["backend", "limits", "dtype_backend", "scope"]
+
+# Comparison backends a request can choose
+BACKENDS = ["pandas", "sql", "sorted"]
+
+# Keys of a request's scope (see scope_columns and row_filter)
+SCOPE_KEYS = ["include_columns", "exclude_columns", "row_filter", "sheet_row_filters"]
+
+# Routes as (method, path pattern, handler method name)
+ROUTES = [
+    ("GET", r"/health", "health"),
+    ("POST", r"/compare", "compare"),
+    ("GET", r"/jobs/(\w+)", "job_status"),
+    ("DELETE", r"/jobs/(\w+)", "job_cancel"),
+    ("GET", r"/jobs/(\w+)/events", "job_events"),
+    ("GET", r"/results/(\w+)", "result_report"),
+    ("GET", r"/results/(\w+)/differences", "result_differences")
+]
+
+def _named_buffer(content, name):
+    """Wrap uploaded bytes in a buffer that keeps the file name, like a Streamlit upload"""
+    buffer = BytesIO(content)
+    buffer.name = name
+    return buffer
+
+def _parse_limits(limits):
+    """
+    Check the limits of a request (see resolve_limits): the difference caps
+    are non-negative integers and fail_fast_threshold a fraction from 0 to 1,
+    any of them null to disable it
+    """
+    if limits is None:
+        return None
+    if not isinstance(limits, dict):
+        raise ValueError("limits must be a JSON object")
+    for name, value in limits.items():
+        if name not in DEFAULT_LIMITS:
+            raise ValueError(f"Unknown limit '{name}', expected one of {', '.join(DEFAULT_LIMITS)}")
+        if value is None:
+            continue
+        if name == "fail_fast_threshold":
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 1:
+                raise ValueError("Limit 'fail_fast_threshold' must be a number from 0 to 1 or null")
+        elif isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise ValueError(f"Limit '{name}' must be a non-negative integer or null")
+    return limits
+
+def _parse_scope(scope):
+    """Check the scope of a request: column lists and row filters within the filter grammar"""
+    if scope is None:
+        return None
+    if not isinstance(scope, dict):
+        raise ValueError("scope must be a JSON object")
+    unknown = [key for key in scope if key not in SCOPE_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown scope settings: {', '.join(unknown)}")
+
+    for key in ["include_columns", "exclude_columns"]:
+        columns = scope.get(key)
+        if columns is not None and (not isinstance(columns, list) or not all(isinstance(col, str) for col in columns)):
+            raise ValueError(f"scope {key} must be a list of column names")
+
+    sheet_row_filters = scope.get("sheet_row_filters")
+    if sheet_row_filters is not None and not isinstance(sheet_row_filters, dict):
+        raise ValueError("scope sheet_row_filters must map sheet names to row filters")
+
+    check_row_filters(scope)
+    return scope
+
+def _parse_settings(settings):
+    """
+    Check the settings of a request, which can only choose REQUEST_SETTINGS:
+    the backend, the limits, the dtype backend and the scope.
+    """
+    if settings is None:
+        return {}
+    if not isinstance(settings, dict):
+        raise ValueError("settings must be a JSON object")
+    unknown = [key for key in settings if key not in REQUEST_SETTINGS]
+    if unknown:
+        raise ValueError(f"Settings that cannot be set by a request: {', '.join(unknown)}")
+
+    backend = settings.get("backend")
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    dtype_backend = settings.get("dtype_backend")
+    if dtype_backend is not None and dtype_backend not in DTYPE_BACKENDS:
+        raise ValueError(f"Unknown dtype backend '{dtype_backend}', expected one of {', '.join(DTYPE_BACKENDS)}")
+    _parse_limits(settings.get("limits"))
+    _parse_scope(settings.get("scope"))
+    return settings
+
+def _resolve_local_path(path, data_root):
+    """
+    Return the real path of a local input named by a request, which must be
+    under the data root (relative paths are taken from it). Raises ValueError
+    for paths outside it, including through symbolic links.
+    """
+    if data_root is None:
+        raise ValueError("This server does not read local files; upload them, or start it with --data-root")
+    if not isinstance(path, str) or not path:
+        raise ValueError("file1 and file2 must be paths under the data root")
+
+    resolved = os.path.realpath(os.path.join(data_root, path))
+    if os.path.commonpath([data_root, resolved]) != data_root:
+        raise ValueError(f"Local file outside the data root: {path}")
+    if not os.path.exists(resolved):
+        raise ValueError(f"Local file not found: {path}")
+    return resolved
+
+def parse_compare_request(content_type, body, data_root=None):
+    """
+    Read the inputs and settings of a comparison request.
+
+    A JSON body names local files under data_root: {"file1": path, "file2":
+    path, "settings": {...}}; without a data root only uploads are accepted.
+    A multipart/form-data body uploads them in the file1 and file2 fields,
+    with the settings as JSON in an optional settings field. Returns the two
+    inputs and the settings; raises ValueError for malformed requests.
+    """
+    if content_type.startswith("application/json"):
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(request, dict):
+            raise ValueError("The request must be a JSON object")
+
+        settings = _parse_settings(request.get("settings"))
+        files = [_resolve_local_path(request.get(field), data_root) for field in ["file1", "file2"]]
+        return files[0], files[1], settings
+
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = (part.get_filename(), part.get_payload(decode=True))
+
+        for field in ["file1", "file2"]:
+            if field not in fields or not fields[field][0]:
+                raise ValueError(f"Missing uploaded file '{field}'")
+
+        settings = None
+        if "settings" in fields:
+            try:
+                settings = json.loads(fields["settings"][1])
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid settings JSON: {e}")
+
+        return (
+            _named_buffer(fields["file1"][1], fields["file1"][0]),
+            _named_buffer(fields["file2"][1], fields["file2"][0]),
+            _parse_settings(settings)
+        )
+
+    raise ValueError("Send application/json with local paths or multipart/form-data with uploaded files")
+
+def job_summary(job):
+    """Return the JSON-ready status of a job"""
+    return {
+        "job": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "result": job["result"] if job["status"] == "done" else None,
+        "error": job["error"]
+    }
+
+def format_result(result):
+    """Return the JSON-ready reports and difference counts of a stored result"""
+    error_details = result["error_details"]
+    return {
+        "identical": not result["summary_report"],
+        "summary_report": result["summary_report"],
+        "detailed_report": result["detailed_report"],
+        "missing_sheets": error_details["missing_sheets"],
+        "extra_sheets": error_details["extra_sheets"],
+        "column_differences": error_details["column_differences"],
+        "row_counts": {
+            sheet: {
+                "count_diff": diff["count_diff"],
+                "missing": diff["missing_count"],
+                "extra": diff["extra_count"]
+            }
+            for sheet, diff in error_details["row_differences"].items()
+        },
+        "value_difference_counts": error_details["value_difference_counts"],
+        "performance": error_details.get("performance")
+    }
+
+class ComparisonHandler(BaseHTTPRequestHandler):
+    """
+    Serve comparisons over HTTP: POST /compare starts one (or returns the
+    cached result of identical inputs), /jobs/<id> reports and streams its
+    progress, /results/<handle> returns its reports and
+    /results/<handle>/differences streams every difference.
+    """
+    server_version = "DataIntegrityChecker"
+
+    def _send_json(self, status, payload):
+        """Send a JSON response"""
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        """Send an error as {"error": message}"""
+        self._send_json(status, {"error": message})
+
+    def _route(self, method):
+        """Call the handler of the first route matching the request, answering ValueErrors with 400"""
+        path = urlparse(self.path).path.rstrip("/") or "/"
+        for route_method, pattern, name in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                try:
+                    getattr(self, name)(*match.groups())
+                except ValueError as e:
+                    self._send_error(400, str(e))
+                return
+        self._send_error(404, f"No route for {method} {path}")
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    def _query(self):
+        """Return the query parameters of the request, keeping the first value of each"""
+        return {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+    def health(self):
+        """Report that the server is up"""
+        self._send_json(200, {"status": "ok"})
+
+    def compare(self):
+        """Start a comparison of the posted inputs, or return the cached one"""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            self._send_error(413, f"Request larger than {MAX_REQUEST_BYTES} bytes")
+            return
+
+        file1, file2, settings = parse_compare_request(
+            self.headers.get("Content-Type", ""), self.rfile.read(length), self.server.data_root
+        )
+
+        try:
+            comparison = submit_comparison(file1, file2, settings)
+        except RuntimeError as e:
+            self._send_error(503, str(e))
+            return
+
+        # Identical inputs that were already compared are answered at once
+        status = 200 if comparison["result"] else 202
+        self._send_json(status, {
+            "job": comparison["job"],
+            "status": "done" if comparison["result"] else "queued",
+            "result": comparison["result"],
+            "cached": comparison["cached"]
+        })
+
+    def job_status(self, job_id):
+        """Return the status, progress and result handle of a job"""
+        job = get_job(job_id)
+        if job is None:
+            self._send_error(404, f"Unknown or expired job '{job_id}'")
+            return
+        self._send_json(200, job_summary(job))
+
+    def job_cancel(self, job_id):
+        """Cancel a job that has not started yet"""
+        if not cancel_job(job_id):
+            self._send_error(409, f"Job '{job_id}' is not queued")
+            return
+        self._send_json(200, job_summary(get_job(job_id)))
+
+    def job_events(self, job_id):
+        """Stream the status of a job as JSON lines, one per change, until it finishes"""
+        job = get_job(job_id)
+        if job is None:
+            self._send_error(404, f"Unknown or expired job '{job_id}'")
+            return
+
+        # Without a length the response ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        previous = None
+        while job is not None:
+            summary = job_summary(job)
+            if summary != previous:
+                self.wfile.write((json.dumps(summary, default=str) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                previous = summary
+            if job["status"] not in ["queued", "running"]:
+                break
+            time.sleep(EVENT_POLL_SECONDS)
+            job = get_job(job_id)
+
+    def _load(self, handle):
+        """Load a stored result, answering 404 when it is unknown or expired"""
+        result = load_result(handle)
+        if result is None:
+            self._send_error(404, f"Unknown or expired result '{handle}'")
+        return result
+
+    def result_report(self, handle):
+        """Return the reports and difference counts of a result"""
+        result = self._load(handle)
+        if result is not None:
+            self._send_json(200, format_result(result))
+
+    def result_differences(self, handle):
+        """Stream every stored difference of a result in the format given by ?format="""
+        file_format = self._query().get("format", "jsonl")
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{file_format}', expected one of {', '.join(EXPORT_FORMATS)}")
+
+        result = self._load(handle)
+        if result is None:
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", EXPORT_CONTENT_TYPES[file_format])
+        self.send_header("Content-Disposition", f"attachment; filename=differences.{file_format}")
+
+        # Parquet files are written with seeks, so they are built before sending
+        if file_format == "parquet":
+            output = BytesIO()
+            export_differences(result["error_details"], output, file_format)
+            self.send_header("Content-Length", str(len(output.getvalue())))
+            self.end_headers()
+            self.wfile.write(output.getvalue())
+        else:
+            self.end_headers()
+            export_differences(result["error_details"], self.wfile, file_format)
+
+def create_server(host="127.0.0.1", port=8765, data_root=None):
+    """
+    Create the comparison HTTP server; comparisons run in the shared job pool
+    (see submit_job). Requests can name local files only under data_root;
+    without one, inputs must be uploaded.
+    """
+    if data_root is not None and not os.path.isdir(data_root):
+        raise ValueError(f"Data root is not a directory: {data_root}")
+
+    server = ThreadingHTTPServer((host, port), ComparisonHandler)
+    server.daemon_threads = True
+    server.data_root = os.path.realpath(data_root) if data_root is not None else None
+    return server
+
+def build_parser():
+    """Build the command line argument parser"""
+    parser = argparse.ArgumentParser(description="Serve file comparisons over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (defaults to localhost only)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--data-root",
+                        help="Directory whose files requests can name by path (without it, inputs must be uploaded)")
+    return parser
+
+def main(argv=None):
+    """
+    Command line entry point. Serves until interrupted.
+    """
+    args = build_parser().parse_args(argv)
+    server = create_server(args.host, args.port, args.data_root)
+    print(f"Serving comparisons on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
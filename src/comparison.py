@@ -2,104 +2,240 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict
 
-def compare_files(data1, data2):
+from src.instrumentation import track_stage, progress_tracker
+
+# Number of bins in the histogram of numeric drift per column
+DRIFT_HISTOGRAM_BINS = 10
+
+# Limits on the number of stored differences (None means unlimited)
+DEFAULT_LIMITS = {
+    "max_diffs_per_sheet": None,
+    "max_diffs_per_column": None,
+    "fail_fast_threshold": None
+}
+
+def compare_files(data1, data2, metrics=None, limits=None, progress=None):
     """
     Compare two files and return detailed report, summary report, and error details
+
+    If a metrics dictionary is given, per-stage timings are recorded in it and it is
+    returned with the error details under "performance". limits caps the number of
+    stored differences (see resolve_limits). progress is an optional callback that
+    receives the sheets and rows compared so far (see progress_tracker).
+    """
+    with track_stage(metrics, "compare_files") as record:
+        detailed_report, summary_report, error_details = _compare_files(data1, data2, metrics, limits, progress)
+        record["differences"] = len(summary_report)
+
+    if metrics is not None:
+        error_details["performance"] = metrics
+
+    return detailed_report, summary_report, error_details
+
+def _compare_files(data1, data2, metrics, limits, progress=None):
+    """
+    Compare the sheets of two files
     """
     detailed_report = []
     summary_report = []
 
     # Initialize error details structure
-    error_details = {
-        "missing_sheets": [],
-        "extra_sheets": [],
-        "column_differences": {},
-        "row_differences": {},
-        "value_differences": {}
-    }
+    error_details = empty_error_details()
 
     # Compare file types
     if data1["type"] != data2["type"]:
         detailed_report.append(f"File types are different: {data1['type']} vs {data2['type']}")
         summary_report.append(f"File types are different: {data1['type']} vs {data2['type']}")
 
-    # Compare sheet names (for Excel files)
-    if data1["type"] == "excel" and data2["type"] == "excel":
-        # Check for missing and extra sheets
-        missing_sheets = set(data1["sheet_names"]) - set(data2["sheet_names"])
-        extra_sheets = set(data2["sheet_names"]) - set(data1["sheet_names"])
-
-        if missing_sheets:
-            error_details["missing_sheets"] = list(missing_sheets)
-            for sheet in missing_sheets:
-                detailed_report.append(f"Sheet '{sheet}' is in file 1 but missing in file 2")
-                summary_report.append(f"Sheet '{sheet}' is missing in file 2")
+    # Compare sheet names (for Excel files and columnar datasets)
+    if isinstance(data1["data"], dict) and isinstance(data2["data"], dict):
+        common_sheets = compare_sheet_names(
+            data1["sheet_names"], data2["sheet_names"], detailed_report, summary_report, error_details
+        )
 
-        if extra_sheets:
-            error_details["extra_sheets"] = list(extra_sheets)
-            for sheet in extra_sheets:
-                detailed_report.append(f"Sheet '{sheet}' is in file 2 but missing in file 1")
-                summary_report.append(f"Extra sheet '{sheet}' in file 2")
+        # Track progress by the rows of the common sheets
+        advance = progress_tracker(
+            progress, "comparing", sheets_total=len(common_sheets),
+            rows_total=sum(_sheet_rows(data1["data"][sheet], data2["data"][sheet]) for sheet in common_sheets)
+        )
 
         # Compare common sheets
-        common_sheets = set(data1["sheet_names"]) & set(data2["sheet_names"])
-
         for sheet in common_sheets:
             sheet_detailed_report, sheet_summary_report, sheet_error_details = compare_sheets(
-                sheet, data1["data"][sheet], data2["data"][sheet]
+                sheet, data1["data"][sheet], data2["data"][sheet], metrics, limits,
+                (_full_columns(data1, sheet), _full_columns(data2, sheet)),
+                _forward_stages(advance, progress)
             )
+            advance(sheets=1, rows=_sheet_rows(data1["data"][sheet], data2["data"][sheet]), sheet=sheet)
 
             detailed_report.extend(sheet_detailed_report)
             summary_report.extend(sheet_summary_report)
 
             # Update error details
-            if sheet_error_details["column_differences"]:
-                error_details["column_differences"][sheet] = sheet_error_details["column_differences"]
-
-            if sheet_error_details["row_differences"]:
-                error_details["row_differences"][sheet] = sheet_error_details["row_differences"]
+            merge_sheet_error_details(error_details, sheet, sheet_error_details)
 
-            if sheet_error_details["value_differences"]:
-                error_details["value_differences"][sheet] = sheet_error_details["value_differences"]
-
-    # Compare CSV files
-    elif data1["type"] == "csv" and data2["type"] == "csv":
+    # Compare single-table files (CSV and columnar files)
+    elif not isinstance(data1["data"], dict) and not isinstance(data2["data"], dict):
         sheet_detailed_report, sheet_summary_report, sheet_error_details = compare_sheets(
-            "data", data1["data"], data2["data"]
+            "data", data1["data"], data2["data"], metrics, limits,
+            (_full_columns(data1), _full_columns(data2)), progress
         )
 
         detailed_report.extend(sheet_detailed_report)
         summary_report.extend(sheet_summary_report)
 
         # Update error details
-        if sheet_error_details["column_differences"]:
-            error_details["column_differences"]["data"] = sheet_error_details["column_differences"]
+        merge_sheet_error_details(error_details, "data", sheet_error_details)
+
+    return detailed_report, summary_report, error_details
+
+def empty_error_details():
+    """
+    Return the error details structure of a comparison without differences
+    """
+    return {
+        "missing_sheets": [],
+        "extra_sheets": [],
+        "column_differences": {},
+        "row_differences": {},
+        "value_differences": {},
+        "value_difference_counts": {},
+        "column_stats": {}
+    }
 
-        if sheet_error_details["row_differences"]:
-            error_details["row_differences"]["data"] = sheet_error_details["row_differences"]
+def compare_sheet_names(sheet_names1, sheet_names2, detailed_report, summary_report, error_details):
+    """
+    Report missing and extra sheets and return the sheets both files have
+    """
+    # Check for missing and extra sheets
+    missing_sheets = set(sheet_names1) - set(sheet_names2)
+    extra_sheets = set(sheet_names2) - set(sheet_names1)
 
-        if sheet_error_details["value_differences"]:
-            error_details["value_differences"]["data"] = sheet_error_details["value_differences"]
+    if missing_sheets:
+        error_details["missing_sheets"] = list(missing_sheets)
+        for sheet in missing_sheets:
+            detailed_report.append(f"Sheet '{sheet}' is in file 1 but missing in file 2")
+            summary_report.append(f"Sheet '{sheet}' is missing in file 2")
 
-    return detailed_report, summary_report, error_details
+    if extra_sheets:
+        error_details["extra_sheets"] = list(extra_sheets)
+        for sheet in extra_sheets:
+            detailed_report.append(f"Sheet '{sheet}' is in file 2 but missing in file 1")
+            summary_report.append(f"Extra sheet '{sheet}' in file 2")
 
-def compare_sheets(sheet_name, df1, df2):
+    return set(sheet_names1) & set(sheet_names2)
+
+def _sheet_rows(df1, df2):
+    """Return the number of rows a sheet comparison processes"""
+    return max(len(df1), len(df2))
+
+def _forward_stages(advance, progress):
+    """
+    Return a sheet progress callback that reports the current stage of the sheet
+    through the file progress, or None when there is no progress callback
+    """
+    if progress is None:
+        return None
+    return lambda event: advance(sheet=event["sheet"], stage=event["stage"])
+
+def _full_columns(data, sheet=None):
+    """
+    Return the full column list of a file or sheet when only part of its
+    columns were loaded, otherwise None
+    """
+    columns = data.get("columns")
+    if isinstance(columns, dict):
+        return columns.get(sheet)
+    return columns
+
+def merge_sheet_error_details(error_details, sheet, sheet_error_details):
+    """
+    Add the error details of one sheet to the error details of the file
+    """
+    for field in ["column_differences", "row_differences", "value_differences", "value_difference_counts", "column_stats"]:
+        if sheet_error_details[field]:
+            error_details[field][sheet] = sheet_error_details[field]
+
+def compare_sheets(sheet_name, df1, df2, metrics=None, limits=None, all_columns=None, progress=None):
     """
     Compare two dataframes and return detailed report, summary report, and error details
+
+    all_columns optionally gives the full column lists of both files, for
+    dataframes that were loaded with only part of their columns. progress is an
+    optional callback that receives each finished stage and the rows compared
+    (see progress_tracker).
     """
-    detailed_report = []
-    summary_report = []
+    advance = progress_tracker(progress, "comparing", sheet=sheet_name, sheets_total=1, rows_total=_sheet_rows(df1, df2))
 
+    with track_stage(metrics, "compare_sheet", sheet=sheet_name) as record:
+        detailed_report, summary_report, error_details = _compare_sheets(
+            sheet_name, df1, df2, metrics, limits, all_columns, advance
+        )
+
+        # Record the sheet size and difference counts
+        record["rows_file1"] = len(df1)
+        record["rows_file2"] = len(df2)
+        record["missing_rows"] = error_details["row_differences"]["missing_count"]
+        record["extra_rows"] = error_details["row_differences"]["extra_count"]
+        record["value_differences"] = sum(error_details["value_difference_counts"].values())
+
+    return detailed_report, summary_report, error_details
+
+def _compare_sheets(sheet_name, df1, df2, metrics, limits, all_columns, advance):
+    """
+    Run the comparison stages for one sheet
+    """
     # Initialize error details structure for this sheet
     error_details = {
         "column_differences": {},
         "row_differences": {},
-        "value_differences": []
+        "value_differences": [],
+        "value_difference_counts": {},
+        "column_stats": {}
     }
 
     # Compare column names and order
-    column_differences = compare_columns(df1, df2)
+    with track_stage(metrics, "column_comparison", sheet=sheet_name):
+        column_differences = compare_columns(df1, df2, all_columns)
     error_details["column_differences"] = column_differences
+    advance(stage="column_comparison")
+
+    # Get common columns for value comparison
+    common_columns = [col for col in df1.columns if col in df2.columns]
+
+    # Compare row counts
+    with track_stage(metrics, "key_indexing", sheet=sheet_name):
+        row_differences = compare_rows(df1, df2, common_columns, limits)
+    error_details["row_differences"] = row_differences
+    advance(stage="key_indexing")
+
+    # Compare values in common rows and columns
+    with track_stage(metrics, "value_diffing", sheet=sheet_name):
+        value_difference_counts = {}
+        column_stats = {}
+        value_differences = compare_values(
+            df1, df2, common_columns, row_differences, limits, value_difference_counts, column_stats
+        )
+    error_details["value_differences"] = value_differences
+    error_details["column_stats"] = column_stats
+    error_details["value_difference_counts"] = {col: count for col, count in value_difference_counts.items() if count}
+    advance(rows=_sheet_rows(df1, df2), stage="value_diffing")
+
+    with track_stage(metrics, "report_formatting", sheet=sheet_name):
+        detailed_report, summary_report = format_sheet_report(sheet_name, error_details)
+    advance(sheets=1, stage="report_formatting")
+
+    return detailed_report, summary_report, error_details
+
+def format_sheet_report(sheet_name, error_details):
+    """
+    Build the detailed and summary report lines for the differences of one sheet
+    """
+    detailed_report = []
+    summary_report = []
+
+    column_differences = error_details["column_differences"]
+    row_differences = error_details["row_differences"]
 
     if column_differences["missing"]:
         for col in column_differences["missing"]:
@@ -115,32 +251,34 @@ def compare_sheets(sheet_name, df1, df2):
         detailed_report.append(f"Column order in sheet '{sheet_name}' is different between files")
         summary_report.append(f"Column order in sheet '{sheet_name}' is different")
 
-    # Get common columns for value comparison
-    common_columns = [col for col in df1.columns if col in df2.columns]
-
-    # Compare row counts
-    row_differences = compare_rows(df1, df2, common_columns)
-    error_details["row_differences"] = row_differences
-
     if row_differences["count_diff"]:
         detailed_report.append(f"Row count in sheet '{sheet_name}' is different: {row_differences['count_diff'][0]} rows in file 1 vs {row_differences['count_diff'][1]} rows in file 2")
         summary_report.append(f"Row count in sheet '{sheet_name}' is different: {row_differences['count_diff'][0]} vs {row_differences['count_diff'][1]}")
 
-    if row_differences["missing_rows"]:
-        detailed_report.append(f"{len(row_differences['missing_rows'])} rows in sheet '{sheet_name}' are in file 1 but missing in file 2")
-        summary_report.append(f"{len(row_differences['missing_rows'])} rows missing in sheet '{sheet_name}'")
+    if row_differences["missing_count"]:
+        detailed_report.append(f"{row_differences['missing_count']} rows in sheet '{sheet_name}' are in file 1 but missing in file 2")
+        summary_report.append(f"{row_differences['missing_count']} rows missing in sheet '{sheet_name}'")
 
-    if row_differences["extra_rows"]:
-        detailed_report.append(f"{len(row_differences['extra_rows'])} rows in sheet '{sheet_name}' are in file 2 but missing in file 1")
-        summary_report.append(f"{len(row_differences['extra_rows'])} extra rows in sheet '{sheet_name}'")
+    if row_differences["extra_count"]:
+        detailed_report.append(f"{row_differences['extra_count']} rows in sheet '{sheet_name}' are in file 2 but missing in file 1")
+        summary_report.append(f"{row_differences['extra_count']} extra rows in sheet '{sheet_name}'")
 
-    # Compare values in common rows and columns
-    value_differences = compare_values(df1, df2, common_columns, row_differences)
-    error_details["value_differences"] = value_differences
+    total = sum(error_details["value_difference_counts"].values())
+    _format_value_differences(sheet_name, error_details["value_differences"], total, detailed_report, summary_report)
 
-    if value_differences:
-        detailed_report.append(f"{len(value_differences)} value differences found in sheet '{sheet_name}'")
-        summary_report.append(f"{len(value_differences)} value differences in sheet '{sheet_name}'")
+    return detailed_report, summary_report
+
+def _format_value_differences(sheet_name, value_differences, total, detailed_report, summary_report):
+    """
+    Add the value differences of a sheet to the reports
+    """
+    if total:
+        detailed_report.append(f"{total} value differences found in sheet '{sheet_name}'")
+        summary_report.append(f"{total} value differences in sheet '{sheet_name}'")
+
+        # Note when only part of the differences were kept because of the limits
+        if len(value_differences) < total:
+            detailed_report.append(f"Only {len(value_differences)} of {total} value differences in sheet '{sheet_name}' are listed because the difference limits were reached")
 
         # Add detailed value differences
         for diff in value_differences:
@@ -149,16 +287,23 @@ def compare_sheets(sheet_name, df1, df2):
             else:
                 detailed_report.append(f"Value difference in sheet '{sheet_name}', row {diff['row']}, column '{diff['column']}': '{diff['value1']}' vs '{diff['value2']}'")
 
-    return detailed_report, summary_report, error_details
-
-def compare_columns(df1, df2):
+def compare_columns(df1, df2, all_columns=None):
     """
     Compare columns between two dataframes
     """
-    # Get column names
+    # Get column names, preferring the full column lists when they are known
     cols1 = list(df1.columns)
     cols2 = list(df2.columns)
+    if all_columns is not None:
+        cols1 = list(all_columns[0]) if all_columns[0] is not None else cols1
+        cols2 = list(all_columns[1]) if all_columns[1] is not None else cols2
+
+    return compare_column_lists(cols1, cols2)
 
+def compare_column_lists(cols1, cols2):
+    """
+    Compare two lists of column names
+    """
     # Find missing and extra columns
     missing_cols = [col for col in cols1 if col not in cols2]
     extra_cols = [col for col in cols2 if col not in cols1]
@@ -180,113 +325,334 @@ def compare_columns(df1, df2):
         "reordered": reordered
     }
 
-def compare_rows(df1, df2, common_columns):
+def resolve_limits(limits=None):
+    """
+    Return the comparison limits with defaults filled in.
+
+    max_diffs_per_sheet and max_diffs_per_column cap the number of difference
+    records kept (rows and values). fail_fast_threshold is a fraction of the
+    compared cells: when a sheet's mismatch rate is above it, no value difference
+    records are kept for that sheet at all. Differences are always counted in
+    full. None disables a limit.
+    """
+    resolved = dict(DEFAULT_LIMITS)
+    if limits:
+        resolved.update({name: value for name, value in limits.items() if name in DEFAULT_LIMITS})
+    return resolved
+
+def _is_arrow_backed(series):
+    """Check if a series is stored as Arrow memory or as categories"""
+    dtype = series.dtype
+    return (
+        isinstance(dtype, (pd.ArrowDtype, pd.CategoricalDtype))
+        or (isinstance(dtype, pd.StringDtype) and dtype.storage == "pyarrow")
+    )
+
+def _is_arrow_string(series):
+    """Check if a series holds Arrow-backed strings"""
+    dtype = series.dtype
+    if isinstance(dtype, pd.StringDtype):
+        return dtype.storage == "pyarrow"
+    return isinstance(dtype, pd.ArrowDtype) and dtype.kind in "OU" and str(dtype.pyarrow_dtype) in ["string", "large_string"]
+
+def string_keys(df, key_column):
+    """Return the key column converted to strings"""
+    keys = df[key_column]
+
+    # Arrow-backed string keys are used as they are, avoiding an object copy
+    if _is_arrow_string(keys):
+        return keys
+    return keys.astype(str)
+
+def _has_unique_keys(keys1, keys2):
+    """Check if both key series can be used to identify rows"""
+    return not (keys1.duplicated().any() or keys2.duplicated().any())
+
+def _cap(items, limit):
+    """Return the first items up to the limit (None means no limit)"""
+    return items if limit is None else items[:limit]
+
+def compare_rows(df1, df2, common_columns, limits=None):
     """
     Compare rows between two dataframes
     """
+    limits = resolve_limits(limits)
+
     # Check if there are any common columns to use for comparison
     if not common_columns:
         return {
             "count_diff": [len(df1), len(df2)],
             "missing_rows": {},
-            "extra_rows": {}
+            "extra_rows": {},
+            "missing_count": 0,
+            "extra_count": 0
         }
 
     # Try to identify a key column (first column or index)
     key_column = common_columns[0]
+    keys1 = string_keys(df1, key_column)
+    keys2 = string_keys(df2, key_column)
+
+    # Row count difference
+    count_diff = [len(df1), len(df2)]
 
     # Check if the key column has unique values
-    if df1[key_column].duplicated().any() or df2[key_column].duplicated().any():
+    if not _has_unique_keys(keys1, keys2):
         # If key column has duplicates, use row indices
-        missing_rows = {}
-        extra_rows = {}
-
-        # Row count difference
-        count_diff = [len(df1), len(df2)]
-
         return {
             "count_diff": count_diff if count_diff[0] != count_diff[1] else None,
-            "missing_rows": missing_rows,
-            "extra_rows": extra_rows
+            "missing_rows": {},
+            "extra_rows": {},
+            "missing_count": 0,
+            "extra_count": 0
         }
 
-    # Use the key column to identify rows
-    keys1 = set(df1[key_column].astype(str))
-    keys2 = set(df2[key_column].astype(str))
-
-    # Find missing and extra rows
-    missing_keys = keys1 - keys2
-    extra_keys = keys2 - keys1
+    # Find missing and extra rows using the key column
+    missing_mask = ~keys1.isin(keys2).to_numpy()
+    extra_mask = ~keys2.isin(keys1).to_numpy()
 
     # Create dictionaries with key as the key and value as the row index
-    missing_rows = {key: df1[df1[key_column].astype(str) == key].index[0] for key in missing_keys}
-    extra_rows = {key: df2[df2[key_column].astype(str) == key].index[0] for key in extra_keys}
-
-    # Row count difference
-    count_diff = [len(df1), len(df2)]
+    max_rows = limits["max_diffs_per_sheet"]
+    missing_rows = dict(zip(_cap(keys1[missing_mask], max_rows), _cap(df1.index[missing_mask], max_rows)))
+    extra_rows = dict(zip(_cap(keys2[extra_mask], max_rows), _cap(df2.index[extra_mask], max_rows)))
 
     return {
         "count_diff": count_diff if count_diff[0] != count_diff[1] else None,
         "missing_rows": missing_rows,
-        "extra_rows": extra_rows
+        "extra_rows": extra_rows,
+        "missing_count": int(missing_mask.sum()),
+        "extra_count": int(extra_mask.sum())
     }
 
-def compare_values(df1, df2, common_columns, row_differences):
+def align_rows(df1, df2, common_columns):
+    """
+    Find the pairs of rows to compare between two dataframes.
+
+    Rows are matched on the key column (the first common column) when its values
+    are unique in both dataframes, and by position otherwise. Returns the row
+    positions in each dataframe, the identifier field ("key" or "row") and the
+    identifier of each pair.
+    """
+    key_column = common_columns[0]
+    keys1 = string_keys(df1, key_column)
+    keys2 = string_keys(df2, key_column)
+
+    if not _has_unique_keys(keys1, keys2):
+        # Compare rows by position up to the shorter dataframe
+        positions = np.arange(min(len(df1), len(df2)))
+        return positions, positions, "row", positions
+
+    # Look up the position of every file 1 key in file 2
+    positions2 = pd.Index(keys2).get_indexer(keys1)
+    positions1 = np.flatnonzero(positions2 >= 0)
+    positions2 = positions2[positions1]
+
+    return positions1, positions2, "key", keys1.to_numpy()[positions1]
+
+def _arrow_values_differ(values1, values2):
+    """
+    Compare two aligned series with Arrow compute kernels.
+
+    Returns None when the columns cannot be compared this way (pyarrow is not
+    installed or the value types differ), so the caller falls back to strings.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return None
+
+    try:
+        array1 = pa.array(values1)
+        array2 = pa.array(values2)
+    except (pa.ArrowException, TypeError, ValueError):
+        return None
+
+    # Compare categories by their values
+    if pa.types.is_dictionary(array1.type):
+        array1 = pc.cast(array1, array1.type.value_type)
+    if pa.types.is_dictionary(array2.type):
+        array2 = pc.cast(array2, array2.type.value_type)
+
+    # Only compare natively when both sides have the same type; string renderings
+    # of different types (1 vs 1.0) must still count as different
+    if pa.types.is_large_string(array1.type) and pa.types.is_string(array2.type):
+        array2 = pc.cast(array2, pa.large_string())
+    elif pa.types.is_string(array1.type) and pa.types.is_large_string(array2.type):
+        array1 = pc.cast(array1, pa.large_string())
+    if not array1.type.equals(array2.type):
+        return None
+
+    differ = pc.fill_null(pc.not_equal(array1, array2), False)
+    one_missing = pc.xor(pc.is_null(array1), pc.is_null(array2))
+    differ = pc.or_(differ, one_missing)
+
+    # NaN renders as 'nan' on both sides, so two NaNs are equal
+    if pa.types.is_floating(array1.type):
+        both_nan = pc.fill_null(pc.and_(pc.is_nan(array1), pc.is_nan(array2)), False)
+        differ = pc.and_(differ, pc.invert(both_nan))
+
+    return differ.to_numpy(zero_copy_only=False)
+
+def values_differ(values1, values2):
+    """
+    Return a boolean mask of the positions where two aligned series differ.
+
+    Values are compared as strings, as str() would render them. Columns of the
+    same numeric, boolean or datetime type are compared natively, and Arrow-backed
+    or categorical columns with Arrow compute kernels, which give the same result
+    without building string copies.
+    """
+    if _is_arrow_backed(values1) or _is_arrow_backed(values2):
+        differ = _arrow_values_differ(values1, values2)
+        if differ is not None:
+            return differ
+
+    if values1.dtype == values2.dtype and isinstance(values1.dtype, np.dtype) and values1.dtype.kind in "biufmM":
+        array1 = values1.to_numpy()
+        array2 = values2.to_numpy()
+        both_missing = pd.isna(array1) & pd.isna(array2)
+        return ~((array1 == array2) | both_missing)
+
+    return values1.astype(str).to_numpy() != values2.astype(str).to_numpy()
+
+def _is_numeric(values):
+    """Check if a series holds numbers (not booleans)"""
+    return pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype)
+
+def empty_column_stats(compared, mismatches):
+    """
+    Return the statistics of a column with only the mismatch count known
+    """
+    return {
+        "compared": compared,
+        "mismatches": mismatches,
+        "nulls_file1": None,
+        "nulls_file2": None,
+        "became_null": None,
+        "became_filled": None,
+        "max_abs_drift": None,
+        "mean_drift": None,
+        "mean_abs_drift": None,
+        "drift_histogram": None
+    }
+
+def column_stats(values1, values2, mask):
+    """
+    Summarize the differences of one column over the compared rows.
+
+    Returns the mismatch count, the null counts of both files and the rows that
+    became null or were filled in, and for numeric columns the drift (file 2
+    minus file 1) of the differing values: its largest absolute value, its mean,
+    its mean absolute value and a histogram. Drift fields are None otherwise.
+    """
+    nulls1 = values1.isna().to_numpy()
+    nulls2 = values2.isna().to_numpy()
+
+    stats = empty_column_stats(len(mask), int(mask.sum()))
+    stats.update({
+        "nulls_file1": int(nulls1.sum()),
+        "nulls_file2": int(nulls2.sum()),
+        "became_null": int((~nulls1 & nulls2).sum()),
+        "became_filled": int((nulls1 & ~nulls2).sum())
+    })
+
+    if not (_is_numeric(values1) and _is_numeric(values2)):
+        return stats
+
+    # Measure the drift of the values that differ and are present in both files
+    selected = mask & ~nulls1 & ~nulls2
+    drift = (
+        values2.to_numpy(dtype="float64", na_value=np.nan)[selected]
+        - values1.to_numpy(dtype="float64", na_value=np.nan)[selected]
+    )
+    drift = drift[np.isfinite(drift)]
+    if not len(drift):
+        return stats
+
+    abs_drift = np.abs(drift)
+    counts, edges = np.histogram(drift, bins=DRIFT_HISTOGRAM_BINS)
+    stats.update({
+        "max_abs_drift": float(abs_drift.max()),
+        "mean_drift": float(drift.mean()),
+        "mean_abs_drift": float(abs_drift.mean()),
+        "drift_histogram": {"bin_edges": edges.tolist(), "counts": counts.tolist()}
+    })
+    return stats
+
+def compare_values(df1, df2, common_columns, row_differences, limits=None, counts=None, stats=None):
     """
     Compare values in common rows and columns
+
+    Every cell is compared and the differences are counted per column, but detail
+    records are only kept within the limits (see resolve_limits). If counts is a
+    dictionary it receives the number of differences per column, and if stats
+    is a dictionary it receives the statistics of every column (see column_stats).
     """
+    limits = resolve_limits(limits)
     value_differences = []
 
     # If there are no common columns, return empty list
     if not common_columns:
         return value_differences
 
-    # Try to identify a key column (first column or index)
-    key_column = common_columns[0]
+    # Pair up the rows to compare
+    positions1, positions2, identifier_field, identifiers = align_rows(df1, df2, common_columns)
+
+    # Find the differing rows of each column
+    column_masks = {}
+    for col in common_columns:
+        values1 = df1[col].take(positions1)
+        values2 = df2[col].take(positions2)
+        mask = values_differ(values1, values2)
+        column_masks[col] = mask
+        if counts is not None:
+            counts[col] = int(mask.sum())
+        if stats is not None:
+            stats[col] = column_stats(values1, values2, mask)
+
+    # Skip the detail records when most of the sheet differs
+    total = sum(int(mask.sum()) for mask in column_masks.values())
+    compared = len(positions1) * len(common_columns)
+    threshold = limits["fail_fast_threshold"]
+    if threshold is not None and compared and total / compared > threshold:
+        return value_differences
 
-    # Check if the key column has unique values
-    if df1[key_column].duplicated().any() or df2[key_column].duplicated().any():
-        # If key column has duplicates, use row indices for comparison
-        # Get the minimum length to avoid index errors
-        min_len = min(len(df1), len(df2))
-
-        for i in range(min_len):
-            for col in common_columns:
-                # Convert values to strings for comparison to handle different types
-                val1 = str(df1.iloc[i][col])
-                val2 = str(df2.iloc[i][col])
-
-                # Check if values are different
-                if val1 != val2:
-                    value_differences.append({
-                        "row": i,
-                        "column": col,
-                        "value1": val1,
-                        "value2": val2
-                    })
-    else:
-        # Use the key column to identify common rows
-        keys1 = set(df1[key_column].astype(str))
-        keys2 = set(df2[key_column].astype(str))
-        common_keys = keys1 & keys2
-
-        for key in common_keys:
-            # Get the rows with this key
-            row1 = df1[df1[key_column].astype(str) == key].iloc[0]
-            row2 = df2[df2[key_column].astype(str) == key].iloc[0]
-
-            for col in common_columns:
-                # Convert values to strings for comparison to handle different types
-                val1 = str(row1[col])
-                val2 = str(row2[col])
-
-                # Check if values are different
-                if val1 != val2:
-                    value_differences.append({
-                        "key": key,
-                        "column": col,
-                        "value1": val1,
-                        "value2": val2
-                    })
-
-    return value_differences
\ No newline at end of file
+    # Keep the first differences of each column within the column limit
+    rows = []
+    columns = []
+    for column_index, col in enumerate(common_columns):
+        differing = _cap(np.flatnonzero(column_masks[col]), limits["max_diffs_per_column"])
+        rows.append(differing)
+        columns.append(np.full(len(differing), column_index))
+
+    if not rows:
+        return value_differences
+
+    # Order the differences by row, then column, and apply the sheet limit
+    rows = np.concatenate(rows)
+    columns = np.concatenate(columns)
+    order = _cap(np.lexsort((columns, rows)), limits["max_diffs_per_sheet"])
+    rows = rows[order]
+    columns = columns[order]
+
+    # Build the difference records, converting values to strings as they would be displayed
+    value_differences = [None] * len(rows)
+    for column_index, col in enumerate(common_columns):
+        selected = np.flatnonzero(columns == column_index)
+        if not len(selected):
+            continue
+
+        differing = rows[selected]
+        values1 = df1[col].take(positions1[differing])
+        values2 = df2[col].take(positions2[differing])
+
+        for order_index, identifier, val1, val2 in zip(selected, identifiers[differing], values1, values2):
+            value_differences[order_index] = {
+                identifier_field: identifier if identifier_field == "key" else int(identifier),
+                "column": col,
+                "value1": str(val1),
+                "value2": str(val2)
+            }
+
+    return value_differences
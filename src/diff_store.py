@@ -0,0 +1,146 @@
+import math
+import sqlite3
+
+from src.exporters import DIFF_FIELDS, iter_differences
+from src.instrumentation import track_stage
+
+# Table holding one row per difference, with the DIFF_FIELDS as columns
+DIFF_TABLE = "differences"
+
+# Indexes built once the differences are written, for filtering by sheet and
+# column, looking up keys and filtering by difference type
+DIFF_INDEXES = {
+    "differences_sheet_column_key": ["sheet", "column", "key"],
+    "differences_sheet_key": ["sheet", "key"],
+    "differences_sheet_type": ["sheet", "diff_type"]
+}
+
+# Differences inserted per statement while building the store
+INSERT_BATCH_ROWS = 10_000
+
+# Rows shown per page when browsing the differences
+PAGE_SIZE = 100
+
+def _quote(name):
+    """Quote a column name, since "column" and "key" are SQL keywords"""
+    return '"' + name + '"'
+
+def build_diff_store(error_details, path, metrics=None):
+    """
+    Write the differences of a comparison (see iter_differences) to a SQLite
+    database at path, indexed on sheet, column, key and difference type, and
+    return the number of differences written.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        # The store is written once and only read afterwards, so skip the journal
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+
+        columns = ", ".join(
+            f"{_quote(field)} INTEGER" if field == "row" else f"{_quote(field)} TEXT" for field in DIFF_FIELDS
+        )
+        connection.execute(f"DROP TABLE IF EXISTS {DIFF_TABLE}")
+        connection.execute(f"CREATE TABLE {DIFF_TABLE} ({columns})")
+
+        insert = (
+            f"INSERT INTO {DIFF_TABLE} ({', '.join(_quote(field) for field in DIFF_FIELDS)}) "
+            f"VALUES ({', '.join('?' for _ in DIFF_FIELDS)})"
+        )
+
+        with track_stage(metrics, "build_diff_store") as record:
+            count = 0
+            batch = []
+            for difference in iter_differences(error_details):
+                batch.append([difference[field] for field in DIFF_FIELDS])
+                if len(batch) >= INSERT_BATCH_ROWS:
+                    connection.executemany(insert, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                connection.executemany(insert, batch)
+                count += len(batch)
+
+            # Index after loading, which is faster than keeping the indexes up to date
+            for name, fields in DIFF_INDEXES.items():
+                connection.execute(
+                    f"CREATE INDEX {name} ON {DIFF_TABLE} ({', '.join(_quote(field) for field in fields)})"
+                )
+            connection.execute("ANALYZE")
+            connection.commit()
+            record["differences"] = count
+    finally:
+        connection.close()
+
+    return count
+
+def _connect_read_only(path):
+    """Open a diff store for reading; each query opens its own connection so threads never share one"""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+def _where_clause(sheet=None, column=None, diff_type=None, key_prefix=None):
+    """
+    Build the WHERE clause and parameters of a difference query. The key prefix
+    is matched as a range of keys, which the key indexes can answer.
+    """
+    conditions = []
+    parameters = []
+
+    for field, value in [("sheet", sheet), ("column", column), ("diff_type", diff_type)]:
+        if value is not None:
+            conditions.append(f"{_quote(field)} = ?")
+            parameters.append(value)
+
+    if key_prefix:
+        conditions.append('"key" >= ? AND "key" < ?')
+        parameters.extend([key_prefix, key_prefix + chr(0x10FFFF)])
+
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+def query_differences(path, sheet=None, column=None, diff_type=None, key_prefix=None, sort_by=None,
+                      descending=False, offset=0, limit=PAGE_SIZE):
+    """
+    Return one page of the differences in a diff store matching the filters,
+    as a list of dictionaries with the DIFF_FIELDS, and the total number of
+    matching differences.
+
+    Filters left as None match everything; key_prefix keeps the keys starting
+    with it. sort_by is one of the DIFF_FIELDS (the store order by default).
+    """
+    if sort_by is not None and sort_by not in DIFF_FIELDS:
+        raise ValueError(f"Unknown sort field '{sort_by}', expected one of {', '.join(DIFF_FIELDS)}")
+
+    where, parameters = _where_clause(sheet, column, diff_type, key_prefix)
+    order = f" ORDER BY {_quote(sort_by)} {'DESC' if descending else 'ASC'}, rowid" if sort_by else " ORDER BY rowid"
+
+    connection = _connect_read_only(path)
+    try:
+        total = connection.execute(f"SELECT COUNT(*) FROM {DIFF_TABLE}{where}", parameters).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT {', '.join(_quote(field) for field in DIFF_FIELDS)} FROM {DIFF_TABLE}{where}{order} LIMIT ? OFFSET ?",
+            parameters + [limit, offset]
+        ).fetchall()
+    finally:
+        connection.close()
+
+    return [dict(zip(DIFF_FIELDS, row)) for row in rows], total
+
+def distinct_values(path, field, sheet=None):
+    """Return the distinct values of a field in a diff store, optionally within one sheet"""
+    if field not in DIFF_FIELDS:
+        raise ValueError(f"Unknown field '{field}', expected one of {', '.join(DIFF_FIELDS)}")
+
+    where, parameters = _where_clause(sheet)
+    connection = _connect_read_only(path)
+    try:
+        rows = connection.execute(
+            f"SELECT DISTINCT {_quote(field)} FROM {DIFF_TABLE}{where} ORDER BY {_quote(field)}", parameters
+        ).fetchall()
+    finally:
+        connection.close()
+
+    return [row[0] for row in rows if row[0] is not None]
+
+def page_count(total, page_size=PAGE_SIZE):
+    """Return the number of pages needed to show total differences"""
+    return max(1, math.ceil(total / page_size))
@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import os
+
+from src.instrumentation import track_stage
+
+# Formats the differences can be exported to
+EXPORT_FORMATS = ["jsonl", "csv", "parquet"]
+
+# Fields of every exported difference; key is set when rows were matched on
+# their key column and row (the row position in file 1, or in file 2 for extra
+# rows) otherwise or for row differences
+DIFF_FIELDS = ["sheet", "key", "row", "column", "old_value", "new_value", "diff_type"]
+
+# Kinds of differences, as written in the diff_type field
+DIFF_TYPES = [
+    "missing_sheet", "extra_sheet", "missing_column", "extra_column", "column_order",
+    "missing_row", "extra_row", "value_changed"
+]
+
+# Differences written to a Parquet file at a time
+EXPORT_BATCH_ROWS = 65_536
+
+def _difference(sheet, diff_type, key=None, row=None, column=None, old_value=None, new_value=None):
+    """Build one exported difference, with keys, columns and values as text"""
+    return {
+        "sheet": sheet,
+        "key": None if key is None else str(key),
+        "row": None if row is None else int(row),
+        "column": None if column is None else str(column),
+        "old_value": None if old_value is None else str(old_value),
+        "new_value": None if new_value is None else str(new_value),
+        "diff_type": diff_type
+    }
+
+def iter_differences(error_details):
+    """
+    Yield the differences of a comparison one at a time as flat records with
+    the DIFF_FIELDS, sheet by sheet: sheet differences first, then column, row
+    and value differences. Only the differences stored within the limits are
+    exported.
+    """
+    for sheet in error_details["missing_sheets"]:
+        yield _difference(sheet, "missing_sheet")
+    for sheet in error_details["extra_sheets"]:
+        yield _difference(sheet, "extra_sheet")
+
+    sheets = list(dict.fromkeys(
+        list(error_details["column_differences"]) + list(error_details["row_differences"])
+        + list(error_details["value_differences"])
+    ))
+    for sheet in sheets:
+        column_differences = error_details["column_differences"].get(sheet, {})
+        for col in column_differences.get("missing", []):
+            yield _difference(sheet, "missing_column", column=col)
+        for col in column_differences.get("extra", []):
+            yield _difference(sheet, "extra_column", column=col)
+        if column_differences.get("reordered"):
+            yield _difference(sheet, "column_order")
+
+        row_differences = error_details["row_differences"].get(sheet, {})
+        for key, row in row_differences.get("missing_rows", {}).items():
+            yield _difference(sheet, "missing_row", key=key, row=row)
+        for key, row in row_differences.get("extra_rows", {}).items():
+            yield _difference(sheet, "extra_row", key=key, row=row)
+
+        for diff in error_details["value_differences"].get(sheet, []):
+            yield _difference(
+                sheet, "value_changed", key=diff.get("key"), row=diff.get("row"), column=diff["column"],
+                old_value=diff["value1"], new_value=diff["value2"]
+            )
+
+def write_jsonl(differences, output):
+    """Write differences to a binary stream as JSON lines and return the count written"""
+    count = 0
+    for difference in differences:
+        output.write((json.dumps(difference, ensure_ascii=False) + "\n").encode("utf-8"))
+        count += 1
+    return count
+
+def write_csv(differences, output):
+    """Write differences to a binary stream as CSV with a header row and return the count written"""
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    try:
+        writer = csv.DictWriter(text, fieldnames=DIFF_FIELDS)
+        writer.writeheader()
+        count = 0
+        for difference in differences:
+            writer.writerow(difference)
+            count += 1
+    finally:
+        # Hand the stream back to the caller open
+        text.flush()
+        text.detach()
+    return count
+
+def _import_pyarrow_parquet():
+    """Import pyarrow, which is only needed for Parquet exports"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Exporting differences to Parquet requires the pyarrow package")
+    return pyarrow
+
+def write_parquet(differences, output, batch_rows=EXPORT_BATCH_ROWS):
+    """
+    Write differences to a binary stream as a Parquet file, one row group of up
+    to batch_rows differences at a time, and return the count written
+    """
+    pa = _import_pyarrow_parquet()
+    schema = pa.schema([
+        (field, pa.int64() if field == "row" else pa.string()) for field in DIFF_FIELDS
+    ])
+
+    count = 0
+    with pa.parquet.ParquetWriter(output, schema) as writer:
+        batch = []
+        for difference in differences:
+            batch.append(difference)
+            if len(batch) >= batch_rows:
+                writer.write_table(pa.Table.from_pylist(batch, schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema))
+            count += len(batch)
+    return count
+
+# Writer of each export format
+WRITERS = {
+    "jsonl": write_jsonl,
+    "csv": write_csv,
+    "parquet": write_parquet
+}
+
+def export_format(path):
+    """Return the export format matching the extension of a path, or None"""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ["json", "ndjson"]:
+        return "jsonl"
+    if extension == "pq":
+        return "parquet"
+    return extension if extension in EXPORT_FORMATS else None
+
+def export_differences(error_details, output, file_format="jsonl", metrics=None):
+    """
+    Write the differences of a comparison (see iter_differences) to a path or
+    binary stream in one of the EXPORT_FORMATS, as they are generated, and
+    return the number of differences written
+    """
+    if file_format not in WRITERS:
+        raise ValueError(f"Unknown export format '{file_format}', expected one of {', '.join(EXPORT_FORMATS)}")
+
+    with track_stage(metrics, "export_differences", format=file_format) as record:
+        if isinstance(output, str):
+            with open(output, "wb") as f:
+                count = WRITERS[file_format](iter_differences(error_details), f)
+        else:
+            count = WRITERS[file_format](iter_differences(error_details), output)
+        record["differences"] = count
+
+    return count
@@ -0,0 +1,176 @@
+import ast
+import operator
+import re
+
+import pandas as pd
+
+# Comparison operators a row filter can use
+COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge
+}
+
+# Column names written between backticks, for names that are not identifiers
+QUOTED_COLUMN = re.compile(r"`([^`]*)`")
+
+# Types of the literals a row filter can hold
+LITERAL_TYPES = (str, int, float, bool, type(None))
+
+# What the rejected parts of an expression are called in error messages
+REJECTED_NODES = {
+    ast.Call: "function calls",
+    ast.Attribute: "attribute access",
+    ast.Subscript: "subscripts",
+    ast.Lambda: "lambdas",
+    ast.NamedExpr: "assignments"
+}
+
+def _reject(expression, description):
+    """Raise the error of an expression outside the filter grammar"""
+    raise ValueError(
+        f"Invalid row filter '{expression}': {description} are not allowed. Filters compare columns with "
+        "literals (==, !=, <, <=, >, >=, in, not in) and combine them with and, or, not, &, | and ~."
+    )
+
+def _check_node(node, expression):
+    """Check that a node of a parsed filter only uses the filter grammar"""
+    if isinstance(node, ast.BoolOp):
+        children = node.values
+    elif isinstance(node, ast.BinOp):
+        if not isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            _reject(expression, "arithmetic operators")
+        children = [node.left, node.right]
+    elif isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, (ast.USub, ast.UAdd)):
+            if not (isinstance(node.operand, ast.Constant) and isinstance(node.operand.value, (int, float))):
+                _reject(expression, "signs on anything but numbers")
+        children = [node.operand]
+    elif isinstance(node, ast.Compare):
+        for op in node.ops:
+            if type(op) not in COMPARISONS and not isinstance(op, (ast.In, ast.NotIn)):
+                _reject(expression, "'is' comparisons")
+        children = [node.left] + node.comparators
+    elif isinstance(node, (ast.List, ast.Tuple)):
+        children = node.elts
+    elif isinstance(node, ast.Name):
+        children = []
+    elif isinstance(node, ast.Constant):
+        if not isinstance(node.value, LITERAL_TYPES):
+            _reject(expression, f"{type(node.value).__name__} literals")
+        children = []
+    else:
+        _reject(expression, REJECTED_NODES.get(type(node), type(node).__name__))
+
+    for child in children:
+        _check_node(child, expression)
+
+def parse_row_filter(expression):
+    """
+    Parse a row filter and return its syntax tree with the column names written
+    between backticks by their placeholder.
+
+    A filter compares columns with literals or other columns (==, !=, <, <=,
+    >, >=, and in / not in a list of literals) and combines the comparisons
+    with and, or, not (or &, | and ~). Column names that are not identifiers
+    are written between backticks. Raises ValueError for anything else, such
+    as function calls, attribute access, subscripts or pandas @ variables.
+    """
+    columns = {}
+
+    def placeholder(match):
+        name = f"__column_{len(columns)}"
+        columns[name] = match.group(1)
+        return name
+
+    try:
+        tree = ast.parse(QUOTED_COLUMN.sub(placeholder, expression).strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid row filter '{expression}': {e.msg}")
+
+    _check_node(tree.body, expression)
+    return tree.body, columns
+
+def check_row_filters(scope):
+    """Check the row filters of a scope (see row_filter), raising ValueError for invalid ones"""
+    if not scope:
+        return
+    for expression in [scope.get("row_filter"), *(scope.get("sheet_row_filters") or {}).values()]:
+        if expression is not None:
+            if not isinstance(expression, str):
+                raise ValueError("Row filters must be strings")
+            parse_row_filter(expression)
+
+def _evaluate(node, df, columns, expression):
+    """Evaluate a node of a parsed filter on a dataframe: a column, a literal or a mask"""
+    if isinstance(node, ast.BoolOp):
+        combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        result = _mask(node.values[0], df, columns, expression)
+        for value in node.values[1:]:
+            result = combine(result, _mask(value, df, columns, expression))
+        return result
+
+    if isinstance(node, ast.BinOp):
+        combine = operator.and_ if isinstance(node.op, ast.BitAnd) else operator.or_
+        return combine(_mask(node.left, df, columns, expression), _mask(node.right, df, columns, expression))
+
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, (ast.Not, ast.Invert)):
+            return ~_mask(node.operand, df, columns, expression)
+        return -node.operand.value if isinstance(node.op, ast.USub) else node.operand.value
+
+    if isinstance(node, ast.Compare):
+        result = None
+        left = _evaluate(node.left, df, columns, expression)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate(comparator, df, columns, expression)
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(left, pd.Series) or not isinstance(right, list):
+                    raise ValueError(f"Invalid row filter '{expression}': 'in' needs a column and a list of values")
+                part = left.isin(right)
+                part = ~part if isinstance(op, ast.NotIn) else part
+            else:
+                part = COMPARISONS[type(op)](left, right)
+            result = part if result is None else result & part
+            left = right
+        return result
+
+    if isinstance(node, ast.Name):
+        name = columns.get(node.id, node.id)
+        if name not in df.columns:
+            raise ValueError(f"Row filter '{expression}' uses column '{name}', which is not in the sheet or not compared")
+        return df[name]
+
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_evaluate(element, df, columns, expression) for element in node.elts]
+
+    return node.value
+
+def _mask(node, df, columns, expression):
+    """Evaluate a node of a parsed filter as a boolean mask over the rows"""
+    value = _evaluate(node, df, columns, expression)
+    if not isinstance(value, pd.Series):
+        return pd.Series(bool(value), index=df.index)
+
+    # Rows where a comparison is unknown (missing values) are not kept
+    return value.fillna(False).astype(bool)
+
+def row_filter_mask(df, expression):
+    """
+    Return the boolean mask of the rows of a dataframe matching a row filter
+    (see parse_row_filter)
+    """
+    node, columns = parse_row_filter(expression)
+    try:
+        return _mask(node, df, columns, expression).to_numpy()
+    except TypeError as e:
+        raise ValueError(f"Row filter '{expression}' cannot be applied: {e}")
+
+def filter_rows(df, expression):
+    """Keep the rows of a dataframe matching a row filter, numbered from zero"""
+    if not expression:
+        return df
+    return df[row_filter_mask(df, expression)].reset_index(drop=True)
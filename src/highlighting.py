@@ -1,327 +1,318 @@
+import re
+
+import numpy as np
 import pandas as pd
 from io import BytesIO
 from openpyxl.styles import PatternFill, Font
 from openpyxl.utils import get_column_letter
 from openpyxl.comments import Comment
 
+from src.comparison import string_keys
+from src.instrumentation import track_stage
+
 # Define colors for highlighting
 RED_FILL = PatternFill(start_color="FFFF0000", end_color="FFFF0000", fill_type="solid")
 YELLOW_FILL = PatternFill(start_color="FFFFFF00", end_color="FFFFFF00", fill_type="solid")
 GREEN_FILL = PatternFill(start_color="FF00FF00", end_color="FF00FF00", fill_type="solid")
 
-def highlight_differences_excel(data1, data2, error_details):
+# Author of the comments added to highlighted cells
+COMMENT_AUTHOR = "Comparison Ability"
+
+# Columns of the summary sheet
+SUMMARY_COLUMNS = ["Type", "Location", "Difference"]
+
+# Characters Excel does not allow in worksheet titles, and the longest title
+INVALID_TITLE_CHARACTERS = r"[\[\]:*?/\\]"
+MAX_TITLE_LENGTH = 31
+
+def _worksheet_title(sheet_name):
+    """Return a valid worksheet title for a sheet name"""
+    return re.sub(INVALID_TITLE_CHARACTERS, "_", str(sheet_name))[:MAX_TITLE_LENGTH] or "Sheet"
+
+def _file_sheets(data):
+    """
+    Return the sheets of a file data dictionary as (sheet name, worksheet
+    title, dataframe) in file order. Single tables are written to a "Data"
+    worksheet.
+    """
+    if isinstance(data["data"], dict):
+        return [(sheet, _worksheet_title(sheet), df) for sheet, df in data["data"].items()]
+    if data["data"] is not None:
+        return [("data", "Data", data["data"])]
+    return []
+
+def _empty_marks():
+    """
+    Return the highlights of one worksheet: a fill for the whole sheet, fills
+    of whole columns and rows, highlighted cells with both values and notes
+    for the first cell. Rows and columns are 1-indexed worksheet positions.
+    """
+    return {"sheet": None, "columns": {}, "rows": {}, "cells": {}, "notes": []}
+
+def _key_positions(df, key_column, keys):
+    """
+    Return the position of the first row with each key in a dataframe, or -1
+    for keys it does not have
+    """
+    row_keys = pd.Index(string_keys(df, key_column))
+    first = ~row_keys.duplicated()
+    found = row_keys[first].get_indexer(keys)
+    return np.where(found >= 0, np.flatnonzero(first)[found], -1)
+
+def collect_highlights(data1, data2, error_details):
+    """
+    Work out the highlights of both files in one pass over the differences.
+
+    Returns {1: {sheet: marks}, 2: {sheet: marks}} (see _empty_marks): what is
+    missing in file 2 is red in file 1, what is extra in file 2 is green in
+    file 2 and differing values are yellow on both sides. Rows matched on
+    their key are found through one key-to-row index per sheet and side,
+    looked up for all the differences of the sheet at once.
+    """
+    frames = {side: {sheet: df for sheet, _, df in _file_sheets(data)} for side, data in [(1, data1), (2, data2)]}
+    marks = {side: {sheet: _empty_marks() for sheet in frames[side]} for side in frames}
+
+    for side, sheets, fill, note in [
+        (1, error_details["missing_sheets"], RED_FILL, "This sheet is missing in file 2"),
+        (2, error_details["extra_sheets"], GREEN_FILL, "This sheet is missing in file 1")
+    ]:
+        for sheet in sheets:
+            if sheet in marks[side]:
+                marks[side][sheet]["sheet"] = fill
+                marks[side][sheet]["notes"].append(note)
+
+    for sheet, col_diffs in error_details["column_differences"].items():
+        for side, columns, fill in [(1, col_diffs["missing"], RED_FILL), (2, col_diffs["extra"], GREEN_FILL)]:
+            if sheet not in marks[side]:
+                continue
+            df = frames[side][sheet]
+            for col_name in columns:
+                if col_name in df.columns:
+                    marks[side][sheet]["columns"][df.columns.get_loc(col_name) + 1] = fill  # +1 because openpyxl is 1-indexed
+
+            if col_diffs["reordered"]:
+                marks[side][sheet]["notes"].append("Column order is different between files")
+
+    for sheet, row_diffs in error_details["row_differences"].items():
+        for side, rows, fill in [(1, row_diffs["missing_rows"], RED_FILL), (2, row_diffs["extra_rows"], GREEN_FILL)]:
+            if sheet in marks[side]:
+                for row_idx in rows.values():
+                    marks[side][sheet]["rows"][int(row_idx) + 2] = fill  # +2 for header and 1-indexing
+
+    for sheet, value_diffs in error_details["value_differences"].items():
+        if not value_diffs or sheet not in frames[1] or sheet not in frames[2]:
+            continue
+        df1, df2 = frames[1][sheet], frames[2][sheet]
+
+        # Rows matched on their key are found through a key-to-row index of each side
+        keys = [diff["key"] for diff in value_diffs if "key" in diff]
+        if keys:
+            key_column = next(col for col in df1.columns if col in df2.columns)
+            positions = iter(zip(_key_positions(df1, key_column, keys), _key_positions(df2, key_column, keys)))
+
+        columns1 = {col: position + 1 for position, col in enumerate(df1.columns)}
+        columns2 = {col: position + 1 for position, col in enumerate(df2.columns)}
+
+        for diff in value_diffs:
+            # Rows matched by position have the same position on both sides
+            position1, position2 = next(positions) if "key" in diff else (diff["row"], diff["row"])
+            cell = {"fill": YELLOW_FILL, "value1": diff["value1"], "value2": diff["value2"]}
+
+            col_name = diff["column"]
+            if position1 >= 0 and col_name in columns1:
+                marks[1][sheet]["cells"][(int(position1) + 2, columns1[col_name])] = cell
+            if position2 >= 0 and col_name in columns2:
+                marks[2][sheet]["cells"][(int(position2) + 2, columns2[col_name])] = cell
+
+    return marks
+
+def _difference_comment(cell):
+    """Return the comment of a highlighted cell, with the value in each file"""
+    return f"Value in file 1: {cell['value1']}\nValue in file 2: {cell['value2']}"
+
+def _apply_marks(worksheet, marks, side_by_side=False):
+    """
+    Highlight a worksheet. Differing cells get a comment with both values, or
+    hold both values when side_by_side.
+    """
+    max_row = worksheet.max_row
+    max_column = worksheet.max_column
+
+    # Highlight the entire sheet
+    if marks["sheet"] is not None:
+        for row in worksheet.iter_rows():
+            for cell in row:
+                cell.fill = marks["sheet"]
+
+    # Highlight whole columns, then whole rows
+    for col_idx, fill in marks["columns"].items():
+        for row in range(1, max_row + 1):
+            worksheet.cell(row=row, column=col_idx).fill = fill
+
+    for row_idx, fill in marks["rows"].items():
+        # Check if the row exists in the worksheet
+        if row_idx <= max_row:
+            for col in range(1, max_column + 1):
+                worksheet.cell(row=row_idx, column=col).fill = fill
+
+    # Highlight value differences
+    for (row_idx, col_idx), mark in marks["cells"].items():
+        cell = worksheet.cell(row=row_idx, column=col_idx)
+        cell.fill = mark["fill"]
+        if side_by_side:
+            cell.value = f"{mark['value1']} → {mark['value2']}"
+        else:
+            cell.comment = Comment(_difference_comment(mark), COMMENT_AUTHOR)
+
+    # Add the notes to the first cell
+    if marks["notes"]:
+        worksheet.cell(row=1, column=1).comment = Comment("\n".join(marks["notes"]), COMMENT_AUTHOR)
+
+def _summary_rows(error_details, multi_sheet):
+    """
+    Build the rows of the summary sheet. Locations are prefixed with the sheet
+    name for multi-sheet files.
+    """
+    summary_data = []
+
+    def location(sheet, name):
+        return f"{sheet}.{name}" if multi_sheet else name
+
+    # Add missing and extra sheets
+    for sheet in error_details["missing_sheets"]:
+        summary_data.append(["Sheet", sheet, "Missing in file 2"])
+    for sheet in error_details["extra_sheets"]:
+        summary_data.append(["Sheet", sheet, "Extra in file 2"])
+
+    # Add column differences
+    for sheet, col_diffs in error_details["column_differences"].items():
+        for col in col_diffs["missing"]:
+            summary_data.append(["Column", location(sheet, col), "Missing in file 2"])
+        for col in col_diffs["extra"]:
+            summary_data.append(["Column", location(sheet, col), "Extra in file 2"])
+        if col_diffs["reordered"]:
+            summary_data.append(["Column Order", sheet, "Different between files"])
+
+    # Add row differences
+    for sheet, row_diffs in error_details["row_differences"].items():
+        if row_diffs["count_diff"]:
+            summary_data.append(["Row Count", sheet, f"{row_diffs['count_diff'][0]} in file 1, {row_diffs['count_diff'][1]} in file 2"])
+        for key in row_diffs["missing_rows"]:
+            summary_data.append(["Row", f"{sheet}.{key}" if multi_sheet else f"Key: {key}", "Missing in file 2"])
+        for key in row_diffs["extra_rows"]:
+            summary_data.append(["Row", f"{sheet}.{key}" if multi_sheet else f"Key: {key}", "Extra in file 2"])
+
+    # Add value differences
+    for sheet, value_diffs in error_details["value_differences"].items():
+        for diff in value_diffs:
+            identifier = diff["key"] if "key" in diff else f"row{diff['row']}"
+            summary_data.append(["Value", location(sheet, f"{identifier}.{diff['column']}"), f"{diff['value1']} vs {diff['value2']}"])
+
+    return summary_data
+
+def _write_workbook(sheets, summary_data):
+    """
+    Write (worksheet title, dataframe, marks, side_by_side) sheets and the
+    summary to a workbook and return it as bytes
+    """
+    output = BytesIO()
+
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for title, df, marks, side_by_side in sheets:
+            df.to_excel(writer, sheet_name=title, index=False)
+            _apply_marks(writer.sheets[title], marks, side_by_side)
+
+        if summary_data:
+            pd.DataFrame(summary_data, columns=SUMMARY_COLUMNS).to_excel(writer, sheet_name="Summary", index=False)
+
+    return output.getvalue()
+
+def _highlighted_workbook(data, marks, summary_data):
+    """Build the highlighted workbook of one file from its highlights"""
+    return _write_workbook(
+        [(title, df, marks[sheet], False) for sheet, title, df in _file_sheets(data)], summary_data
+    )
+
+def _multi_sheet(data):
+    """Check if a file data dictionary holds several sheets"""
+    return isinstance(data["data"], dict)
+
+def highlight_differences_excel(data1, data2, error_details, metrics=None):
     """
     Create a highlighted Excel file showing differences
     """
-    try:
-        # Create a new Excel file
-        output = BytesIO()
-
-        # Create a writer
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Process each sheet in data1
-            for sheet in data1["sheet_names"]:
-                # Get the dataframe for this sheet
-                df1 = data1["data"][sheet]
-
-                # Write the dataframe to the Excel file
-                df1.to_excel(writer, sheet_name=sheet, index=False)
-
-                # Get the worksheet
-                worksheet = writer.sheets[sheet]
-
-                # Highlight missing sheets
-                if sheet in error_details["missing_sheets"]:
-                    # Highlight the entire sheet
-                    for row in worksheet.iter_rows():
-                        for cell in row:
-                            cell.fill = RED_FILL
-
-                    # Add a note to the first cell
-                    first_cell = worksheet.cell(row=1, column=1)
-                    first_cell.comment = Comment("This sheet is missing in file 2", "Comparison Ability")
-
-                # Highlight column differences
-                if sheet in error_details["column_differences"]:
-                    col_diffs = error_details["column_differences"][sheet]
-
-                    # Highlight missing columns
-                    for col_name in col_diffs["missing"]:
-                        if col_name in df1.columns:
-                            col_idx = df1.columns.get_loc(col_name) + 1  # +1 because openpyxl is 1-indexed
-                            for row in range(1, worksheet.max_row + 1):
-                                cell = worksheet.cell(row=row, column=col_idx)
-                                cell.fill = RED_FILL
-
-                    # Add a note about reordered columns
-                    if col_diffs["reordered"]:
-                        first_cell = worksheet.cell(row=1, column=1)
-                        comment_text = "Column order is different between files"
-                        if first_cell.comment:
-                            comment_text = f"{first_cell.comment.text}\n{comment_text}"
-                        first_cell.comment = Comment(comment_text, "Comparison Ability")
-
-                # Highlight row differences
-                if sheet in error_details["row_differences"]:
-                    row_diffs = error_details["row_differences"][sheet]
-
-                    # Highlight missing rows
-                    for key, row_idx in row_diffs["missing_rows"].items():
-                        # Convert to 1-indexed for openpyxl
-                        row_idx = int(row_idx) + 2  # +2 for header and 1-indexing
-
-                        # Check if the row exists in the worksheet
-                        if row_idx <= worksheet.max_row:
-                            for col in range(1, worksheet.max_column + 1):
-                                cell = worksheet.cell(row=row_idx, column=col)
-                                cell.fill = RED_FILL
-
-                # Highlight value differences
-                if sheet in error_details["value_differences"]:
-                    value_diffs = error_details["value_differences"][sheet]
-
-                    for diff in value_diffs:
-                        if "key" in diff:
-                            # Find the row with this key
-                            key_col = df1.columns[0]  # Assume first column is key
-                            key = diff["key"]
-
-                            # Find the row index
-                            try:
-                                row_idx = df1.index[df1[key_col].astype(str) == key][0] + 2  # +2 for header and 1-indexing
-
-                                # Find the column index
-                                col_name = diff["column"]
-                                if col_name in df1.columns:
-                                    col_idx = df1.columns.get_loc(col_name) + 1  # +1 for 1-indexing
-
-                                    # Highlight the cell
-                                    cell = worksheet.cell(row=row_idx, column=col_idx)
-                                    cell.fill = YELLOW_FILL
-
-                                    # Add a comment with the difference
-                                    comment_text = f"Value in file 1: {diff['value1']}\nValue in file 2: {diff['value2']}"
-                                    cell.comment = Comment(comment_text, "Comparison Ability")
-                            except (IndexError, KeyError):
-                                # Skip if row not found
-                                pass
-                        else:
-                            # Use row index directly
-                            row_idx = diff["row"] + 2  # +2 for header and 1-indexing
-
-                            # Find the column index
-                            col_name = diff["column"]
-                            if col_name in df1.columns:
-                                col_idx = df1.columns.get_loc(col_name) + 1  # +1 for 1-indexing
-
-                                # Highlight the cell
-                                cell = worksheet.cell(row=row_idx, column=col_idx)
-                                cell.fill = YELLOW_FILL
-
-                                # Add a comment with the difference
-                                comment_text = f"Value in file 1: {diff['value1']}\nValue in file 2: {diff['value2']}"
-                                cell.comment = Comment(comment_text, "Comparison Ability")
-
-            # Add a summary sheet
-            summary_data = []
-
-            # Add missing sheets
-            for sheet in error_details["missing_sheets"]:
-                summary_data.append(["Sheet", sheet, "Missing in file 2"])
-
-            # Add extra sheets
-            for sheet in error_details["extra_sheets"]:
-                summary_data.append(["Sheet", sheet, "Extra in file 2"])
-
-            # Add column differences
-            for sheet, col_diffs in error_details["column_differences"].items():
-                for col in col_diffs["missing"]:
-                    summary_data.append(["Column", f"{sheet}.{col}", "Missing in file 2"])
-
-                for col in col_diffs["extra"]:
-                    summary_data.append(["Column", f"{sheet}.{col}", "Extra in file 2"])
-
-                if col_diffs["reordered"]:
-                    summary_data.append(["Column Order", sheet, "Different between files"])
-
-            # Add row differences
-            for sheet, row_diffs in error_details["row_differences"].items():
-                if row_diffs["count_diff"]:
-                    summary_data.append(["Row Count", sheet, f"{row_diffs['count_diff'][0]} in file 1, {row_diffs['count_diff'][1]} in file 2"])
-
-                for key in row_diffs["missing_rows"]:
-                    summary_data.append(["Row", f"{sheet}.{key}", "Missing in file 2"])
-
-                for key in row_diffs["extra_rows"]:
-                    summary_data.append(["Row", f"{sheet}.{key}", "Extra in file 2"])
-
-            # Add value differences
-            for sheet, value_diffs in error_details["value_differences"].items():
-                for diff in value_diffs:
-                    if "key" in diff:
-                        summary_data.append(["Value", f"{sheet}.{diff['key']}.{diff['column']}", f"{diff['value1']} vs {diff['value2']}"])
-                    else:
-                        summary_data.append(["Value", f"{sheet}.row{diff['row']}.{diff['column']}", f"{diff['value1']} vs {diff['value2']}"])
-
-            # Create a summary dataframe
-            if summary_data:
-                summary_df = pd.DataFrame(summary_data, columns=["Type", "Location", "Difference"])
-                summary_df.to_excel(writer, sheet_name="Summary", index=False)
-
-        # Return the Excel file as bytes
-        output.seek(0)
-        return output.getvalue()
-
-    except Exception as e:
-        print(f"Error highlighting Excel file: {str(e)}")
-        return None
-
-def highlight_differences_csv(data1, data2, error_details):
+    with track_stage(metrics, "highlighting", file=data1["name"]):
+        try:
+            marks = collect_highlights(data1, data2, error_details)
+            return _highlighted_workbook(data1, marks[1], _summary_rows(error_details, _multi_sheet(data1)))
+        except Exception as e:
+            print(f"Error highlighting Excel file: {str(e)}")
+            return None
+
+def highlight_differences_csv(data1, data2, error_details, metrics=None):
     """
     Create a highlighted Excel file from CSV showing differences
     """
-    try:
-        # Create a new Excel file
-        output = BytesIO()
-
-        # Create a writer
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Get the dataframe
-            df1 = data1["data"]
-
-            # Write the dataframe to the Excel file
-            df1.to_excel(writer, sheet_name="Data", index=False)
-
-            # Get the worksheet
-            worksheet = writer.sheets["Data"]
-
-            # Highlight column differences
-            if "data" in error_details["column_differences"]:
-                col_diffs = error_details["column_differences"]["data"]
-
-                # Highlight missing columns
-                for col_name in col_diffs["missing"]:
-                    if col_name in df1.columns:
-                        col_idx = df1.columns.get_loc(col_name) + 1  # +1 because openpyxl is 1-indexed
-                        for row in range(1, worksheet.max_row + 1):
-                            cell = worksheet.cell(row=row, column=col_idx)
-                            cell.fill = RED_FILL
-
-                # Add a note about reordered columns
-                if col_diffs["reordered"]:
-                    first_cell = worksheet.cell(row=1, column=1)
-                    comment_text = "Column order is different between files"
-                    first_cell.comment = Comment(comment_text, "Comparison Ability")
-
-            # Highlight row differences
-            if "data" in error_details["row_differences"]:
-                row_diffs = error_details["row_differences"]["data"]
-
-                # Highlight missing rows
-                for key, row_idx in row_diffs["missing_rows"].items():
-                    # Convert to 1-indexed for openpyxl
-                    row_idx = int(row_idx) + 2  # +2 for header and 1-indexing
-
-                    # Check if the row exists in the worksheet
-                    if row_idx <= worksheet.max_row:
-                        for col in range(1, worksheet.max_column + 1):
-                            cell = worksheet.cell(row=row_idx, column=col)
-                            cell.fill = RED_FILL
-
-            # Highlight value differences
-            if "data" in error_details["value_differences"]:
-                value_diffs = error_details["value_differences"]["data"]
-
-                for diff in value_diffs:
-                    if "key" in diff:
-                        # Find the row with this key
-                        key_col = df1.columns[0]  # Assume first column is key
-                        key = diff["key"]
-
-                        # Find the row index
-                        try:
-                            row_idx = df1.index[df1[key_col].astype(str) == key][0] + 2  # +2 for header and 1-indexing
-
-                            # Find the column index
-                            col_name = diff["column"]
-                            if col_name in df1.columns:
-                                col_idx = df1.columns.get_loc(col_name) + 1  # +1 for 1-indexing
-
-                                # Highlight the cell
-                                cell = worksheet.cell(row=row_idx, column=col_idx)
-                                cell.fill = YELLOW_FILL
-
-                                # Add a comment with the difference
-                                comment_text = f"Value in file 1: {diff['value1']}\nValue in file 2: {diff['value2']}"
-                                cell.comment = Comment(comment_text, "Comparison Ability")
-                        except (IndexError, KeyError):
-                            # Skip if row not found
-                            pass
-                    else:
-                        # Use row index directly
-                        row_idx = diff["row"] + 2  # +2 for header and 1-indexing
-
-                        # Find the column index
-                        col_name = diff["column"]
-                        if col_name in df1.columns:
-                            col_idx = df1.columns.get_loc(col_name) + 1  # +1 for 1-indexing
-
-                            # Highlight the cell
-                            cell = worksheet.cell(row=row_idx, column=col_idx)
-                            cell.fill = YELLOW_FILL
-
-                            # Add a comment with the difference
-                            comment_text = f"Value in file 1: {diff['value1']}\nValue in file 2: {diff['value2']}"
-                            cell.comment = Comment(comment_text, "Comparison Ability")
-
-            # Add a summary sheet
-            summary_data = []
-
-            # Add column differences
-            if "data" in error_details["column_differences"]:
-                col_diffs = error_details["column_differences"]["data"]
-
-                for col in col_diffs["missing"]:
-                    summary_data.append(["Column", col, "Missing in file 2"])
-
-                for col in col_diffs["extra"]:
-                    summary_data.append(["Column", col, "Extra in file 2"])
-
-                if col_diffs["reordered"]:
-                    summary_data.append(["Column Order", "data", "Different between files"])
-
-            # Add row differences
-            if "data" in error_details["row_differences"]:
-                row_diffs = error_details["row_differences"]["data"]
-
-                if row_diffs["count_diff"]:
-                    summary_data.append(["Row Count", "data", f"{row_diffs['count_diff'][0]} in file 1, {row_diffs['count_diff'][1]} in file 2"])
-
-                for key in row_diffs["missing_rows"]:
-                    summary_data.append(["Row", f"Key: {key}", "Missing in file 2"])
-
-                for key in row_diffs["extra_rows"]:
-                    summary_data.append(["Row", f"Key: {key}", "Extra in file 2"])
-
-            # Add value differences
-            if "data" in error_details["value_differences"]:
-                value_diffs = error_details["value_differences"]["data"]
-
-                for diff in value_diffs:
-                    if "key" in diff:
-                        summary_data.append(["Value", f"{diff['key']}.{diff['column']}", f"{diff['value1']} vs {diff['value2']}"])
-                    else:
-                        summary_data.append(["Value", f"row{diff['row']}.{diff['column']}", f"{diff['value1']} vs {diff['value2']}"])
-
-            # Create a summary dataframe
-            if summary_data:
-                summary_df = pd.DataFrame(summary_data, columns=["Type", "Location", "Difference"])
-                summary_df.to_excel(writer, sheet_name="Summary", index=False)
-
-        # Return the Excel file as bytes
-        output.seek(0)
-        return output.getvalue()
-
-    except Exception as e:
-        print(f"Error highlighting CSV file: {str(e)}")
-        return None
\ No newline at end of file
+    with track_stage(metrics, "highlighting", file=data1["name"]):
+        try:
+            marks = collect_highlights(data1, data2, error_details)
+            return _highlighted_workbook(data1, marks[1], _summary_rows(error_details, _multi_sheet(data1)))
+        except Exception as e:
+            print(f"Error highlighting CSV file: {str(e)}")
+            return None
+
+def highlight_both_files(data1, data2, error_details, metrics=None):
+    """
+    Create the highlighted workbooks of both files from one pass over the
+    differences (see collect_highlights). File 2 shows its extra sheets,
+    columns and rows in green. Returns the two workbooks as bytes, or
+    (None, None) on error.
+    """
+    with track_stage(metrics, "highlighting", file=f"{data1['name']} and {data2['name']}"):
+        try:
+            marks = collect_highlights(data1, data2, error_details)
+            summary_data = _summary_rows(error_details, _multi_sheet(data1))
+            return (
+                _highlighted_workbook(data1, marks[1], summary_data),
+                _highlighted_workbook(data2, marks[2], summary_data)
+            )
+        except Exception as e:
+            print(f"Error highlighting files: {str(e)}")
+            return None, None
+
+def highlight_side_by_side(data1, data2, error_details, metrics=None):
+    """
+    Create one workbook combining both files: each sheet of file 1 with its
+    differing cells holding "value in file 1 → value in file 2" in yellow, its
+    missing rows and columns in red and the rows extra in file 2 added below in
+    green. Returns the workbook as bytes, or None on error.
+    """
+    with track_stage(metrics, "highlighting", file=f"{data1['name']} vs {data2['name']}"):
+        try:
+            marks = collect_highlights(data1, data2, error_details)
+            frames2 = {sheet: df for sheet, _, df in _file_sheets(data2)}
+
+            sheets = []
+            for sheet, title, df1 in _file_sheets(data1):
+                sheet_marks = marks[1][sheet]
+                extra_rows = error_details["row_differences"].get(sheet, {}).get("extra_rows", {})
+
+                # Add the rows only in file 2 below the rows of file 1, in the columns of file 1
+                if extra_rows and sheet in frames2:
+                    extra = frames2[sheet].iloc[sorted(int(row) for row in extra_rows.values())]
+                    extra = extra.reindex(columns=df1.columns)
+                    sheet_marks = {
+                        **sheet_marks,
+                        "rows": {
+                            **sheet_marks["rows"],
+                            **{len(df1) + 2 + position: GREEN_FILL for position in range(len(extra))}
+                        }
+                    }
+                    df1 = pd.concat([df1, extra], ignore_index=True)
+
+                sheets.append((title, df1, sheet_marks, True))
+
+            return _write_workbook(sheets, _summary_rows(error_details, _multi_sheet(data1)))
+        except Exception as e:
+            print(f"Error building the side by side workbook: {str(e)}")
+            return None
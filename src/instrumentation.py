@@ -0,0 +1,124 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # The resource module is not available on Windows
+    resource = None
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB, or None if unknown"""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+# Guards the stage list of metrics shared by concurrent reads
+_metrics_lock = threading.Lock()
+
+def create_metrics():
+    """Create an empty metrics dictionary to pass through a comparison run"""
+    return {
+        "stages": [],
+        "peak_rss_mb": None
+    }
+
+@contextmanager
+def track_stage(metrics, stage, **labels):
+    """
+    Time a stage of a comparison run and record it in the metrics dictionary.
+
+    The yielded record can be updated with counts (rows, differences, ...).
+    A stage with the same name and labels replaces the earlier record, so
+    repeated runs do not accumulate. When metrics is None nothing is recorded.
+    """
+    record = {"stage": stage, **labels}
+
+    if metrics is None:
+        yield record
+        return
+
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        record["peak_rss_mb"] = peak_rss_mb()
+
+        # Replace an earlier record of the same stage
+        with _metrics_lock:
+            metrics["stages"] = [
+                existing for existing in metrics["stages"]
+                if not (existing["stage"] == stage and all(existing.get(k) == v for k, v in labels.items()))
+            ]
+            metrics["stages"].append(record)
+            metrics["peak_rss_mb"] = record["peak_rss_mb"]
+
+def metrics_to_json(metrics):
+    """Serialize a metrics dictionary to JSON"""
+    return json.dumps(metrics, indent=2, default=str)
+
+def _no_progress(**fields):
+    """Progress reporter used when no callback is given"""
+
+def progress_tracker(callback, phase, **fields):
+    """
+    Return a function that accumulates processed sheets, rows and bytes and
+    reports them to the progress callback.
+
+    The returned function is called as advance(sheets=0, rows=0, nbytes=0, **fields)
+    with the amounts processed since the last call; extra fields (sheet, stage,
+    sheets_total, ...) replace the current values. The callback receives a
+    dictionary with the phase, the totals so far, the elapsed time, the rows
+    and bytes per second, the fraction done and an ETA in seconds (None until
+    it can be estimated). When callback is None nothing is reported.
+    """
+    if callback is None:
+        return _no_progress
+
+    start = time.perf_counter()
+    state = {
+        "phase": phase,
+        "sheets_done": 0,
+        "sheets_total": None,
+        "rows_done": 0,
+        "rows_total": None,
+        "bytes_done": 0,
+        "bytes_total": None,
+        **fields
+    }
+
+    def advance(sheets=0, rows=0, nbytes=0, **fields):
+        state["sheets_done"] += sheets
+        state["rows_done"] += rows
+        state["bytes_done"] += nbytes
+        state.update(fields)
+
+        elapsed = time.perf_counter() - start
+
+        # Estimate the fraction done from the most precise total available
+        fraction = None
+        for done, total in [("rows_done", "rows_total"), ("sheets_done", "sheets_total"), ("bytes_done", "bytes_total")]:
+            if state[total]:
+                fraction = min(state[done] / state[total], 1.0)
+                break
+
+        callback({
+            **state,
+            "elapsed_seconds": elapsed,
+            "rows_per_second": state["rows_done"] / elapsed if elapsed > 0 else None,
+            "bytes_per_second": state["bytes_done"] / elapsed if elapsed > 0 else None,
+            "fraction": fraction,
+            "eta_seconds": elapsed * (1 - fraction) / fraction if fraction else None
+        })
+
+    return advance
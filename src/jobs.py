@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of comparisons that can run at the same time across all sessions
+MAX_WORKERS = int(os.environ.get("DATA_INTEGRITY_MAX_JOBS", "4"))
+
+# Seconds a finished job is kept before it is removed from the registry
+JOB_TTL_SECONDS = int(os.environ.get("DATA_INTEGRITY_JOB_TTL", "3600"))
+
+# Job states
+JOB_STATUSES = ["queued", "running", "done", "failed", "cancelled"]
+
+# Registry of jobs keyed by job id, shared by every session of the server
+_jobs = {}
+_lock = threading.Lock()
+_executor = None
+
+def _get_executor():
+    """Return the shared worker pool, creating it on first use"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="comparison-job")
+        return _executor
+
+def _run_job(job_id, func, args, kwargs):
+    """Run a job function and record its result or error"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] == "cancelled":
+            return
+        job["status"] = "running"
+        job["started"] = time.time()
+
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        with _lock:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            job["traceback"] = traceback.format_exc()
+            job["finished"] = time.time()
+        return
+
+    with _lock:
+        job["status"] = "done"
+        job["result"] = result
+        job["finished"] = time.time()
+
+def submit_job(func, *args, track_progress=False, **kwargs):
+    """
+    Run func(*args, **kwargs) in the background worker pool and return the job id.
+
+    The arguments must not be shared with other jobs or sessions, since the job
+    reads them from a worker thread while the caller carries on. With
+    track_progress, func is also given a progress callback that stores the
+    latest progress event on the job.
+    """
+    cleanup_jobs()
+
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _jobs[job_id] = {
+            "id": job_id,
+            "status": "queued",
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "traceback": None,
+            "future": None
+        }
+
+    if track_progress:
+        kwargs["progress"] = lambda event: update_job(job_id, progress=event)
+
+    future = _get_executor().submit(_run_job, job_id, func, args, kwargs)
+    with _lock:
+        _jobs[job_id]["future"] = future
+
+    return job_id
+
+def get_job(job_id):
+    """
+    Return a snapshot of a job, or None if the job id is unknown or expired
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        return {key: value for key, value in job.items() if key != "future"}
+
+def update_job(job_id, **fields):
+    """Update fields of a running job, such as its progress"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+def cancel_job(job_id):
+    """
+    Cancel a job that has not started yet. Returns True if it was cancelled.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] != "queued":
+            return False
+        job["status"] = "cancelled"
+        job["finished"] = time.time()
+        future = job["future"]
+
+    if future is not None:
+        future.cancel()
+    return True
+
+def remove_job(job_id):
+    """Remove a job and its result from the registry"""
+    with _lock:
+        _jobs.pop(job_id, None)
+
+def cleanup_jobs(ttl=None):
+    """Remove finished jobs older than the time to live"""
+    ttl = JOB_TTL_SECONDS if ttl is None else ttl
+    now = time.time()
+    with _lock:
+        expired = [
+            job_id for job_id, job in _jobs.items()
+            if job["finished"] is not None and now - job["finished"] > ttl
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
@@ -0,0 +1,267 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.file_handler import read_file
+from src.comparison import compare_columns, string_keys, values_differ
+from src.instrumentation import track_stage, progress_tracker
+
+def _sheets(data):
+    """Return the sheets of a file data dictionary, naming single tables "data\""""
+    if isinstance(data["data"], dict):
+        return data["data"]
+    return {"data": data["data"]} if data["data"] is not None else {}
+
+def _column_hashes(values):
+    """Return a 64-bit hash of every value of a column"""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+def index_baseline(data, metrics=None):
+    """
+    Build the lookup structures of a baseline file once, for comparing it with
+    many candidates.
+
+    For each sheet, keeps the dataframe, its key column (the first column) as
+    strings, an index of the keys, whether the keys are unique and a hash of
+    every value of every column.
+    """
+    sheets = {}
+
+    with track_stage(metrics, "index_baseline", file=data["name"]) as record:
+        for sheet_name, df in _sheets(data).items():
+            key_column = df.columns[0] if len(df.columns) else None
+            keys = string_keys(df, key_column) if key_column is not None else None
+            sheets[sheet_name] = {
+                "df": df,
+                "key_column": key_column,
+                "keys": keys,
+                "key_index": pd.Index(keys) if keys is not None else None,
+                "unique_keys": keys is not None and not keys.duplicated().any(),
+                "hashes": {col: _column_hashes(df[col]) for col in df.columns}
+            }
+        record["sheets"] = len(sheets)
+
+    return {"name": data["name"], "type": data["type"], "data": data, "sheets": sheets}
+
+def _align_to_baseline(sheet, df, key_column):
+    """
+    Pair the rows of a candidate sheet with the rows of the baseline sheet.
+
+    Rows are matched on the key column when its values are unique on both sides,
+    and by position otherwise, as in align_rows. Returns the row positions in
+    the baseline and in the candidate, in baseline order, and the missing and
+    extra row counts (0 when rows are paired by position, where only the row
+    counts can differ).
+    """
+    base_df = sheet["df"]
+
+    # The baseline key index is reused when the key column is the baseline's own
+    if key_column == sheet["key_column"]:
+        key_index, unique_keys = sheet["key_index"], sheet["unique_keys"]
+    else:
+        keys = string_keys(base_df, key_column)
+        key_index, unique_keys = pd.Index(keys), not keys.duplicated().any()
+
+    keys = string_keys(df, key_column)
+    if not (unique_keys and not keys.duplicated().any()):
+        positions = np.arange(min(len(base_df), len(df)))
+        return positions, positions, 0, 0
+
+    # Look up every candidate key in the baseline index
+    base_positions = key_index.get_indexer(keys)
+    matched = base_positions >= 0
+    positions2 = np.flatnonzero(matched)
+    positions1 = base_positions[matched]
+
+    order = np.argsort(positions1, kind="stable")
+    return positions1[order], positions2[order], len(base_df) - len(positions1), int((~matched).sum())
+
+def _differing_values(sheet, df, col, positions1, positions2):
+    """
+    Return a boolean mask of the paired rows whose values differ in one column.
+
+    Columns of the same type on both sides are first compared by their hashes;
+    only the rows whose hashes differ are compared value by value, with the
+    same rules as compare_values.
+    """
+    values1 = sheet["df"][col]
+    values2 = df[col]
+
+    if values1.dtype != values2.dtype:
+        return values_differ(values1.take(positions1), values2.take(positions2))
+
+    candidates = np.flatnonzero(sheet["hashes"][col][positions1] != _column_hashes(values2)[positions2])
+    mask = np.zeros(len(positions1), dtype=bool)
+    if len(candidates):
+        mask[candidates] = values_differ(
+            values1.take(positions1[candidates]), values2.take(positions2[candidates])
+        )
+    return mask
+
+def compare_candidate(baseline, data):
+    """
+    Compare a candidate file with an indexed baseline (see index_baseline).
+
+    Returns the candidate name, its file type when it differs from the baseline,
+    the sheets missing from and extra in the candidate and, for each common
+    sheet, the column differences, the row counts when they differ (as
+    count_diff in compare_rows), the missing and extra row counts, the number
+    of rows with a differing value and the number of differing values per
+    column.
+    """
+    sheets = _sheets(data)
+    result = {
+        "name": data["name"],
+        "type_change": [baseline["type"], data["type"]] if baseline["type"] != data["type"] else None,
+        "missing_sheets": [sheet for sheet in baseline["sheets"] if sheet not in sheets],
+        "extra_sheets": [sheet for sheet in sheets if sheet not in baseline["sheets"]],
+        "sheets": {}
+    }
+
+    for sheet_name, sheet in baseline["sheets"].items():
+        if sheet_name not in sheets:
+            continue
+        df = sheets[sheet_name]
+        count_diff = [len(sheet["df"]), len(df)]
+
+        sheet_result = {
+            "column_differences": compare_columns(sheet["df"], df),
+            "count_diff": count_diff if count_diff[0] != count_diff[1] else None,
+            "missing_rows": 0,
+            "extra_rows": 0,
+            "differing_rows": 0,
+            "value_difference_counts": {}
+        }
+        result["sheets"][sheet_name] = sheet_result
+
+        common_columns = [col for col in sheet["df"].columns if col in df.columns]
+        if not common_columns:
+            continue
+
+        positions1, positions2, missing, extra = _align_to_baseline(sheet, df, common_columns[0])
+        sheet_result["missing_rows"] = missing
+        sheet_result["extra_rows"] = extra
+
+        differing_rows = np.zeros(len(positions1), dtype=bool)
+        for col in common_columns:
+            mask = _differing_values(sheet, df, col, positions1, positions2)
+            differing_rows |= mask
+            if mask.any():
+                sheet_result["value_difference_counts"][col] = int(mask.sum())
+        sheet_result["differing_rows"] = int(differing_rows.sum())
+
+    return result
+
+def candidate_total(result):
+    """Return the number of differences found in a candidate"""
+    total = len(result["missing_sheets"]) + len(result["extra_sheets"]) + (1 if result["type_change"] else 0)
+    for sheet in result["sheets"].values():
+        columns = sheet["column_differences"]
+        total += len(columns["missing"]) + len(columns["extra"]) + (1 if columns["reordered"] else 0)
+        total += 1 if sheet["count_diff"] else 0
+        total += sheet["missing_rows"] + sheet["extra_rows"] + sum(sheet["value_difference_counts"].values())
+    return total
+
+def difference_matrix(results):
+    """
+    Build the matrix of which candidate differs where.
+
+    Returns a dataframe with one row per candidate and one column per place a
+    difference was found: "<sheet>: <column>" for differing values and
+    "<sheet>: row count", "missing rows", "extra rows", "missing columns",
+    "extra columns", "column order", "missing sheet" and "extra sheet" for structural
+    differences. Cells hold the number of differences (0 where the candidate
+    matches the baseline).
+    """
+    rows = []
+    for result in results:
+        row = {}
+        for sheet in result["missing_sheets"]:
+            row[f"{sheet}: missing sheet"] = 1
+        for sheet in result["extra_sheets"]:
+            row[f"{sheet}: extra sheet"] = 1
+
+        for sheet_name, sheet in result["sheets"].items():
+            columns = sheet["column_differences"]
+            structure = {
+                "missing columns": len(columns["missing"]),
+                "extra columns": len(columns["extra"]),
+                "column order": 1 if columns["reordered"] else 0,
+                "row count": 1 if sheet["count_diff"] else 0,
+                "missing rows": sheet["missing_rows"],
+                "extra rows": sheet["extra_rows"]
+            }
+            for label, count in structure.items():
+                if count:
+                    row[f"{sheet_name}: {label}"] = count
+            for col, count in sheet["value_difference_counts"].items():
+                row[f"{sheet_name}: {col}"] = count
+
+        rows.append(row)
+
+    matrix = pd.DataFrame(rows, index=[result["name"] for result in results]).fillna(0).astype(int)
+    matrix.insert(0, "total", [candidate_total(result) for result in results])
+    return matrix
+
+def _unique_names(names):
+    """Number repeated candidate names so each matrix row has its own label"""
+    seen = {}
+    unique = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append(name if seen[name] == 1 else f"{name} ({seen[name]})")
+    return unique
+
+def compare_many(baseline_file, candidate_files, dtype_backend=None, scope=None, workers=None, metrics=None, progress=None):
+    """
+    Compare many candidate files against one baseline file.
+
+    The baseline is read and indexed once (see index_baseline); the candidates
+    are then read and compared in a pool of worker threads (workers defaults to
+    the CPU count), all sharing the baseline. Returns the baseline name, the
+    result of each candidate in input order (see compare_candidate) and the
+    difference matrix (see difference_matrix). progress is an optional callback
+    that receives the candidates compared so far.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with track_stage(metrics, "compare_many", candidates=len(candidate_files)) as record:
+        baseline = index_baseline(
+            read_file(baseline_file, metrics, dtype_backend=dtype_backend, scope=scope, side="baseline"), metrics
+        )
+
+        # Each candidate counts as the baseline's sheets
+        advance = progress_tracker(
+            progress, "comparing", sheets_total=len(candidate_files) * max(len(baseline["sheets"]), 1)
+        )
+        progress_lock = threading.Lock()
+
+        # Candidates are labelled by position, since several can share a name
+        def compare(file, side):
+            data = read_file(file, metrics, dtype_backend=dtype_backend, sheet_workers=1, scope=scope, side=side)
+            with track_stage(metrics, "compare_candidate", candidate=data["name"], side=side) as candidate_record:
+                result = compare_candidate(baseline, data)
+                candidate_record["differences"] = candidate_total(result)
+            with progress_lock:
+                advance(sheets=max(len(baseline["sheets"]), 1), candidate=data["name"])
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(candidate_files))), thread_name_prefix="candidate") as executor:
+            sides = [f"candidate{number}" for number in range(1, len(candidate_files) + 1)]
+            results = list(executor.map(compare, candidate_files, sides))
+
+        for result, name in zip(results, _unique_names([result["name"] for result in results])):
+            result["name"] = name
+
+        matrix = difference_matrix(results)
+        record["differing_candidates"] = int((matrix["total"] > 0).sum())
+
+    return {
+        "baseline": baseline["name"],
+        "candidates": results,
+        "matrix": matrix
+    }
@@ -0,0 +1,318 @@
+import codecs
+import csv
+import io
+import mmap
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from src.instrumentation import track_stage
+
+# Bytes read from the start of a CSV file to detect its encoding and delimiter
+SNIFF_BYTES = 64 * 1024
+
+# Delimiters a CSV file is checked for, the first being used when none is found
+CSV_DELIMITERS = ",;\t|"
+
+# CSV files smaller than this are parsed in one process, since starting worker
+# processes would take longer than the parse
+PARALLEL_CSV_MIN_BYTES = 64 * 1024 * 1024
+
+# Smallest range of a CSV file parsed by one worker task
+MIN_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Ranges given to each worker, so workers that finish early pick up more work
+CHUNKS_PER_WORKER = 4
+
+# Modules imported once by the process workers are forked from, so each worker
+# starts with pandas and the parsers already loaded
+WORKER_PRELOAD = ["src.file_handler"]
+
+def worker_context():
+    """
+    Return the multiprocessing context of the worker pools.
+
+    Workers are forked from a single-threaded server process that preloads
+    WORKER_PRELOAD (forkserver), so they start in milliseconds instead of
+    importing pandas again, and the threaded server process is never forked.
+    Workers are spawned where forkserver is not available (Windows).
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(WORKER_PRELOAD)
+    return context
+
+def sniff_encoding(sample):
+    """
+    Guess the encoding of a CSV file from its first bytes: a byte order mark,
+    then UTF-8, then Windows-1252 for files exported by older spreadsheet
+    software and Latin-1, which decodes any byte.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    for encoding in ["utf-8", "cp1252"]:
+        try:
+            sample.decode(encoding)
+            return encoding
+        except UnicodeDecodeError as e:
+            # A character cut off at the end of a sample that stops short of
+            # the end of the file is still valid
+            if encoding == "utf-8" and len(sample) == SNIFF_BYTES and e.start >= len(sample) - 3:
+                return encoding
+    return "latin-1"
+
+def sniff_csv(sample):
+    """
+    Detect the encoding and delimiter of a CSV file from its first bytes.
+
+    Returns {"encoding", "delimiter"}. The delimiter is one of CSV_DELIMITERS,
+    defaulting to a comma when the sample does not show one.
+    """
+    encoding = sniff_encoding(sample)
+    text = sample.decode(encoding, errors="ignore")
+
+    # Leave out a last line cut off by the end of the sample
+    lines = text.splitlines()
+    if len(sample) >= SNIFF_BYTES and len(lines) > 1:
+        lines = lines[:-1]
+
+    try:
+        delimiter = csv.Sniffer().sniff("\n".join(lines), delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = CSV_DELIMITERS[0]
+
+    # The header must contain the delimiter, unless the file has a single column
+    if lines and delimiter not in lines[0]:
+        delimiter = CSV_DELIMITERS[0]
+
+    return {"encoding": encoding, "delimiter": delimiter}
+
+def can_split(options):
+    """Check if a CSV file can be split at line breaks found in its bytes"""
+    return options["encoding"] != "utf-16"
+
+def _find_row_end(buffer, start, end, search):
+    """
+    Return the position after the first line break at or after search that is
+    not inside a quoted value, counting quotes from start, or end if there is
+    none
+    """
+    in_quotes = False
+    scanned = start
+
+    while True:
+        newline = buffer.find(b"\n", search, end)
+        if newline == -1:
+            return end
+
+        # Doubled quotes inside a value keep the count even, so an odd count
+        # means the line break is inside a value
+        in_quotes ^= buffer[scanned:newline].count(b'"') % 2 == 1
+        if not in_quotes:
+            return newline + 1
+        scanned = newline
+        search = newline + 1
+
+def split_rows(buffer, start, end, chunk_bytes):
+    """
+    Split the bytes of a CSV file between start and end into (start, end)
+    ranges of about chunk_bytes that each hold whole rows. Line breaks inside
+    quoted values are not treated as row ends.
+    """
+    ranges = []
+    while start < end:
+        range_end = _find_row_end(buffer, start, end, min(start + chunk_bytes, end))
+        ranges.append((start, range_end))
+        start = range_end
+    return ranges
+
+def _header_end(buffer, size):
+    """Return the position where the rows after the header of a CSV file start"""
+    return _find_row_end(buffer, 0, size, 0)
+
+def read_csv_header(buffer, size, options):
+    """Return the column names of a CSV file, as pandas names them"""
+    header = bytes(buffer[:_header_end(buffer, size)])
+    return list(pd.read_csv(
+        io.BytesIO(header), nrows=0, sep=options["delimiter"], encoding=options["encoding"]
+    ).columns)
+
+def _parse_range(source, start, end, names, usecols, options, dtype_backend, text_columns=()):
+    """
+    Parse a range of rows of a CSV file, in a worker process. source is the
+    path of the file, or the bytes of the range for in-memory files.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+    else:
+        data = source
+
+    reader_options = {"dtype_backend": "pyarrow"} if dtype_backend == "pyarrow" else {}
+    return pd.read_csv(
+        io.BytesIO(data), header=None, names=names, usecols=usecols,
+        sep=options["delimiter"], encoding=options["encoding"],
+        dtype={col: str for col in text_columns} or None, **reader_options
+    )
+
+def _text_dtype(dtype_backend):
+    """Return the dtype of text columns in the in-memory representation"""
+    if dtype_backend == "pyarrow":
+        import pyarrow as pa
+        return pd.ArrowDtype(pa.string())
+    return "object"
+
+def _float_dtype(dtype_backend):
+    """Return the dtype of floating point columns in the in-memory representation"""
+    if dtype_backend == "pyarrow":
+        import pyarrow as pa
+        return pd.ArrowDtype(pa.float64())
+    return "float64"
+
+def _is_number(dtype):
+    """Check if a dtype holds numbers (not booleans)"""
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+def _is_boolean(values):
+    """Check if a parsed column holds only booleans, as a boolean column or as objects next to empty values"""
+    return pd.api.types.infer_dtype(values, skipna=True) == "boolean"
+
+def unify_dtypes(chunks, dtype_backend="numpy"):
+    """
+    Choose one dtype per column for dataframes parsed from parts of one file.
+
+    Columns parsed with the same dtype wherever they have values keep it;
+    numbers parsed as integers in some parts and floats in others become
+    floats; booleans parsed as booleans in some parts and as objects (next to
+    empty values) in others become objects holding booleans; any other mix
+    (numbers and text, say) can only be represented as text and is returned in
+    the set of columns to parse again as text. Parts where a column is empty
+    are cast to the chosen dtype, as a single parse would give. Returns the dtypes by column and the columns to parse as text.
+    """
+    dtypes = {}
+    text_columns = set()
+
+    for col in chunks[0].columns:
+        values = [chunk[col] for chunk in chunks if chunk[col].notna().any()]
+        parsed = [series.dtype for series in values]
+        has_empty = len(parsed) < len(chunks)
+
+        if not parsed or all(dtype == parsed[0] for dtype in parsed):
+            dtype = parsed[0] if parsed else None
+        elif all(_is_number(dtype) for dtype in parsed):
+            dtype = _float_dtype(dtype_backend)
+        elif all(_is_boolean(series) for series in values):
+            dtype = "object"
+        else:
+            text_columns.add(col)
+            continue
+
+        if dtype is None:
+            continue
+
+        # Empty values turn integer and boolean columns into floats and objects
+        # in a single numpy parse; Arrow-backed columns keep their type
+        if has_empty and dtype_backend != "pyarrow":
+            if pd.api.types.is_integer_dtype(dtype):
+                dtype = _float_dtype(dtype_backend)
+            elif pd.api.types.is_bool_dtype(dtype):
+                dtype = "object"
+        dtypes[col] = dtype
+
+    return dtypes, text_columns
+
+def read_csv_parallel(source, workers, options, usecols=None, dtype_backend="numpy", metrics=None, name=None, chunk_bytes=None,
+                      advance=None, side=None):
+    """
+    Parse a large CSV file in a pool of worker processes and return it as one
+    dataframe.
+
+    source is a local path, which each worker reads its own range of, or the
+    bytes of the file. The file is split at line breaks outside quoted values
+    (see split_rows), the ranges are parsed in parallel with the encoding and
+    delimiter in options (see sniff_csv) and the parts are joined with one
+    dtype per column (see unify_dtypes). usecols gives the positions of the
+    columns to keep. advance, when given, receives the rows and bytes of each
+    range as it is parsed. name and side label the stage recorded in metrics
+    (see read_file).
+    """
+    if isinstance(source, str):
+        f = open(source, "rb")
+        size = f.seek(0, io.SEEK_END)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+    else:
+        f = None
+        size = len(source)
+        buffer = source
+
+    try:
+        names = read_csv_header(buffer, size, options)
+        start = _header_end(buffer, size)
+        if chunk_bytes is None:
+            chunk_bytes = max(-(-(size - start) // (workers * CHUNKS_PER_WORKER)), MIN_CHUNK_BYTES)
+        ranges = split_rows(buffer, start, size, chunk_bytes)
+    finally:
+        if f is not None:
+            if size:
+                buffer.close()
+            f.close()
+
+    # Workers read ranges of local files themselves; in-memory files are sent in ranges
+    def range_source(range_start, range_end):
+        return source if isinstance(source, str) else source[range_start:range_end]
+
+    if not ranges:
+        return pd.DataFrame(columns=names if usecols is None else [names[position] for position in usecols])
+
+    context = worker_context()
+    workers = min(workers, len(ranges))
+
+    with track_stage(metrics, "parse_csv_chunks", file=name, side=side, workers=workers, chunks=len(ranges)) as record:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(_parse_range, range_source(*byte_range), *byte_range, names, usecols, options, dtype_backend)
+                for byte_range in ranges
+            ]
+            chunks = []
+            for future, (range_start, range_end) in zip(futures, ranges):
+                chunks.append(future.result())
+                if advance is not None:
+                    advance(rows=len(chunks[-1]), nbytes=range_end - range_start)
+
+            # Parse the columns whose parts disagree on their type again as text
+            dtypes, text_columns = unify_dtypes(chunks, dtype_backend)
+            if text_columns:
+                reparse = [
+                    index for index, chunk in enumerate(chunks)
+                    if any(chunk[col].dtype != _text_dtype(dtype_backend) for col in text_columns)
+                ]
+                futures = {
+                    index: executor.submit(
+                        _parse_range, range_source(*ranges[index]), *ranges[index], names, usecols, options,
+                        dtype_backend, sorted(text_columns)
+                    )
+                    for index in reparse
+                }
+                for index, future in futures.items():
+                    chunks[index] = future.result()
+                dtypes.update({col: _text_dtype(dtype_backend) for col in text_columns})
+
+        record["text_columns"] = len(text_columns)
+
+        # Give every part the same dtypes before joining them
+        for index, chunk in enumerate(chunks):
+            casts = {col: dtype for col, dtype in dtypes.items() if chunk[col].dtype != dtype}
+            if casts:
+                chunks[index] = chunk.astype(casts)
+
+        df = pd.concat(chunks, ignore_index=True)
+        record["rows"] = len(df)
+
+    return df
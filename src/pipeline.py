@@ -0,0 +1,83 @@
+from src.file_handler import read_files, shared_columns, describe_file
+from src.comparison import compare_files
+from src.sql_backend import compare_files_sql
+from src.streaming import compare_files_sorted
+from src.instrumentation import create_metrics, track_stage
+from src.profiling import profile_run
+from src.result_store import save_result
+
+# Settings used when a run does not specify them
+DEFAULT_SETTINGS = {
+    "record_performance": False,
+    "profile_mode": None,
+    "backend": "pandas",
+    "sql_engine": None,
+    "database": None,
+    "key_order": "auto",
+    "dtype_backend": None,
+    "sheet_workers": None,
+    "scope": None,
+    "limits": None
+}
+
+def run_comparison(file1, file2, settings=None, progress=None):
+    """
+    Read and compare two files with the given settings.
+
+    Runs without any Streamlit calls so it can execute in a background job or
+    from the command line. Returns a dictionary with the detailed report,
+    summary report, error details, both file data dictionaries and the profile
+    artifact (None when the run was not profiled). progress is an optional
+    callback that receives the reading and comparing progress of the pandas
+    and sorted backends (see progress_tracker).
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+
+    # Only collect metrics when requested
+    metrics = create_metrics() if settings["record_performance"] else None
+
+    with profile_run(settings["profile_mode"]) as artifact, track_stage(metrics, "total"):
+        if settings["backend"] == "sql":
+            # Compare the files in an on-disk database without loading them
+            data1 = describe_file(file1)
+            data2 = describe_file(file2)
+            detailed_report, summary_report, error_details = compare_files_sql(
+                file1, file2, settings["limits"], settings["sql_engine"], settings["database"],
+                metrics=metrics, scope=settings["scope"]
+            )
+        elif settings["backend"] == "sorted":
+            # Merge-join inputs sorted by key while streaming them in chunks
+            data1 = describe_file(file1)
+            data2 = describe_file(file2)
+            detailed_report, summary_report, error_details = compare_files_sorted(
+                file1, file2, settings["limits"], key_order=settings["key_order"],
+                metrics=metrics, progress=progress, scope=settings["scope"]
+            )
+        else:
+            # Read both files at the same time, loading only the shared columns of columnar files
+            columns = shared_columns(file1, file2)
+            data1, data2 = read_files(
+                file1, file2, metrics, columns, settings["dtype_backend"], progress,
+                settings["sheet_workers"], settings["scope"], serial=artifact["mode"] is not None
+            )
+
+            # Compare files
+            detailed_report, summary_report, error_details = compare_files(
+                data1, data2, metrics, settings["limits"], progress
+            )
+
+    return {
+        "detailed_report": detailed_report,
+        "summary_report": summary_report,
+        "error_details": error_details,
+        "data1": data1,
+        "data2": data2,
+        "profile_artifact": artifact if artifact["data"] else None
+    }
+
+def run_comparison_to_store(file1, file2, settings=None, progress=None):
+    """
+    Run a comparison and save its result to the result store, returning the
+    handle to load it with
+    """
+    return save_result(run_comparison(file1, file2, settings, progress))
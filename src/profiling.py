@@ -0,0 +1,123 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+from contextlib import contextmanager
+
+# Environment variable used to enable profiling without code changes
+PROFILE_ENV_VAR = "DATA_INTEGRITY_PROFILE"
+
+# Supported profiling modes
+PROFILE_MODES = ["cprofile", "line", "sampling"]
+
+def get_profile_mode(mode=None):
+    """
+    Return the profiling mode from the argument or the environment, or None if off
+    """
+    if mode is None:
+        mode = os.environ.get(PROFILE_ENV_VAR, "")
+
+    mode = mode.strip().lower()
+    if mode in ["", "0", "off", "false", "none"]:
+        return None
+    if mode in ["1", "on", "true"]:
+        return "cprofile"
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profiling mode '{mode}', expected one of {', '.join(PROFILE_MODES)}")
+
+    return mode
+
+def _profiled_functions():
+    """Return the reading and comparison functions run by run_comparison, traced by the line profiler"""
+    from src import comparison, file_handler
+
+    return [
+        file_handler.read_file, file_handler._read_into, file_handler._read_csv_stream,
+        file_handler._parse_excel_sheet, file_handler._read_columnar_into,
+        comparison._compare_files, comparison._compare_sheets, comparison.compare_columns,
+        comparison.compare_rows, comparison.compare_values
+    ]
+
+@contextmanager
+def profile_run(mode):
+    """
+    Profile the enclosed block with the given mode.
+
+    Yields a dictionary that receives the profile artifact ("data", "file_name",
+    "mime") and a text "summary" when the block finishes. When mode is None the
+    block runs without any profiler attached. Only the calling thread is
+    profiled, so work the block hands to other threads or processes is not
+    seen (run_comparison reads files serially when profiling for this reason).
+    """
+    artifact = {"mode": mode, "data": None, "file_name": None, "mime": None, "summary": None}
+
+    if mode is None:
+        yield artifact
+        return
+
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield artifact
+        finally:
+            profiler.disable()
+
+            # Serialize the stats in the same format as Profile.dump_stats
+            profiler.create_stats()
+            artifact["data"] = marshal.dumps(profiler.stats)
+            artifact["file_name"] = "comparison.prof"
+            artifact["mime"] = "application/octet-stream"
+
+            # Keep a readable summary of the most expensive calls
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+            artifact["summary"] = summary.getvalue()
+
+    elif mode == "line":
+        try:
+            from line_profiler import LineProfiler
+        except ImportError:
+            raise ImportError("Line profiling requires the line_profiler package")
+
+        profiler = LineProfiler(*_profiled_functions())
+        profiler.enable_by_count()
+        try:
+            yield artifact
+        finally:
+            profiler.disable_by_count()
+
+            output = io.StringIO()
+            profiler.print_stats(stream=output)
+            artifact["data"] = output.getvalue().encode("utf-8")
+            artifact["file_name"] = "comparison_line_profile.txt"
+            artifact["mime"] = "text/plain"
+            artifact["summary"] = output.getvalue()
+
+    elif mode == "sampling":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("Sampling profiling requires the pyinstrument package")
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield artifact
+        finally:
+            profiler.stop()
+
+            artifact["data"] = profiler.output_html().encode("utf-8")
+            artifact["file_name"] = "comparison_profile.html"
+            artifact["mime"] = "text/html"
+            artifact["summary"] = profiler.output_text()
+
+def write_profile_artifact(artifact, path=None):
+    """
+    Write a profile artifact to disk and return the path it was written to
+    """
+    path = path or artifact["file_name"]
+    with open(path, "wb") as f:
+        f.write(artifact["data"])
+    return path
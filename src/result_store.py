@@ -0,0 +1,347 @@
+import datetime
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from src.diff_store import build_diff_store
+
+# Directory holding the stored results, one subdirectory per handle. It must be
+# private to the user running the app (see _cache_dir)
+CACHE_DIR = os.environ.get(
+    "DATA_INTEGRITY_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), f"data_integrity_cache_{os.getuid() if hasattr(os, 'getuid') else 'user'}")
+)
+
+# File of a stored result holding its reports and error details, as JSON
+META_FILE = "meta.json"
+
+# File of a stored result holding the data of its profile artifact
+PROFILE_FILE = "profile.bin"
+
+# File of a stored result holding its indexed differences (see build_diff_store)
+DIFF_STORE_FILE = "differences.sqlite"
+
+# Date and time values (column names of spreadsheets, say) stored in the
+# metadata as tagged ISO text, by tag: their type and how to read them back.
+# Subclasses come before the classes they extend
+TIME_TYPES = {
+    "timestamp": (pd.Timestamp, pd.Timestamp),
+    "datetime": (datetime.datetime, datetime.datetime.fromisoformat),
+    "date": (datetime.date, datetime.date.fromisoformat),
+    "time": (datetime.time, datetime.time.fromisoformat)
+}
+
+# Seconds a stored result is kept after it was last used
+RESULT_TTL_SECONDS = int(os.environ.get("DATA_INTEGRITY_RESULT_TTL", "86400"))
+
+# Memory shared by all sessions for results loaded back from disk
+MEMORY_BUDGET_BYTES = int(os.environ.get("DATA_INTEGRITY_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024
+
+# Loaded results by handle, least recently used first, with their sizes
+_loaded = OrderedDict()
+_loaded_bytes = 0
+_lock = threading.Lock()
+
+def _cache_dir():
+    """
+    Create the cache directory with access for its owner only, and check that
+    an existing one is a directory (not a link) owned by the current user that
+    no one else can use, since the results in it are trusted when loaded back
+    """
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+
+    status = os.lstat(CACHE_DIR)
+    if not stat.S_ISDIR(status.st_mode):
+        raise RuntimeError(f"Result cache '{CACHE_DIR}' is not a directory")
+    if hasattr(os, "getuid") and (status.st_uid != os.getuid() or status.st_mode & 0o077):
+        raise RuntimeError(
+            f"Result cache '{CACHE_DIR}' must be owned by the current user and private to it (mode 700). "
+            "Set DATA_INTEGRITY_CACHE_DIR to another directory."
+        )
+    return CACHE_DIR
+
+def _result_dir(handle):
+    """Return the directory of a stored result, rejecting handles that are not ids"""
+    if not isinstance(handle, str) or not handle.isalnum():
+        raise ValueError(f"Invalid result handle '{handle}'")
+    return os.path.join(_cache_dir(), handle)
+
+def _to_json(value):
+    """
+    Convert result metadata for JSON, keeping the types of column names:
+    dictionaries with keys other than text (columns named 2021 or by a date,
+    say) become {"__pairs__": [[key, value], ...]}, dates and times become
+    {"__<tag>__": ISO text} (see TIME_TYPES) and numpy scalars plain values
+    """
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _to_json(item) for key, item in value.items()}
+        return {"__pairs__": [[_to_json(key), _to_json(item)] for key, item in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    for tag, (time_type, _) in TIME_TYPES.items():
+        if isinstance(value, time_type):
+            return {f"__{tag}__": value.isoformat()}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Cannot store a {type(value).__name__} in the result metadata")
+
+def _from_json(obj):
+    """Rebuild the dictionaries, dates and times converted by _to_json (a json.load object hook)"""
+    if len(obj) == 1:
+        (name, value), = obj.items()
+        if name == "__pairs__":
+            return {_hashable(key): item for key, item in value}
+        for tag, (_, parse) in TIME_TYPES.items():
+            if name == f"__{tag}__":
+                return parse(value)
+    return obj
+
+def _hashable(key):
+    """Turn a key read back as a JSON list (a tuple when stored) into a tuple"""
+    return tuple(_hashable(item) for item in key) if isinstance(key, list) else key
+
+def _write_frame(df, path):
+    """
+    Write a dataframe as an Arrow IPC file, or pickle it when Arrow cannot hold
+    its values (e.g. columns mixing numbers and text, or column names that are
+    not strings). Returns the file written.
+    """
+    try:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df) if all(isinstance(col, str) for col in df.columns) else None
+    except ImportError:
+        table = None
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, TypeError):
+        table = None
+
+    if table is None:
+        df.to_pickle(path + ".pkl")
+        return os.path.basename(path) + ".pkl"
+
+    # Record the Arrow-backed columns, which the pandas metadata does not tell apart
+    kinds = {}
+    for position, dtype in enumerate(df.dtypes):
+        if isinstance(dtype, pd.ArrowDtype):
+            kinds[position] = "arrow"
+        elif isinstance(dtype, pd.StringDtype) and dtype.storage == "pyarrow":
+            kinds[position] = "string"
+    table = table.replace_schema_metadata({**table.schema.metadata, b"column_kinds": json.dumps(kinds).encode()})
+
+    with pa.OSFile(path + ".arrow", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return os.path.basename(path) + ".arrow"
+
+def _read_frame(path):
+    """Read a dataframe written by _write_frame"""
+    if path.endswith(".pkl"):
+        return pd.read_pickle(path)
+
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    kinds = {int(position): kind for position, kind in json.loads(table.schema.metadata[b"column_kinds"]).items()}
+
+    # Frames read with the pyarrow dtype backend are Arrow-backed throughout
+    index_columns = [column for column in table.schema.pandas_metadata["index_columns"] if isinstance(column, str)]
+    if len(kinds) == table.num_columns - len(index_columns) and set(kinds.values()) == {"arrow"}:
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    df = table.to_pandas()
+    for position, kind in kinds.items():
+        column = table.column(position)
+        df.isetitem(position, pd.arrays.ArrowExtensionArray(column) if kind == "arrow" else pd.arrays.ArrowStringArray(column))
+    return df
+
+def _store_file_data(data, directory, prefix):
+    """Write the frames of a file data dictionary and return it with file names in their place"""
+    stored = {key: value for key, value in data.items() if key != "data"}
+
+    if isinstance(data["data"], dict):
+        stored["data"] = {
+            sheet_name: _write_frame(df, os.path.join(directory, f"{prefix}_{index}"))
+            for index, (sheet_name, df) in enumerate(data["data"].items())
+        }
+    elif data["data"] is not None:
+        stored["data"] = _write_frame(data["data"], os.path.join(directory, prefix))
+    else:
+        stored["data"] = None
+
+    return stored
+
+def _load_file_data(stored, directory):
+    """Read back a file data dictionary written by _store_file_data"""
+    data = dict(stored)
+
+    if isinstance(stored["data"], dict):
+        data["data"] = {
+            sheet_name: _read_frame(os.path.join(directory, file_name))
+            for sheet_name, file_name in stored["data"].items()
+        }
+    elif stored["data"] is not None:
+        data["data"] = _read_frame(os.path.join(directory, stored["data"]))
+
+    return data
+
+def save_result(result):
+    """
+    Write a comparison result (as returned by run_comparison) to the cache
+    directory and return its handle.
+
+    The loaded frames and the value differences of each sheet are written as
+    Arrow IPC files; the reports and the remaining error details are written as
+    JSON (see _to_json). Every difference is also written to an indexed SQLite store for
+    querying (see diff_store_path).
+    """
+    cleanup_results()
+
+    handle = uuid.uuid4().hex
+    directory = _result_dir(handle)
+    os.makedirs(directory, mode=0o700)
+
+    error_details = dict(result["error_details"])
+    value_differences = error_details.pop("value_differences")
+
+    # Store the value differences of each sheet as a table
+    stored_differences = {
+        sheet: _write_frame(pd.DataFrame(differences), os.path.join(directory, f"differences_{index}"))
+        for index, (sheet, differences) in enumerate(value_differences.items())
+    }
+
+    # Index every difference for drill-down queries
+    build_diff_store(result["error_details"], os.path.join(directory, DIFF_STORE_FILE), error_details.get("performance"))
+
+    # The profile data is binary, so it is kept next to the metadata
+    profile_artifact = result["profile_artifact"]
+    if profile_artifact is not None:
+        with open(os.path.join(directory, PROFILE_FILE), "wb") as f:
+            f.write(profile_artifact["data"])
+        profile_artifact = {key: value for key, value in profile_artifact.items() if key != "data"}
+
+    meta = {
+        "detailed_report": result["detailed_report"],
+        "summary_report": result["summary_report"],
+        "error_details": error_details,
+        "value_differences": stored_differences,
+        "data1": _store_file_data(result["data1"], directory, "file1"),
+        "data2": _store_file_data(result["data2"], directory, "file2"),
+        "profile_artifact": profile_artifact
+    }
+    with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(_to_json(meta), f)
+
+    return handle
+
+def _frames_size(data):
+    """Return the memory used by the frames of a file data dictionary"""
+    frames = data["data"].values() if isinstance(data["data"], dict) else [data["data"]]
+    return sum(int(df.memory_usage(deep=True).sum()) for df in frames if df is not None)
+
+def _read_result(directory):
+    """
+    Read a stored result back from its directory. Returns the result and the
+    memory its frames and differences use.
+    """
+    with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f, object_hook=_from_json)
+
+    size = 0
+    error_details = dict(meta["error_details"])
+    error_details["value_differences"] = {}
+    for sheet, file_name in meta["value_differences"].items():
+        differences = _read_frame(os.path.join(directory, file_name))
+        size += int(differences.memory_usage(deep=True).sum())
+        error_details["value_differences"][sheet] = differences.to_dict("records")
+
+    profile_artifact = meta["profile_artifact"]
+    if profile_artifact is not None:
+        with open(os.path.join(directory, PROFILE_FILE), "rb") as f:
+            profile_artifact = {**profile_artifact, "data": f.read()}
+
+    result = {
+        "detailed_report": meta["detailed_report"],
+        "summary_report": meta["summary_report"],
+        "error_details": error_details,
+        "data1": _load_file_data(meta["data1"], directory),
+        "data2": _load_file_data(meta["data2"], directory),
+        "profile_artifact": profile_artifact
+    }
+    return result, size + _frames_size(result["data1"]) + _frames_size(result["data2"])
+
+def load_result(handle):
+    """
+    Return a stored result, or None if the handle is unknown or expired.
+
+    Results are kept in memory after loading, least recently used results being
+    dropped once the loaded results of all sessions exceed the memory budget.
+    """
+    global _loaded_bytes
+
+    with _lock:
+        if handle in _loaded:
+            _loaded.move_to_end(handle)
+            result, _ = _loaded[handle]
+            return result
+
+    directory = _result_dir(handle)
+    if not os.path.isdir(directory):
+        return None
+
+    # Mark the result as used so it is not evicted
+    os.utime(directory)
+    result, size = _read_result(directory)
+
+    with _lock:
+        if size <= MEMORY_BUDGET_BYTES and handle not in _loaded:
+            _loaded[handle] = (result, size)
+            _loaded_bytes += size
+
+            # Evict the least recently used results over the budget
+            while _loaded_bytes > MEMORY_BUDGET_BYTES:
+                _, (_, evicted_size) = _loaded.popitem(last=False)
+                _loaded_bytes -= evicted_size
+
+    return result
+
+def result_exists(handle):
+    """Check if a result is still stored"""
+    return os.path.isdir(_result_dir(handle))
+
+def diff_store_path(handle):
+    """Return the path of the indexed differences of a stored result, or None if it has none"""
+    path = os.path.join(_result_dir(handle), DIFF_STORE_FILE)
+    return path if os.path.isfile(path) else None
+
+def delete_result(handle):
+    """Remove a stored result from memory and disk"""
+    global _loaded_bytes
+
+    with _lock:
+        if handle in _loaded:
+            _, size = _loaded.pop(handle)
+            _loaded_bytes -= size
+
+    shutil.rmtree(_result_dir(handle), ignore_errors=True)
+
+def cleanup_results(ttl=None):
+    """Remove stored results that have not been used within the time to live"""
+    ttl = RESULT_TTL_SECONDS if ttl is None else ttl
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    now = time.time()
+    for entry in os.scandir(CACHE_DIR):
+        if entry.is_dir() and now - entry.stat().st_mtime > ttl:
+            delete_result(entry.name)
@@ -2,7 +2,6 @@ import pandas as pd
 import numpy as np
 from io import BytesIO
 import traceback
-import streamlit as st
 
 def create_sample_files():
     """Create sample Excel files with known differences for testing"""
@@ -107,6 +106,9 @@ def create_sample_files():
         # More detailed error reporting
         error_msg = f"Error generating sample files: {str(e)}\n{traceback.format_exc()}"
         print(error_msg)
+
+        # Streamlit is only loaded here, so the benchmarks and workers can import this module without it
+        import streamlit as st
         st.error(error_msg)
         # Return empty files to avoid crashing
         empty1 = BytesIO()
@@ -117,4 +119,152 @@ def create_sample_files():
             pd.DataFrame({"Error": ["Sample generation failed"]}).to_excel(writer, index=False)
         empty1.seek(0)
         empty2.seek(0)
-        return empty1.getvalue(), empty2.getvalue()
\ No newline at end of file
+        return empty1.getvalue(), empty2.getvalue()
+
+# Supported column types for generated benchmark data
+BENCHMARK_DTYPES = ["int", "float", "str", "date", "bool"]
+
+def _generate_column(rng, dtype, rows, vocab):
+    """Generate one column of random values of the given type"""
+    if dtype == "int":
+        return rng.integers(0, 1_000_000, size=rows)
+    if dtype == "float":
+        return np.round(rng.random(rows) * 10_000, 2)
+    if dtype == "str":
+        # Draw from a fixed vocabulary so string generation stays vectorized
+        return vocab[rng.integers(0, len(vocab), size=rows)]
+    if dtype == "date":
+        return np.datetime64("2020-01-01") + rng.integers(0, 3650, size=rows).astype("timedelta64[D]")
+    if dtype == "bool":
+        return rng.random(rows) < 0.5
+    raise ValueError(f"Unsupported benchmark dtype: {dtype}")
+
+def _perturb_column(values, dtype, mask, vocab):
+    """Return a copy of the column with the masked cells changed"""
+    changed = values.copy()
+    if dtype == "int":
+        changed[mask] += 1
+    elif dtype == "float":
+        changed[mask] += 0.5
+    elif dtype == "str":
+        # Shift to the next vocabulary entry so the value is guaranteed to differ
+        positions = np.searchsorted(vocab, changed[mask])
+        changed[mask] = vocab[(positions + 1) % len(vocab)]
+    elif dtype == "date":
+        changed[mask] += np.timedelta64(1, "D")
+    elif dtype == "bool":
+        changed[mask] = ~changed[mask]
+    return changed
+
+def generate_benchmark_sheet(rows=1000, columns=10, dtypes=None, key_unique=True,
+                             duplicate_rate=0.0, cell_diff_rate=0.0, row_diff_rate=0.0,
+                             column_diff_rate=0.0, seed=0):
+    """
+    Generate a pair of dataframes with a controlled amount of differences.
+
+    The first column ("ID") is the key column. When key_unique is False the keys are
+    drawn with replacement, and duplicate_rate replaces that fraction of rows with
+    copies of other rows. Both settings force the positional comparison path.
+    cell_diff_rate, row_diff_rate and column_diff_rate set the fraction of cells
+    changed, rows swapped for new rows and columns swapped for new columns in the
+    second dataframe.
+    """
+    rng = np.random.default_rng(seed)
+    dtypes = dtypes or ["int", "float", "str", "date"]
+    vocab = np.array([f"value_{i:06d}" for i in range(min(max(rows, 1), 100_000))], dtype=object)
+
+    # Build the key column
+    if key_unique:
+        keys = rng.permutation(rows) + 1
+    else:
+        keys = rng.integers(1, max(rows, 1) + 1, size=rows)
+
+    # Build the value columns, cycling through the requested types
+    column_types = {"ID": "int"}
+    data = {"ID": keys}
+    for i in range(1, columns):
+        dtype = dtypes[(i - 1) % len(dtypes)]
+        column_types[f"Col{i}_{dtype}"] = dtype
+        data[f"Col{i}_{dtype}"] = _generate_column(rng, dtype, rows, vocab)
+
+    # Replace a fraction of rows with exact copies of other rows
+    if duplicate_rate > 0 and rows > 1:
+        duplicate_rows = rng.random(rows) < duplicate_rate
+        sources = rng.integers(0, rows, size=int(duplicate_rows.sum()))
+        for name in data:
+            data[name][duplicate_rows] = data[name][sources]
+
+    df1 = pd.DataFrame(data)
+
+    # Change a fraction of the cells in the value columns
+    data2 = {"ID": keys.copy()}
+    for name, dtype in column_types.items():
+        if name == "ID":
+            continue
+        mask = rng.random(rows) < cell_diff_rate
+        data2[name] = _perturb_column(data[name], dtype, mask, vocab)
+    df2 = pd.DataFrame(data2)
+
+    # Drop a fraction of rows and append the same number of new rows
+    removed = rng.random(rows) < row_diff_rate
+    added = int(removed.sum())
+    if added:
+        new_rows = {"ID": np.arange(rows + 1, rows + added + 1)}
+        for name, dtype in column_types.items():
+            if name != "ID":
+                new_rows[name] = _generate_column(rng, dtype, added, vocab)
+        df2 = pd.concat([df2[~removed], pd.DataFrame(new_rows)], ignore_index=True)
+
+    # Drop a fraction of the value columns and add the same number of new columns
+    value_columns = [name for name in column_types if name != "ID"]
+    swapped = int(round(len(value_columns) * column_diff_rate))
+    if swapped:
+        dropped = list(rng.choice(value_columns, size=swapped, replace=False))
+        df2 = df2.drop(columns=dropped)
+        for i in range(swapped):
+            df2[f"Extra{i + 1}"] = _generate_column(rng, "int", len(df2), vocab)
+
+    return df1, df2
+
+def generate_benchmark_data(rows=1000, columns=10, sheets=1, seed=0, **options):
+    """
+    Generate a pair of sheet dictionaries for benchmarking.
+
+    Each sheet is generated from its own seed derived from the base seed, so the
+    result is deterministic. Extra options are passed to generate_benchmark_sheet.
+    """
+    sheets1 = {}
+    sheets2 = {}
+    for i in range(sheets):
+        sheet_name = f"Sheet{i + 1}"
+        sheets1[sheet_name], sheets2[sheet_name] = generate_benchmark_sheet(
+            rows=rows, columns=columns, seed=[seed, i], **options
+        )
+    return sheets1, sheets2
+
+def write_benchmark_file(sheets, target, file_format="xlsx"):
+    """
+    Write generated sheets to a path or binary buffer as CSV or XLSX.
+
+    CSV files can only hold one sheet, so only the first sheet is written.
+    """
+    if file_format == "csv":
+        first_sheet = next(iter(sheets.values()))
+        first_sheet.to_csv(target, index=False)
+    elif file_format == "xlsx":
+        with pd.ExcelWriter(target, engine='openpyxl') as writer:
+            for sheet_name, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+    else:
+        raise ValueError(f"Unsupported benchmark file format: {file_format}")
+
+def create_benchmark_files(file_format="xlsx", **params):
+    """Create a pair of generated benchmark files and return them as bytes"""
+    sheets1, sheets2 = generate_benchmark_data(**params)
+
+    output1 = BytesIO()
+    output2 = BytesIO()
+    write_benchmark_file(sheets1, output1, file_format)
+    write_benchmark_file(sheets2, output2, file_format)
+
+    return output1.getvalue(), output2.getvalue()
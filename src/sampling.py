@@ -0,0 +1,326 @@
+import itertools
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from src.comparison import compare_sheets, compare_column_lists, string_keys
+from src.file_handler import describe_file, iter_sheet_chunks, scope_columns, row_filter, MULTI_SHEET_TYPES
+from src.filters import check_row_filters, row_filter_mask
+from src.instrumentation import track_stage
+
+# Ways of picking the sampled keys: "key_hash" keeps the keys whose hash falls
+# in the sampled fraction of the hash space, so both files pick the same keys
+# on their own; "random" draws rows of file 1 at random and looks their keys
+# up in file 2
+SAMPLE_METHODS = ["key_hash", "random"]
+
+# Fraction of the keys compared by default
+SAMPLE_FRACTION = 0.01
+
+# Confidence level of the reported intervals
+CONFIDENCE = 0.95
+
+# Rows read from each file at a time while sampling
+SAMPLE_CHUNK_ROWS = 100_000
+
+# Differing values kept per sheet as examples
+EXAMPLE_DIFFERENCES = 20
+
+def wilson_interval(successes, trials, confidence=CONFIDENCE):
+    """
+    Return the Wilson score interval of a proportion, which stays within [0, 1]
+    and is usable when no or all trials succeed. Returns (None, None) without
+    trials.
+    """
+    if not trials:
+        return None, None
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    rate = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (rate + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+def estimate(observed, sampled, population, confidence=CONFIDENCE):
+    """
+    Estimate a rate from a sample: the observed count, the sample size, the
+    rate with its Wilson interval and the count expected in the population
+    """
+    low, high = wilson_interval(observed, sampled, confidence)
+    rate = observed / sampled if sampled else None
+    return {
+        "observed": observed,
+        "sampled": sampled,
+        "rate": rate,
+        "low": low,
+        "high": high,
+        "estimated": round(rate * population) if rate is not None else None
+    }
+
+def _hash_keys(keys, seed):
+    """Return a 64-bit hash of every key, salted with the seed"""
+    return pd.util.hash_pandas_object(keys, index=False, hash_key=f"{seed:016d}"[-16:]).to_numpy()
+
+def _key_hash_selector(fraction, seed):
+    """Return a function selecting the keys whose hash falls in the first fraction of the hash space"""
+    if fraction >= 1:
+        return lambda keys: np.ones(len(keys), dtype=bool)
+    threshold = np.uint64(int(fraction * 2 ** 64))
+    return lambda keys: _hash_keys(keys, seed) < threshold
+
+def _open_chunks(file, sheet_name):
+    """Start reading a sheet in chunks and return its columns and all its chunks"""
+    chunks = iter_sheet_chunks(file, sheet_name, SAMPLE_CHUNK_ROWS)
+    first = next(chunks, None)
+    if first is None:
+        return [], iter(())
+    return list(first.columns), itertools.chain([first], chunks)
+
+def _scope_chunks(columns, chunks, scope, sheet_name):
+    """
+    Keep the columns and rows of each chunk within the comparison scope, and
+    return the columns kept with the scoped chunks
+    """
+    if not scope:
+        return columns, chunks
+
+    positions = scope_columns(columns, scope)
+    expression = row_filter(scope, sheet_name)
+
+    def scoped():
+        for chunk in chunks:
+            chunk = chunk.iloc[:, positions]
+            yield chunk[row_filter_mask(chunk, expression)] if expression else chunk
+
+    return [columns[position] for position in positions], scoped()
+
+def _sample_chunks(chunks, key_column, select):
+    """
+    Keep the rows of each chunk whose keys select picks, and return them as one
+    dataframe with the number of rows read
+    """
+    parts = []
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        parts.append(chunk[select(string_keys(chunk, key_column))])
+    return pd.concat(parts, ignore_index=True), rows
+
+def sample_sheet(file1, file2, sheet_name, fraction=SAMPLE_FRACTION, method="key_hash", seed=0,
+                 confidence=CONFIDENCE, scope=None, metrics=None):
+    """
+    Compare a sample of the keys of one sheet with compare_sheets and estimate
+    how much of the whole sheet differs.
+
+    Both sheets are read once in chunks, keeping only the rows within the scope
+    and of those only the sampled rows, which are matched on the first common
+    column within the scope. Row counts are of the rows within the scope. Returns the exact row counts, the
+    sampled and matched row counts, the column differences, estimates (see
+    estimate) of the missing rows, the extra rows (None with random sampling,
+    which only draws keys from file 1) and the differing values of every
+    column, a few example differences and whether a full comparison is needed.
+    """
+    cols1, chunks1 = _scope_chunks(*_open_chunks(file1, sheet_name), scope, sheet_name)
+    cols2, chunks2 = _scope_chunks(*_open_chunks(file2, sheet_name), scope, sheet_name)
+    common_columns = [col for col in cols1 if col in cols2]
+
+    if not common_columns:
+        rows1 = sum(len(chunk) for chunk in chunks1)
+        rows2 = sum(len(chunk) for chunk in chunks2)
+        return {
+            "rows": [rows1, rows2],
+            "sampled_rows": [0, 0],
+            "matched_rows": 0,
+            "column_differences": compare_column_lists(cols1, cols2),
+            "missing_rows": None,
+            "extra_rows": None,
+            "columns": {},
+            "examples": [],
+            "needs_full_comparison": True
+        }
+
+    key_column = common_columns[0]
+
+    with track_stage(metrics, "sample_rows", sheet=sheet_name, method=method) as record:
+        if method == "key_hash":
+            select = _key_hash_selector(fraction, seed)
+            sample1, rows1 = _sample_chunks(chunks1, key_column, select)
+            sample2, rows2 = _sample_chunks(chunks2, key_column, select)
+        elif method == "random":
+            rng = np.random.default_rng(seed)
+            sample1, rows1 = _sample_chunks(chunks1, key_column, lambda keys: rng.random(len(keys)) < fraction)
+            sampled_keys = pd.Index(string_keys(sample1, key_column))
+            sample2, rows2 = _sample_chunks(chunks2, key_column, lambda keys: keys.isin(sampled_keys).to_numpy())
+        else:
+            raise ValueError(f"Unknown sample method '{method}', expected one of {', '.join(SAMPLE_METHODS)}")
+        record["sampled_rows"] = len(sample1) + len(sample2)
+
+    # Rows are only matched on unique keys, positions mean nothing in a sample
+    if string_keys(sample1, key_column).duplicated().any() or string_keys(sample2, key_column).duplicated().any():
+        raise ValueError(
+            f"Sheet '{sheet_name}' has duplicate values in its key column '{key_column}', "
+            "so it cannot be compared from a sample"
+        )
+
+    limits = {"max_diffs_per_sheet": EXAMPLE_DIFFERENCES, "max_diffs_per_column": None, "fail_fast_threshold": None}
+    _, _, error_details = compare_sheets(sheet_name, sample1, sample2, metrics, limits)
+
+    row_differences = error_details["row_differences"]
+    matched = len(sample1) - row_differences["missing_count"]
+
+    # Scale the value estimates to the rows of file 1 expected to have a match
+    matched_population = rows1 * matched / len(sample1) if len(sample1) else 0
+
+    columns = {
+        col: estimate(stats["mismatches"], stats["compared"], matched_population, confidence)
+        for col, stats in error_details["column_stats"].items()
+    }
+    missing_rows = estimate(row_differences["missing_count"], len(sample1), rows1, confidence)
+    extra_rows = estimate(row_differences["extra_count"], len(sample2), rows2, confidence) if method == "key_hash" else None
+
+    column_differences = error_details["column_differences"]
+    needs_full = bool(
+        rows1 != rows2 or column_differences["missing"] or column_differences["extra"]
+        or column_differences["reordered"] or missing_rows["observed"]
+        or (extra_rows and extra_rows["observed"]) or any(column["observed"] for column in columns.values())
+    )
+
+    return {
+        "rows": [rows1, rows2],
+        "sampled_rows": [len(sample1), len(sample2)],
+        "matched_rows": matched,
+        "column_differences": column_differences,
+        "missing_rows": missing_rows,
+        "extra_rows": extra_rows,
+        "columns": columns,
+        "examples": error_details["value_differences"],
+        "needs_full_comparison": needs_full
+    }
+
+def quick_check(file1, file2, fraction=SAMPLE_FRACTION, method="key_hash", seed=0, confidence=CONFIDENCE,
+                scope=None, metrics=None):
+    """
+    Estimate how much two files differ from a sample of their keys, as a triage
+    pass before a full comparison.
+
+    Compares the sheet names and then a sample of every common sheet (see
+    sample_sheet). Returns the sampling parameters, the file types when they
+    differ, the missing and extra sheets and the estimates of each sheet.
+    """
+    if method not in SAMPLE_METHODS:
+        raise ValueError(f"Unknown sample method '{method}', expected one of {', '.join(SAMPLE_METHODS)}")
+    if not 0 < fraction <= 1:
+        raise ValueError("The sample fraction must be above 0 and at most 1")
+    check_row_filters(scope)
+
+    data1 = describe_file(file1)
+    data2 = describe_file(file2)
+
+    result = {
+        "method": method,
+        "fraction": fraction,
+        "seed": seed,
+        "confidence": confidence,
+        "type_change": [data1["type"], data2["type"]] if data1["type"] != data2["type"] else None,
+        "missing_sheets": [],
+        "extra_sheets": [],
+        "sheets": {}
+    }
+
+    # Compare sheet names for multi-sheet inputs, or the single tables
+    multi_sheet1 = data1["type"] in MULTI_SHEET_TYPES
+    multi_sheet2 = data2["type"] in MULTI_SHEET_TYPES
+    if multi_sheet1 and multi_sheet2:
+        result["missing_sheets"] = [sheet for sheet in data1["sheet_names"] if sheet not in data2["sheet_names"]]
+        result["extra_sheets"] = [sheet for sheet in data2["sheet_names"] if sheet not in data1["sheet_names"]]
+        common_sheets = [sheet for sheet in data1["sheet_names"] if sheet in data2["sheet_names"]]
+    elif not multi_sheet1 and not multi_sheet2:
+        common_sheets = ["data"]
+    else:
+        common_sheets = []
+
+    with track_stage(metrics, "quick_check", method=method, fraction=fraction) as record:
+        for sheet in common_sheets:
+            result["sheets"][sheet] = sample_sheet(
+                file1, file2, sheet, fraction, method, seed, confidence, scope, metrics
+            )
+        record["sheets_to_compare"] = len(needs_full_comparison(result))
+
+    return result
+
+def needs_full_comparison(result):
+    """Return the sheets of a quick check that should be compared in full"""
+    return [sheet for sheet, sheet_result in result["sheets"].items() if sheet_result["needs_full_comparison"]]
+
+def _format_rate(rate_estimate):
+    """Format an estimated rate with its interval"""
+    return f"{rate_estimate['rate']:.2%} ({rate_estimate['low']:.2%} to {rate_estimate['high']:.2%})"
+
+def format_quick_check_report(result):
+    """
+    Build the report lines of a quick check
+    """
+    report = []
+    level = f"{result['confidence']:.0%}"
+
+    if result["type_change"]:
+        report.append(f"File types are different: {result['type_change'][0]} vs {result['type_change'][1]}")
+    for sheet in result["missing_sheets"]:
+        report.append(f"Sheet '{sheet}' is missing in file 2")
+    for sheet in result["extra_sheets"]:
+        report.append(f"Extra sheet '{sheet}' in file 2")
+
+    for sheet_name, sheet in result["sheets"].items():
+        rows1, rows2 = sheet["rows"]
+        report.append(
+            f"Sheet '{sheet_name}': sampled {sheet['sampled_rows'][0]} of {rows1} rows in file 1 "
+            f"and {sheet['sampled_rows'][1]} of {rows2} rows in file 2"
+        )
+
+        column_differences = sheet["column_differences"]
+        for col in column_differences["missing"]:
+            report.append(f"Missing column '{col}' in sheet '{sheet_name}'")
+        for col in column_differences["extra"]:
+            report.append(f"Extra column '{col}' in sheet '{sheet_name}'")
+        if column_differences["reordered"]:
+            report.append(f"Column order in sheet '{sheet_name}' is different")
+        if rows1 != rows2:
+            report.append(f"Row count in sheet '{sheet_name}' is different: {rows1} vs {rows2}")
+
+        if sheet["missing_rows"] and sheet["missing_rows"]["sampled"]:
+            missing = sheet["missing_rows"]
+            report.append(
+                f"About {missing['estimated']} rows missing in sheet '{sheet_name}': "
+                f"{_format_rate(missing)} of rows, {level} interval"
+            )
+        if sheet["extra_rows"] and sheet["extra_rows"]["sampled"]:
+            extra = sheet["extra_rows"]
+            report.append(
+                f"About {extra['estimated']} extra rows in sheet '{sheet_name}': "
+                f"{_format_rate(extra)} of rows, {level} interval"
+            )
+
+        for col, column in sheet["columns"].items():
+            if not column["sampled"]:
+                continue
+            if column["observed"]:
+                report.append(
+                    f"Column '{col}' in sheet '{sheet_name}': about {column['estimated']} differing values, "
+                    f"{_format_rate(column)} of rows, {level} interval"
+                )
+            else:
+                report.append(
+                    f"Column '{col}' in sheet '{sheet_name}': no differences in {column['sampled']} sampled rows, "
+                    f"at most {column['high']:.2%} at {level} confidence"
+                )
+
+    sheets = needs_full_comparison(result)
+    if sheets:
+        report.append(f"Compare in full: {', '.join(repr(sheet) for sheet in sheets)}")
+    elif not (result["type_change"] or result["missing_sheets"] or result["extra_sheets"]):
+        report.append("No differences found in the sample")
+
+    return report
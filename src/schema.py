@@ -0,0 +1,132 @@
+from src.file_handler import read_samples
+from src.comparison import compare_column_lists
+from src.instrumentation import track_stage
+
+# Number of rows sampled from each sheet
+SAMPLE_ROWS = 1000
+
+# Smallest change in the null rate of a column that is reported as drift
+NULL_RATE_TOLERANCE = 0.05
+
+def inspect_file(file, sample_rows=SAMPLE_ROWS):
+    """
+    Inspect the schema of a file from its headers and a sample of its rows.
+
+    Returns {"name", "type", "sheets"} where each sheet has its columns, the
+    dtypes inferred from the sample, the null rate of each column in the sample,
+    the row count ("rows", with "rows_exact" False for estimates) and the number
+    of rows sampled.
+    """
+    samples = read_samples(file, sample_rows)
+
+    sheets = {}
+    for sheet_name, sheet in samples["sheets"].items():
+        sample = sheet["sample"]
+        null_rates = sample.isna().mean() if len(sample) else sample.dtypes.map(lambda _: 0.0)
+        sheets[sheet_name] = {
+            "columns": list(sample.columns),
+            "dtypes": {col: str(dtype) for col, dtype in sample.dtypes.items()},
+            "null_rates": {col: float(rate) for col, rate in null_rates.items()},
+            "rows": sheet["rows"],
+            "rows_exact": sheet["rows_exact"],
+            "sampled_rows": len(sample)
+        }
+
+    return {
+        "name": samples["name"],
+        "type": samples["type"],
+        "sheets": sheets
+    }
+
+def compare_schemas(schema1, schema2, null_rate_tolerance=NULL_RATE_TOLERANCE):
+    """
+    Compare two inspected schemas and return the schema drift.
+
+    Reports the file types, the missing and extra sheets and, for each common
+    sheet, the column differences, the columns whose inferred dtype changed,
+    the columns whose null rate changed by more than the tolerance and the row
+    counts when they differ.
+    """
+    sheets1 = schema1["sheets"]
+    sheets2 = schema2["sheets"]
+
+    drift = {
+        "type_change": [schema1["type"], schema2["type"]] if schema1["type"] != schema2["type"] else None,
+        "missing_sheets": [sheet for sheet in sheets1 if sheet not in sheets2],
+        "extra_sheets": [sheet for sheet in sheets2 if sheet not in sheets1],
+        "sheets": {}
+    }
+
+    for sheet_name, sheet1 in sheets1.items():
+        if sheet_name not in sheets2:
+            continue
+        sheet2 = sheets2[sheet_name]
+        common_columns = [col for col in sheet1["columns"] if col in sheet2["columns"]]
+
+        drift["sheets"][sheet_name] = {
+            "column_differences": compare_column_lists(sheet1["columns"], sheet2["columns"]),
+            "dtype_changes": {
+                col: [sheet1["dtypes"][col], sheet2["dtypes"][col]]
+                for col in common_columns
+                if sheet1["dtypes"][col] != sheet2["dtypes"][col]
+            },
+            "null_rate_changes": {
+                col: [sheet1["null_rates"][col], sheet2["null_rates"][col]]
+                for col in common_columns
+                if abs(sheet1["null_rates"][col] - sheet2["null_rates"][col]) > null_rate_tolerance
+            },
+            "row_counts": [sheet1["rows"], sheet2["rows"]] if sheet1["rows"] != sheet2["rows"] else None,
+            "rows_exact": sheet1["rows_exact"] and sheet2["rows_exact"]
+        }
+
+    return drift
+
+def format_schema_report(drift):
+    """
+    Build the report lines of a schema drift
+    """
+    report = []
+
+    if drift["type_change"]:
+        report.append(f"File types are different: {drift['type_change'][0]} vs {drift['type_change'][1]}")
+
+    for sheet in drift["missing_sheets"]:
+        report.append(f"Sheet '{sheet}' is missing in file 2")
+    for sheet in drift["extra_sheets"]:
+        report.append(f"Extra sheet '{sheet}' in file 2")
+
+    for sheet_name, sheet in drift["sheets"].items():
+        column_differences = sheet["column_differences"]
+        for col in column_differences["missing"]:
+            report.append(f"Missing column '{col}' in sheet '{sheet_name}'")
+        for col in column_differences["extra"]:
+            report.append(f"Extra column '{col}' in sheet '{sheet_name}'")
+        if column_differences["reordered"]:
+            report.append(f"Column order in sheet '{sheet_name}' is different")
+
+        for col, (dtype1, dtype2) in sheet["dtype_changes"].items():
+            report.append(f"Column '{col}' in sheet '{sheet_name}' changes type: {dtype1} vs {dtype2}")
+        for col, (rate1, rate2) in sheet["null_rate_changes"].items():
+            report.append(f"Null rate of column '{col}' in sheet '{sheet_name}' changes: {rate1:.1%} vs {rate2:.1%}")
+
+        if sheet["row_counts"]:
+            approximate = "" if sheet["rows_exact"] else "about "
+            rows1, rows2 = sheet["row_counts"]
+            report.append(f"Row count in sheet '{sheet_name}' is different: {approximate}{rows1} vs {rows2}")
+
+    return report
+
+def inspect_schemas(file1, file2, sample_rows=SAMPLE_ROWS, metrics=None):
+    """
+    Inspect the schemas of two files without loading them and compare them.
+
+    Returns both schemas, the schema drift and its report lines.
+    """
+    with track_stage(metrics, "schema_inspection") as record:
+        schema1 = inspect_file(file1, sample_rows)
+        schema2 = inspect_file(file2, sample_rows)
+        drift = compare_schemas(schema1, schema2)
+        report = format_schema_report(drift)
+        record["differences"] = len(report)
+
+    return schema1, schema2, drift, report
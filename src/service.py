@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+
+from src.pipeline import DEFAULT_SETTINGS, run_comparison_to_store
+from src.result_store import result_exists
+from src.jobs import submit_job, get_job
+
+# Comparisons the service keeps queued or running at once; further requests
+# are turned away until one finishes
+MAX_PENDING_COMPARISONS = int(os.environ.get("DATA_INTEGRITY_MAX_PENDING", "16"))
+
+# Bytes hashed at a time when fingerprinting an input
+HASH_BLOCK_BYTES = 1024 * 1024
+
+# Comparisons by the fingerprint of their inputs and settings: the job that
+# runs them and, once it is done, the handle of the stored result
+_comparisons = {}
+_lock = threading.Lock()
+
+def _hash_file(digest, path):
+    """Add the contents of a local file to a digest"""
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+
+def fingerprint_input(file):
+    """
+    Return a hash of the contents of an input: a local file, a dataset
+    directory (every file under it, with its relative path) or an uploaded
+    buffer. The name is included, since the extension decides how the input
+    is read.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+
+    if isinstance(file, str):
+        digest.update(os.path.basename(os.path.normpath(file)).encode())
+        if os.path.isdir(file):
+            for root, dirs, files in os.walk(file):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, file).encode())
+                    _hash_file(digest, path)
+        else:
+            _hash_file(digest, file)
+    else:
+        digest.update(file.name.encode())
+        digest.update(file.getbuffer())
+
+    return digest.hexdigest()
+
+def comparison_key(file1, file2, settings=None):
+    """Return the fingerprint of a comparison: both inputs and the settings it runs with"""
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(fingerprint_input(file1).encode())
+    digest.update(fingerprint_input(file2).encode())
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def _pending_count():
+    """Return the number of comparisons of the service that are queued or running"""
+    count = 0
+    for entry in _comparisons.values():
+        if entry["result"] is None:
+            job = get_job(entry["job"])
+            if job is not None and job["status"] in ["queued", "running"]:
+                count += 1
+    return count
+
+def _reusable(entry):
+    """
+    Return an earlier comparison that can answer a repeated request: its job
+    while it is pending, or its stored result. Failed, cancelled and expired
+    comparisons are run again.
+    """
+    if entry is None:
+        return None
+
+    if entry["result"] is not None:
+        return entry if result_exists(entry["result"]) else None
+
+    job = get_job(entry["job"])
+    if job is None or job["status"] in ["failed", "cancelled"]:
+        return None
+    if job["status"] == "done":
+        entry["result"] = job["result"]
+    return entry
+
+def submit_comparison(file1, file2, settings=None):
+    """
+    Start a comparison in the background job pool, or reuse the one already
+    run on inputs with the same contents and settings.
+
+    Returns {"key", "job", "result", "cached"}: result is the handle of the
+    stored result (see save_result) when an identical comparison has finished,
+    and None while the job runs. Raises RuntimeError when
+    MAX_PENDING_COMPARISONS comparisons are already pending.
+    """
+    key = comparison_key(file1, file2, settings)
+
+    with _lock:
+        # Forget comparisons that failed or whose results expired
+        for stale in [other for other, entry in _comparisons.items() if _reusable(entry) is None]:
+            del _comparisons[stale]
+
+        entry = _comparisons.get(key)
+        if entry is not None:
+            return {"key": key, "job": entry["job"], "result": entry["result"], "cached": True}
+
+        if _pending_count() >= MAX_PENDING_COMPARISONS:
+            raise RuntimeError(f"{MAX_PENDING_COMPARISONS} comparisons are already pending, try again later")
+
+        job_id = submit_job(run_comparison_to_store, file1, file2, settings, track_progress=True)
+        _comparisons[key] = {"job": job_id, "result": None}
+
+    return {"key": key, "job": job_id, "result": None, "cached": False}
@@ -0,0 +1,307 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from src.comparison import (
+    resolve_limits, empty_error_details, compare_sheet_names, compare_column_lists,
+    merge_sheet_error_details, format_sheet_report, empty_column_stats
+)
+from src.file_handler import detect_file_type, iter_file_chunks, scope_columns, as_text, MULTI_SHEET_TYPES
+from src.instrumentation import track_stage
+
+# Embedded engines that can run the comparison
+SQL_ENGINES = ["sqlite", "duckdb"]
+
+# Column holding the position of each row within its sheet
+ROW_COLUMN = "row_position"
+
+# Null-safe inequality operator of each engine
+NOT_EQUAL = {
+    "sqlite": "IS NOT",
+    "duckdb": "IS DISTINCT FROM"
+}
+
+def choose_engine(engine=None):
+    """
+    Return the engine to use: DuckDB if it is installed, otherwise SQLite
+    """
+    if engine is not None:
+        if engine not in SQL_ENGINES:
+            raise ValueError(f"Unknown SQL engine '{engine}', expected one of {', '.join(SQL_ENGINES)}")
+        return engine
+
+    try:
+        import duckdb
+        return "duckdb"
+    except ImportError:
+        return "sqlite"
+
+def _connect(engine, database):
+    """Open a connection to an on-disk database"""
+    if engine == "duckdb":
+        import duckdb
+        return duckdb.connect(database)
+
+    connection = sqlite3.connect(database)
+
+    # The database is scratch space, so trade durability for load speed
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("PRAGMA temp_store = FILE")
+    return connection
+
+def _insert_chunk(connection, engine, table, chunk, create):
+    """Append a dataframe chunk to a table, creating the table for the first chunk"""
+    if engine == "duckdb":
+        connection.register("chunk_view", chunk)
+        if create:
+            connection.execute(f"CREATE TABLE {table} AS SELECT * FROM chunk_view")
+        else:
+            connection.execute(f"INSERT INTO {table} SELECT * FROM chunk_view")
+        connection.unregister("chunk_view")
+    else:
+        chunk.to_sql(table, connection, if_exists="replace" if create else "append", index=False)
+
+def load_file(connection, engine, file, prefix, chunksize=100_000, scope=None):
+    """
+    Load every sheet of a file into its own table, chunk by chunk.
+
+    Values are stored as the strings they are compared as, in columns named
+    c0, c1, ... so any column name is safe. CSV and Excel values are stored as
+    the text in the file. Only the columns within the scope are stored (see
+    scope_columns). Returns a dictionary of sheet name to
+    {"table", "columns", "rows"}.
+    """
+    tables = {}
+
+    for sheet_name, chunk in iter_file_chunks(file, chunksize, text=True):
+        if scope:
+            chunk = chunk.iloc[:, scope_columns(chunk.columns, scope)]
+        if sheet_name not in tables:
+            tables[sheet_name] = {
+                "table": f"{prefix}_{len(tables)}",
+                "columns": list(chunk.columns),
+                "rows": 0
+            }
+        info = tables[sheet_name]
+
+        # Store values as strings with the row position in front
+        chunk = as_text(chunk)
+        chunk.columns = [f"c{i}" for i in range(len(chunk.columns))]
+        chunk.insert(0, ROW_COLUMN, range(info["rows"], info["rows"] + len(chunk)))
+
+        _insert_chunk(connection, engine, info["table"], chunk, create=info["rows"] == 0)
+        info["rows"] += len(chunk)
+
+    return tables
+
+def _limit_clause(limit):
+    """Return a LIMIT clause, or nothing when there is no limit"""
+    return f" LIMIT {int(limit)}" if limit is not None else ""
+
+def _has_unique_values(connection, table, column, rows):
+    """Check if a column has no duplicate values"""
+    distinct = connection.execute(f"SELECT COUNT(DISTINCT {column}) FROM {table}").fetchone()[0]
+    return distinct == rows
+
+def compare_sheet_sql(connection, engine, info1, info2, limits=None):
+    """
+    Compare two loaded sheets with set-based queries and return the sheet error
+    details in the same shape as compare_sheets
+    """
+    limits = resolve_limits(limits)
+    table1, table2 = info1["table"], info2["table"]
+    cols1, cols2 = info1["columns"], info2["columns"]
+
+    error_details = {
+        "column_differences": compare_column_lists(cols1, cols2),
+        "row_differences": {},
+        "value_differences": [],
+        "value_difference_counts": {},
+        "column_stats": {}
+    }
+
+    # Row count difference
+    count_diff = [info1["rows"], info2["rows"]]
+
+    common_columns = [col for col in cols1 if col in cols2]
+    if not common_columns:
+        error_details["row_differences"] = {
+            "count_diff": count_diff,
+            "missing_rows": {},
+            "extra_rows": {},
+            "missing_count": 0,
+            "extra_count": 0
+        }
+        return error_details
+
+    # Map the common columns to their stored names in each table
+    stored = [(col, f"c{cols1.index(col)}", f"c{cols2.index(col)}") for col in common_columns]
+    key1, key2 = stored[0][1], stored[0][2]
+
+    row_differences = {
+        "count_diff": count_diff if count_diff[0] != count_diff[1] else None,
+        "missing_rows": {},
+        "extra_rows": {},
+        "missing_count": 0,
+        "extra_count": 0
+    }
+
+    keyed = (
+        _has_unique_values(connection, table1, key1, info1["rows"])
+        and _has_unique_values(connection, table2, key2, info2["rows"])
+    )
+
+    if keyed:
+        # Index the keys so the joins below do not scan
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {table1}_key ON {table1} ({key1})")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {table2}_key ON {table2} ({key2})")
+
+        # Find missing and extra rows using the key column
+        for field, (outer, outer_key, inner, inner_key) in [
+            ("missing", (table1, key1, table2, key2)),
+            ("extra", (table2, key2, table1, key1))
+        ]:
+            condition = f"NOT EXISTS (SELECT 1 FROM {inner} b WHERE b.{inner_key} = a.{outer_key})"
+            row_differences[f"{field}_count"] = connection.execute(
+                f"SELECT COUNT(*) FROM {outer} a WHERE {condition}"
+            ).fetchone()[0]
+            row_differences[f"{field}_rows"] = dict(connection.execute(
+                f"SELECT a.{outer_key}, a.{ROW_COLUMN} FROM {outer} a WHERE {condition} "
+                f"ORDER BY a.{ROW_COLUMN}{_limit_clause(limits['max_diffs_per_sheet'])}"
+            ).fetchall())
+
+        join = f"FROM {table1} a JOIN {table2} b ON a.{key1} = b.{key2}"
+        identifier_field, identifier = "key", f"a.{key1}"
+    else:
+        # If key column has duplicates, compare rows by position
+        join = f"FROM {table1} a JOIN {table2} b ON a.{ROW_COLUMN} = b.{ROW_COLUMN}"
+        identifier_field, identifier = "row", f"a.{ROW_COLUMN}"
+
+    error_details["row_differences"] = row_differences
+
+    # Count the differences of every column in a single pass over the join
+    not_equal = NOT_EQUAL[engine]
+    count_expressions = ", ".join(
+        f"SUM(CASE WHEN a.{col1} {not_equal} b.{col2} THEN 1 ELSE 0 END)" for _, col1, col2 in stored
+    )
+    row = connection.execute(f"SELECT COUNT(*), {count_expressions} {join}").fetchone()
+    compared_rows, counts = row[0], [int(count or 0) for count in row[1:]]
+    error_details["value_difference_counts"] = {
+        col: count for (col, _, _), count in zip(stored, counts) if count
+    }
+
+    # Values are stored as text, so only the mismatch counts are known per column
+    error_details["column_stats"] = {
+        col: empty_column_stats(compared_rows, count) for (col, _, _), count in zip(stored, counts)
+    }
+
+    # Skip the detail records when most of the sheet differs
+    total = sum(counts)
+    compared = compared_rows * len(stored)
+    threshold = limits["fail_fast_threshold"]
+    if not total or (threshold is not None and compared and total / compared > threshold):
+        return error_details
+
+    # Fetch the first differences of each column within the column limit
+    found = []
+    for column_index, ((col, col1, col2), count) in enumerate(zip(stored, counts)):
+        if not count:
+            continue
+        rows = connection.execute(
+            f"SELECT a.{ROW_COLUMN}, {identifier}, a.{col1}, b.{col2} {join} "
+            f"WHERE a.{col1} {not_equal} b.{col2} "
+            f"ORDER BY a.{ROW_COLUMN}{_limit_clause(limits['max_diffs_per_column'])}"
+        ).fetchall()
+        found.extend((position, column_index, col, ident, value1, value2) for position, ident, value1, value2 in rows)
+
+    # Order the differences by row, then column, and apply the sheet limit
+    found.sort(key=lambda item: (item[0], item[1]))
+    if limits["max_diffs_per_sheet"] is not None:
+        found = found[:limits["max_diffs_per_sheet"]]
+
+    error_details["value_differences"] = [
+        {
+            identifier_field: ident if identifier_field == "key" else int(ident),
+            "column": col,
+            "value1": value1,
+            "value2": value2
+        }
+        for _, _, col, ident, value1, value2 in found
+    ]
+
+    return error_details
+
+def compare_files_sql(file1, file2, limits=None, engine=None, database=None, chunksize=100_000, metrics=None, scope=None):
+    """
+    Compare two files in an embedded SQL database instead of in memory.
+
+    Both files are streamed into an on-disk database (DuckDB if installed,
+    otherwise SQLite), so inputs larger than memory can be compared. Returns the
+    detailed report, summary report and error details in the same shape as
+    compare_files. A temporary database is used and removed unless a database
+    path is given. scope limits the compared columns; row filters are not
+    supported, since values are stored as text.
+    """
+    if scope and (scope.get("row_filter") or scope.get("sheet_row_filters")):
+        raise ValueError("Row filters are not supported by the SQL backend")
+
+    engine = choose_engine(engine)
+
+    temp_dir = None
+    if database is None:
+        temp_dir = tempfile.mkdtemp(prefix="data_integrity_")
+        database = os.path.join(temp_dir, "comparison.db")
+
+    detailed_report = []
+    summary_report = []
+    error_details = empty_error_details()
+
+    connection = _connect(engine, database)
+    try:
+        # Load both files into the database
+        with track_stage(metrics, "loading", file="file1"):
+            tables1 = load_file(connection, engine, file1, "file1", chunksize, scope)
+        with track_stage(metrics, "loading", file="file2"):
+            tables2 = load_file(connection, engine, file2, "file2", chunksize, scope)
+
+        # Compare file types
+        type1 = detect_file_type(file1)
+        type2 = detect_file_type(file2)
+        if type1 != type2:
+            detailed_report.append(f"File types are different: {type1} vs {type2}")
+            summary_report.append(f"File types are different: {type1} vs {type2}")
+
+        # Compare sheet names for multi-sheet inputs, or the single tables
+        multi_sheet1 = type1 in MULTI_SHEET_TYPES
+        multi_sheet2 = type2 in MULTI_SHEET_TYPES
+        if multi_sheet1 and multi_sheet2:
+            common_sheets = compare_sheet_names(
+                list(tables1), list(tables2), detailed_report, summary_report, error_details
+            )
+        elif not multi_sheet1 and not multi_sheet2:
+            common_sheets = {"data"} & set(tables1) & set(tables2)
+        else:
+            common_sheets = set()
+
+        # Compare common sheets
+        for sheet in common_sheets:
+            with track_stage(metrics, "compare_sheet", sheet=sheet):
+                sheet_error_details = compare_sheet_sql(connection, engine, tables1[sheet], tables2[sheet], limits)
+
+            sheet_detailed_report, sheet_summary_report = format_sheet_report(sheet, sheet_error_details)
+            detailed_report.extend(sheet_detailed_report)
+            summary_report.extend(sheet_summary_report)
+
+            # Update error details
+            merge_sheet_error_details(error_details, sheet, sheet_error_details)
+    finally:
+        connection.close()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if metrics is not None:
+        error_details["performance"] = metrics
+
+    return detailed_report, summary_report, error_details
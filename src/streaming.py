@@ -0,0 +1,293 @@
+import itertools
+
+from src.comparison import (
+    resolve_limits, empty_error_details, compare_sheet_names, compare_column_lists,
+    merge_sheet_error_details, format_sheet_report, empty_column_stats
+)
+from src.file_handler import describe_file, iter_sheet_chunks, as_text, scope_columns, MULTI_SHEET_TYPES
+from src.instrumentation import track_stage, progress_tracker
+
+# Orders the keys of sorted inputs can follow: "auto" picks numeric when the
+# first key is a number and text otherwise
+KEY_ORDERS = ["auto", "text", "numeric"]
+
+def _numeric_key(key):
+    """Return the numeric value of a key, for inputs sorted numerically"""
+    try:
+        return int(key)
+    except ValueError:
+        try:
+            return float(key)
+        except ValueError:
+            raise ValueError(f"Key '{key}' is not a number; compare with the text key order instead")
+
+def _text_key(key):
+    """Return a key as is, for inputs sorted as text"""
+    return key
+
+def choose_sort_key(key_order, first_key=None):
+    """
+    Return the function giving the sort value of a key in the given key order
+    """
+    if key_order not in KEY_ORDERS:
+        raise ValueError(f"Unknown key order '{key_order}', expected one of {', '.join(KEY_ORDERS)}")
+
+    if key_order == "auto":
+        try:
+            _numeric_key(first_key)
+            key_order = "numeric"
+        except (ValueError, TypeError):
+            key_order = "text"
+
+    return _numeric_key if key_order == "numeric" else _text_key
+
+def open_sheet(file, sheet_name, chunksize=100_000):
+    """
+    Start reading a sheet as text and return its columns and an iterator over
+    its chunks
+    """
+    chunks = (as_text(chunk) for chunk in iter_sheet_chunks(file, sheet_name, chunksize, text=True))
+    first = next(chunks, None)
+    if first is None:
+        return [], iter(())
+    return list(first.columns), itertools.chain([first], chunks)
+
+def iter_sorted_rows(chunks, key_position, positions, sort_key, description):
+    """
+    Yield (row position, key, sort value, values) for the rows of text chunks
+    sorted by key, keeping the values at the given column positions.
+
+    Raises ValueError as soon as a key is not strictly greater than the one
+    before it, since a merge join needs unique, sorted keys.
+    """
+    position = 0
+    previous_key = None
+    previous_order = None
+
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False, name=None):
+            key = row[key_position]
+            order = sort_key(key)
+
+            if previous_order is not None and not order > previous_order:
+                problem = "a duplicate of" if order == previous_order else "out of order after"
+                raise ValueError(
+                    f"{description} is not sorted by its key column: key '{key}' at row {position} is "
+                    f"{problem} key '{previous_key}'. Use the pandas or SQL backend for unsorted inputs."
+                )
+
+            yield position, key, order, [row[i] for i in positions]
+            previous_key, previous_order = key, order
+            position += 1
+
+def iter_sorted_differences(rows1, rows2, common_columns):
+    """
+    Walk two sorted row iterators at once and yield their differences as they
+    are found: {"kind": "missing" | "extra", "key", "row"} for rows only in one
+    file and {"kind": "changed", "key", "row", "column", "value1", "value2"}
+    for each differing value of a matched row. Also yields
+    {"kind": "matched", "key", "row"} for every matched row, so callers can
+    count the rows compared.
+    """
+    row1 = next(rows1, None)
+    row2 = next(rows2, None)
+
+    while row1 is not None or row2 is not None:
+        if row2 is None or (row1 is not None and row1[2] < row2[2]):
+            yield {"kind": "missing", "key": row1[1], "row": row1[0]}
+            row1 = next(rows1, None)
+
+        elif row1 is None or row2[2] < row1[2]:
+            yield {"kind": "extra", "key": row2[1], "row": row2[0]}
+            row2 = next(rows2, None)
+
+        else:
+            yield {"kind": "matched", "key": row1[1], "row": row1[0]}
+
+            # Only look at the columns of rows that differ
+            values1, values2 = row1[3], row2[3]
+            if values1 != values2:
+                for col, value1, value2 in zip(common_columns, values1, values2):
+                    if value1 != value2:
+                        yield {
+                            "kind": "changed", "key": row1[1], "row": row1[0],
+                            "column": col, "value1": value1, "value2": value2
+                        }
+
+            row1 = next(rows1, None)
+            row2 = next(rows2, None)
+
+def compare_sheet_sorted(file1, file2, sheet_name, limits=None, chunksize=100_000, key_order="auto", progress=None,
+                         scope=None):
+    """
+    Compare one sheet of two inputs sorted by key with a streaming merge join
+    and return the sheet error details in the same shape as compare_sheets.
+
+    Both sheets are read once, in order, a chunk at a time; only the stored
+    differences (within the limits) are kept in memory. Rows are matched on
+    the first common column and values are compared as text. scope limits
+    the compared columns.
+    """
+    limits = resolve_limits(limits)
+    advance = progress_tracker(progress, "comparing", sheet=sheet_name)
+
+    cols1, chunks1 = open_sheet(file1, sheet_name, chunksize)
+    cols2, chunks2 = open_sheet(file2, sheet_name, chunksize)
+
+    error_details = {
+        "column_differences": compare_column_lists(cols1, cols2),
+        "row_differences": {},
+        "value_differences": [],
+        "value_difference_counts": {},
+        "column_stats": {}
+    }
+
+    common_columns = [col for col in cols1 if col in cols2]
+    if scope:
+        common_columns = [common_columns[position] for position in scope_columns(common_columns, scope)]
+    row_differences = {
+        "count_diff": None,
+        "missing_rows": {},
+        "extra_rows": {},
+        "missing_count": 0,
+        "extra_count": 0
+    }
+    error_details["row_differences"] = row_differences
+
+    # Report progress as file 1 is read
+    def tracked(chunks):
+        for chunk in chunks:
+            yield chunk
+            advance(rows=len(chunk))
+
+    if not common_columns:
+        rows1 = sum(len(chunk) for chunk in tracked(chunks1))
+        rows2 = sum(len(chunk) for chunk in chunks2)
+        row_differences["count_diff"] = [rows1, rows2]
+        return error_details
+
+    # Match rows on the first common column, in the order of the first key
+    key_column = common_columns[0]
+    chunks1 = tracked(chunks1)
+    first1 = next(chunks1, None)
+    chunks1 = itertools.chain([first1], chunks1) if first1 is not None else iter(())
+    sort_key = choose_sort_key(key_order, first1.iloc[0][key_column] if first1 is not None and len(first1) else None)
+
+    rows1 = iter_sorted_rows(
+        chunks1, cols1.index(key_column), [cols1.index(col) for col in common_columns],
+        sort_key, f"Sheet '{sheet_name}' of file 1"
+    )
+    rows2 = iter_sorted_rows(
+        chunks2, cols2.index(key_column), [cols2.index(col) for col in common_columns],
+        sort_key, f"Sheet '{sheet_name}' of file 2"
+    )
+
+    counts = {col: 0 for col in common_columns}
+    rows = {"matched": 0, "missing": 0, "extra": 0}
+    value_differences = []
+    max_per_sheet = limits["max_diffs_per_sheet"]
+    max_per_column = limits["max_diffs_per_column"]
+
+    for event in iter_sorted_differences(rows1, rows2, common_columns):
+        kind = event["kind"]
+
+        if kind == "changed":
+            col = event["column"]
+            counts[col] += 1
+
+            # Keep the first differences within the column and sheet limits
+            if (max_per_column is None or counts[col] <= max_per_column) and (
+                max_per_sheet is None or len(value_differences) < max_per_sheet
+            ):
+                value_differences.append({
+                    "key": event["key"],
+                    "column": col,
+                    "value1": event["value1"],
+                    "value2": event["value2"]
+                })
+            continue
+
+        rows[kind] += 1
+        if kind in ["missing", "extra"]:
+            stored = row_differences[f"{kind}_rows"]
+            if max_per_sheet is None or len(stored) < max_per_sheet:
+                stored[event["key"]] = event["row"]
+
+    # Row counts
+    rows1 = rows["matched"] + rows["missing"]
+    rows2 = rows["matched"] + rows["extra"]
+    row_differences["count_diff"] = [rows1, rows2] if rows1 != rows2 else None
+    row_differences["missing_count"] = rows["missing"]
+    row_differences["extra_count"] = rows["extra"]
+
+    error_details["value_difference_counts"] = {col: count for col, count in counts.items() if count}
+    error_details["column_stats"] = {col: empty_column_stats(rows["matched"], count) for col, count in counts.items()}
+
+    # Drop the detail records when most of the sheet differs
+    total = sum(counts.values())
+    compared = rows["matched"] * len(common_columns)
+    threshold = limits["fail_fast_threshold"]
+    if not (threshold is not None and compared and total / compared > threshold):
+        error_details["value_differences"] = value_differences
+
+    return error_details
+
+def compare_files_sorted(file1, file2, limits=None, chunksize=100_000, key_order="auto", metrics=None, progress=None,
+                         scope=None):
+    """
+    Compare two inputs that are sorted by their key column with a streaming
+    merge join.
+
+    Each sheet is read once, sequentially, in chunks, so memory does not grow
+    with the file size. Fails with a ValueError as soon as an input turns out
+    not to be sorted (or to have duplicate keys). Returns the detailed report,
+    summary report and error details in the same shape as compare_files.
+    scope limits the compared columns; row filters are not supported, since
+    values are compared as text.
+    """
+    if scope and (scope.get("row_filter") or scope.get("sheet_row_filters")):
+        raise ValueError("Row filters are not supported by the sorted backend")
+
+    detailed_report = []
+    summary_report = []
+    error_details = empty_error_details()
+
+    data1 = describe_file(file1)
+    data2 = describe_file(file2)
+
+    # Compare file types
+    if data1["type"] != data2["type"]:
+        detailed_report.append(f"File types are different: {data1['type']} vs {data2['type']}")
+        summary_report.append(f"File types are different: {data1['type']} vs {data2['type']}")
+
+    # Compare sheet names for multi-sheet inputs, or the single tables
+    multi_sheet1 = data1["type"] in MULTI_SHEET_TYPES
+    multi_sheet2 = data2["type"] in MULTI_SHEET_TYPES
+    if multi_sheet1 and multi_sheet2:
+        shared_sheets = compare_sheet_names(
+            data1["sheet_names"], data2["sheet_names"], detailed_report, summary_report, error_details
+        )
+        common_sheets = [sheet for sheet in data1["sheet_names"] if sheet in shared_sheets]
+    elif not multi_sheet1 and not multi_sheet2:
+        common_sheets = ["data"]
+    else:
+        common_sheets = []
+
+    # Compare common sheets
+    for sheet in common_sheets:
+        with track_stage(metrics, "compare_sheet", sheet=sheet):
+            sheet_error_details = compare_sheet_sorted(
+                file1, file2, sheet, limits, chunksize, key_order, progress, scope
+            )
+
+        sheet_detailed_report, sheet_summary_report = format_sheet_report(sheet, sheet_error_details)
+        detailed_report.extend(sheet_detailed_report)
+        summary_report.extend(sheet_summary_report)
+
+        # Update error details
+        merge_sheet_error_details(error_details, sheet, sheet_error_details)
+
+    if metrics is not None:
+        error_details["performance"] = metrics
+
+    return detailed_report, summary_report, error_details
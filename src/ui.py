@@ -3,6 +3,7 @@ import pandas as pd
 from io import BytesIO
 import sys
 import os
+import time
 
 # Make sure the assets module can be found
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,6 +13,28 @@ from assets.colors import (
     PRIMARY_COLOR, SECONDARY_COLOR, ACCENT_COLOR,
     ERROR_COLOR, WARNING_COLOR, SUCCESS_COLOR
 )
+from src.instrumentation import metrics_to_json
+from src.profiling import PROFILE_MODES, get_profile_mode
+from src.file_handler import DTYPE_BACKENDS
+from src.streaming import KEY_ORDERS
+from src.sampling import SAMPLE_METHODS, SAMPLE_FRACTION, CONFIDENCE
+
+# File types accepted by the uploaders
+UPLOAD_TYPES = ["xlsx", "csv", "parquet", "pq", "feather", "arrow", "ipc", "gz", "zst", "zip"]
+
+# Media types of the difference exports
+EXPORT_MIME_TYPES = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+# Ways of comparing files: two files with each other, or many candidates with one baseline
+COMPARISON_MODES = ["Two files", "Baseline vs many"]
+
+# Highlighted workbooks offered for download: file 1 alone, both files, or
+# one workbook with both values in each changed cell
+HIGHLIGHT_OUTPUTS = ["File 1", "Both files", "Side by side"]
 
 def setup_page():
     """Configure the page settings and styling"""
@@ -121,36 +144,276 @@ def render_header():
 def render_file_upload_section():
     """Render the file upload section"""
     st.header("Upload Files for Comparison")
-    st.write("Upload two files (Excel or CSV) to compare their structure and data.")
+    st.write(
+        "Upload two files (Excel, CSV, Parquet, Feather or Arrow IPC) to compare their structure and data. "
+        "CSV files can be gzip or Zstandard compressed, and zip archives are compared member by member."
+    )
 
     col1, col2 = st.columns(2)
     with col1:
-        file1 = st.file_uploader("Upload the first file (Base)", type=["xlsx", "csv"],
+        file1 = st.file_uploader("Upload the first file (Base)", type=UPLOAD_TYPES,
                                 accept_multiple_files=False)
     with col2:
-        file2 = st.file_uploader("Upload the second file (Comparison)", type=["xlsx", "csv"],
+        file2 = st.file_uploader("Upload the second file (Comparison)", type=UPLOAD_TYPES,
                                 accept_multiple_files=False)
 
-    compare_clicked = st.button("Compare Files", type="primary", disabled=(not file1 or not file2))
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        compare_clicked = st.button("Compare Files", type="primary", disabled=(not file1 or not file2))
+    with col2:
+        inspect_clicked = st.button(
+            "Inspect Schema", disabled=(not file1 or not file2),
+            help="Compare the columns, types, null rates and row counts from a sample, without loading the files"
+        )
+    with col3:
+        quick_check_clicked = st.button(
+            "Quick Check", disabled=(not file1 or not file2),
+            help="Compare a sample of the keys and estimate how much of each column differs, "
+                 "to decide which sheets need a full comparison"
+        )
+
+    return file1, file2, compare_clicked, inspect_clicked, quick_check_clicked
+
+def render_mode_selector():
+    """Render the choice of comparison mode and return it"""
+    return st.radio(
+        "Comparison mode", COMPARISON_MODES, index=0, horizontal=True,
+        help="Compare two files in detail, or check many candidate files against one baseline at once"
+    )
+
+def render_baseline_upload_section():
+    """Render the upload section of the baseline vs many mode"""
+    st.header("Upload a Baseline and Candidate Files")
+    st.write(
+        "Upload one baseline file and any number of candidate files. The baseline is read and indexed once "
+        "and every candidate is compared with it in parallel, using the pandas backend."
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        baseline = st.file_uploader("Upload the baseline file", type=UPLOAD_TYPES,
+                                    accept_multiple_files=False)
+    with col2:
+        candidates = st.file_uploader("Upload the candidate files", type=UPLOAD_TYPES,
+                                      accept_multiple_files=True)
+
+    compare_clicked = st.button("Compare Candidates", type="primary", disabled=(not baseline or not candidates))
+
+    return baseline, candidates, compare_clicked
 
-    return file1, file2, compare_clicked
+def render_settings_sidebar():
+    """Render the comparison settings in the sidebar and return them"""
+    st.sidebar.header("Settings")
 
-def render_comparison_results(detailed_report, summary_report, error_details, data1):
-    """Render the comparison results in tabs"""
+    # Profiling defaults to the mode configured in the environment
+    profile_options = ["off"] + PROFILE_MODES
+    profile_mode = st.sidebar.selectbox(
+        "Profiling", profile_options, index=profile_options.index(get_profile_mode() or "off"),
+        help="Capture a profile of the next comparison run for download"
+    )
+
+    settings = {
+        "record_performance": st.sidebar.checkbox(
+            "Record performance metrics", value=False,
+            help="Time each stage of the comparison and show the results in a Performance tab"
+        ),
+        "profile_mode": get_profile_mode(profile_mode),
+        "backend": st.sidebar.selectbox(
+            "Comparison backend", ["pandas", "sql", "sorted"], index=0,
+            help="The SQL backend compares the files in an on-disk embedded database, for files larger than memory; "
+                 "the sorted backend streams inputs already sorted by their key column in a single pass"
+        ),
+        "dtype_backend": st.sidebar.selectbox(
+            "In-memory representation", DTYPE_BACKENDS, index=0,
+            help="Keep loaded data as Arrow-backed or categorical columns to reduce memory for large text-heavy files"
+        )
+    }
+
+    # Key order of inputs compared with the sorted backend
+    if settings["backend"] == "sorted":
+        settings["key_order"] = st.sidebar.selectbox(
+            "Key order of the sorted inputs", KEY_ORDERS, index=0,
+            help="How both files are sorted by their key column; auto treats numeric keys as numbers"
+        )
+
+    # Limits on the number of stored differences, for very different files
+    with st.sidebar.expander("Difference limits"):
+        max_per_sheet = st.number_input(
+            "Max differences stored per sheet (0 = unlimited)", min_value=0, value=100000, step=1000
+        )
+        max_per_column = st.number_input(
+            "Max differences stored per column (0 = unlimited)", min_value=0, value=0, step=1000
+        )
+        fail_fast = st.slider(
+            "Stop collecting details above this mismatch rate (1.0 = never)", 0.0, 1.0, 1.0, 0.05,
+            help="Differences are still counted in full, but no details are stored for sheets above this rate"
+        )
+
+    settings["limits"] = {
+        "max_diffs_per_sheet": max_per_sheet or None,
+        "max_diffs_per_column": max_per_column or None,
+        "fail_fast_threshold": fail_fast if fail_fast < 1.0 else None
+    }
+
+    # Columns and rows to compare, applied while the files are read
+    with st.sidebar.expander("Comparison scope"):
+        include_columns = st.text_input(
+            "Only compare these columns (comma-separated)",
+            help="The first column is always kept, since rows are matched on it"
+        )
+        exclude_columns = st.text_input("Leave out these columns (comma-separated)")
+        row_filter_text = st.text_input(
+            "Row filter for all sheets", placeholder="Date >= '2024-05-01'",
+            help="Compare columns with values (==, !=, <, <=, >, >=, in [...]) and combine them with and/or/not; "
+                 "write column names with spaces between backticks. The columns it uses must be compared"
+        )
+        sheet_filters_text = st.text_area(
+            "Row filters per sheet", placeholder="Orders: Amount > 1000",
+            help="One 'sheet: expression' per line, overriding the filter for all sheets"
+        )
+
+    settings["scope"] = {
+        "include_columns": _split_list(include_columns),
+        "exclude_columns": _split_list(exclude_columns),
+        "row_filter": row_filter_text.strip() or None,
+        "sheet_row_filters": _parse_sheet_filters(sheet_filters_text)
+    }
+
+    return settings
+
+def render_quick_check_settings():
+    """Render the sampling settings of the quick check in the sidebar and return them"""
+    with st.sidebar.expander("Quick check sampling"):
+        fraction = st.number_input(
+            "Fraction of keys sampled", min_value=0.0001, max_value=1.0, value=SAMPLE_FRACTION, step=0.005, format="%.4f"
+        )
+        method = st.selectbox(
+            "Sampling method", SAMPLE_METHODS, index=0,
+            help="key_hash picks the same keys in both files by hashing them and also estimates extra rows; "
+                 "random draws rows of file 1 at random"
+        )
+        confidence = st.slider("Confidence level", 0.80, 0.99, CONFIDENCE, 0.01)
+
+    return {"fraction": fraction, "method": method, "confidence": confidence}
+
+def _split_list(text):
+    """Split a comma-separated list, or return None when it is empty"""
+    items = [item.strip() for item in text.split(",") if item.strip()]
+    return items or None
+
+def _parse_sheet_filters(text):
+    """Parse 'sheet: expression' lines into a dictionary of row filters by sheet"""
+    filters = {}
+    for line in text.splitlines():
+        sheet_name, separator, expression = line.partition(":")
+        if separator and sheet_name.strip() and expression.strip():
+            filters[sheet_name.strip()] = expression.strip()
+    return filters
+
+def render_schema_report(inspection):
+    """Render the schema inspection of both files"""
+    st.markdown("---")
+    st.header("Schema Inspection")
+
+    if inspection["report"]:
+        st.warning("Schema drift found in the sampled rows. Narrow the comparison scope in the sidebar or compare the files as they are.")
+        for line in inspection["report"]:
+            st.markdown(f"- {line}")
+    else:
+        st.success("No schema drift found in the sampled rows.")
+
+    sheets1 = inspection["schema1"]["sheets"]
+    sheets2 = inspection["schema2"]["sheets"]
+    for sheet_name in list(sheets1) + [sheet for sheet in sheets2 if sheet not in sheets1]:
+        sheet1 = sheets1.get(sheet_name)
+        sheet2 = sheets2.get(sheet_name)
+
+        with st.expander(f"Schema of '{sheet_name}'", expanded=False):
+            rows = [sheet["rows"] if sheet else None for sheet in [sheet1, sheet2]]
+            st.markdown(f"Rows: {_format_stat(rows[0]) or '-'} in File 1, {_format_stat(rows[1]) or '-'} in File 2")
+
+            # List every column of either file with its type and null rate
+            columns = (sheet1["columns"] if sheet1 else []) + [
+                col for col in (sheet2["columns"] if sheet2 else []) if not sheet1 or col not in sheet1["columns"]
+            ]
+            schema_df = pd.DataFrame([
+                {
+                    "Column": str(col),
+                    "Type File 1": sheet1["dtypes"].get(col, "") if sheet1 else "",
+                    "Type File 2": sheet2["dtypes"].get(col, "") if sheet2 else "",
+                    "Nulls File 1": f"{sheet1['null_rates'][col]:.1%}" if sheet1 and col in sheet1["null_rates"] else "",
+                    "Nulls File 2": f"{sheet2['null_rates'][col]:.1%}" if sheet2 and col in sheet2["null_rates"] else ""
+                }
+                for col in columns
+            ])
+            st.dataframe(schema_df, use_container_width=True, hide_index=True)
+
+def render_quick_check_report(result, report):
+    """Render the estimated differences of a quick check"""
+    st.markdown("---")
+    st.header("Quick Check")
+
+    level = f"{result['confidence']:.0%}"
+    sheets = [sheet for sheet, sheet_result in result["sheets"].items() if sheet_result["needs_full_comparison"]]
+    if sheets or result["type_change"] or result["missing_sheets"] or result["extra_sheets"]:
+        st.warning(
+            f"Differences found in a {result['fraction']:.2%} sample of the keys. "
+            + (f"Compare these sheets in full: {', '.join(sheets)}" if sheets else "")
+        )
+    else:
+        st.success(f"No differences found in a {result['fraction']:.2%} sample of the keys.")
+
+    for line in report:
+        st.markdown(f"- {line}")
+
+    for sheet_name, sheet in result["sheets"].items():
+        if not sheet["columns"]:
+            continue
+        with st.expander(f"Estimated mismatch rates in '{sheet_name}'", expanded=sheet["needs_full_comparison"]):
+            st.markdown(
+                f"Sampled {sheet['sampled_rows'][0]:,} of {sheet['rows'][0]:,} rows in File 1 and "
+                f"{sheet['sampled_rows'][1]:,} of {sheet['rows'][1]:,} rows in File 2"
+            )
+            rates_df = pd.DataFrame([
+                {
+                    "Column": str(col),
+                    "Differences in sample": column["observed"],
+                    "Rows compared": column["sampled"],
+                    "Mismatch rate": f"{column['rate']:.2%}" if column["rate"] is not None else "",
+                    f"{level} interval": f"{column['low']:.2%} to {column['high']:.2%}" if column["sampled"] else "",
+                    "Estimated differences": column["estimated"]
+                }
+                for col, column in sheet["columns"].items()
+            ])
+            st.dataframe(rates_df, use_container_width=True, hide_index=True)
+
+            if sheet["examples"]:
+                st.markdown("Example differences from the sample:")
+                st.dataframe(pd.DataFrame(sheet["examples"]), use_container_width=True, hide_index=True)
+
+def render_comparison_results(detailed_report, summary_report, error_details, data1, performance=None, diff_store=None):
+    """Render the comparison results in tabs, browsing the differences in the diff store when given"""
     st.markdown("---")
     st.header("Comparison Results")
 
-    # Create tabs for different reports
-    tab1, tab2, tab3 = st.tabs(["Summary Report", "Detailed Report", "Visual Comparison"])
+    # Create tabs for different reports, with a Performance tab if metrics were recorded
+    tab_names = ["Summary Report", "Detailed Report", "Visual Comparison"]
+    if performance:
+        tab_names.append("Performance")
+    tabs = st.tabs(tab_names)
 
-    with tab1:
+    with tabs[0]:
         render_summary_report(summary_report, data1)
 
-    with tab2:
+    with tabs[1]:
         render_detailed_report(detailed_report, data1)
 
-    with tab3:
-        render_visual_comparison(error_details)
+    with tabs[2]:
+        render_visual_comparison(error_details, diff_store)
+
+    if performance:
+        with tabs[3]:
+            render_performance_report(performance)
 
 def render_summary_report(summary_report, data1):
     """Render the summary report tab"""
@@ -214,7 +477,7 @@ def render_detailed_report(detailed_report, data1):
                 for i, item in enumerate(items):
                     st.markdown(f"**{i+1}.** {item}")
 
-def render_visual_comparison(error_details):
+def render_visual_comparison(error_details, diff_store=None):
     """Render the visual comparison tab"""
     st.subheader("Visual Comparison of Differences")
 
@@ -264,7 +527,7 @@ def render_visual_comparison(error_details):
         st.markdown("### Row Count Differences")
 
         for sheet, diff in error_details["row_differences"].items():
-            if diff["count_diff"] or diff["missing_rows"] or diff["extra_rows"]:
+            if diff["count_diff"] or diff["missing_count"] or diff["extra_count"]:
                 with st.expander(f"Row differences in '{sheet}'", expanded=True):
                     if diff["count_diff"]:
                         st.markdown(f"<div class='warning'>Row count mismatch: {diff['count_diff'][0]} rows in File 1 vs {diff['count_diff'][1]} rows in File 2</div>", unsafe_allow_html=True)
@@ -272,30 +535,46 @@ def render_visual_comparison(error_details):
                     col1, col2 = st.columns(2)
 
                     with col1:
-                        if diff["missing_rows"]:
-                            st.markdown(f"<div class='error'>Rows in File 1 but missing in File 2 ({len(diff['missing_rows'])} rows):</div>", unsafe_allow_html=True)
+                        if diff["missing_count"]:
+                            st.markdown(f"<div class='error'>Rows in File 1 but missing in File 2 ({diff['missing_count']} rows):</div>", unsafe_allow_html=True)
                             # Show at most 10 missing rows to avoid cluttering the UI
                             for key in list(diff["missing_rows"])[:10]:
                                 st.markdown(f"- Key: {key}")
-                            if len(diff["missing_rows"]) > 10:
-                                st.markdown(f"- ... and {len(diff['missing_rows']) - 10} more")
+                            if diff["missing_count"] > 10:
+                                st.markdown(f"- ... and {diff['missing_count'] - 10} more")
 
                     with col2:
-                        if diff["extra_rows"]:
-                            st.markdown(f"<div class='warning'>Rows in File 2 but missing in File 1 ({len(diff['extra_rows'])} rows):</div>", unsafe_allow_html=True)
+                        if diff["extra_count"]:
+                            st.markdown(f"<div class='warning'>Rows in File 2 but missing in File 1 ({diff['extra_count']} rows):</div>", unsafe_allow_html=True)
                             # Show at most 10 extra rows to avoid cluttering the UI
                             for key in list(diff["extra_rows"])[:10]:
                                 st.markdown(f"- Key: {key}")
-                            if len(diff["extra_rows"]) > 10:
-                                st.markdown(f"- ... and {len(diff['extra_rows']) - 10} more")
+                            if diff["extra_count"] > 10:
+                                st.markdown(f"- ... and {diff['extra_count'] - 10} more")
+
+    # Display the per-column statistics by sheet
+    if error_details.get("column_stats"):
+        render_column_stats(error_details["column_stats"])
 
     # Display value differences by sheet
-    if error_details["value_differences"]:
+    if error_details["value_difference_counts"]:
         st.markdown("### Value Differences")
 
-        for sheet, diffs in error_details["value_differences"].items():
-            if diffs:
-                with st.expander(f"Value differences in '{sheet}' ({len(diffs)} differences)", expanded=True):
+        for sheet, counts in error_details["value_difference_counts"].items():
+            diffs = error_details["value_differences"].get(sheet, [])
+            total = sum(counts.values())
+            if total:
+                with st.expander(f"Value differences in '{sheet}' ({total} differences)", expanded=True):
+                    # Explain when only part of the differences were kept
+                    if len(diffs) < total:
+                        st.markdown(f"<div class='warning'>Difference limits reached: details were kept for {len(diffs)} of {total} differences. Counts per column:</div>", unsafe_allow_html=True)
+                        counts_df = pd.DataFrame({"Column": list(counts), "Differences": list(counts.values())})
+                        st.dataframe(counts_df, use_container_width=True)
+
+                    # The diff store is browsed below instead
+                    if diff_store:
+                        continue
+
                     # Create a DataFrame to display the differences
                     diff_data = []
                     for diff in diffs[:100]:  # Limit to 100 differences to avoid performance issues
@@ -321,34 +600,298 @@ def render_visual_comparison(error_details):
                         if len(diffs) > 100:
                             st.markdown(f"*Showing 100 of {len(diffs)} differences. Download the detailed report for all differences.*")
 
+    if diff_store:
+        render_difference_browser(diff_store)
+
+def render_difference_browser(diff_store):
+    """Render filters, sorting and pages over the differences in a diff store"""
+    from src.diff_store import DIFF_FIELDS, PAGE_SIZE, query_differences, distinct_values, page_count
+
+    sheets = distinct_values(diff_store, "sheet")
+    if not sheets:
+        return
+
+    st.markdown("### Browse Differences")
+
+    # Every filter is answered by the indexes of the store, so only one page is ever read
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sheet = st.selectbox("Sheet", ["All"] + sheets, key="browse_sheet")
+    with col2:
+        columns = distinct_values(diff_store, "column", None if sheet == "All" else sheet)
+        column = st.selectbox("Column", ["All"] + columns, key="browse_column")
+    with col3:
+        diff_types = distinct_values(diff_store, "diff_type", None if sheet == "All" else sheet)
+        diff_type = st.selectbox("Difference type", ["All"] + diff_types, key="browse_diff_type")
+    with col4:
+        key_prefix = st.text_input("Key starts with", key="browse_key_prefix")
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort_by = st.selectbox("Sort by", ["Store order"] + DIFF_FIELDS, key="browse_sort_by")
+    with col2:
+        descending = st.checkbox("Descending", key="browse_descending")
+    with col3:
+        page = st.number_input("Page", min_value=1, value=1, step=1, key="browse_page")
+
+    rows, total = query_differences(
+        diff_store,
+        sheet=None if sheet == "All" else sheet,
+        column=None if column == "All" else column,
+        diff_type=None if diff_type == "All" else diff_type,
+        key_prefix=key_prefix or None,
+        sort_by=None if sort_by == "Store order" else sort_by,
+        descending=descending,
+        offset=(page - 1) * PAGE_SIZE,
+        limit=PAGE_SIZE
+    )
+
+    if rows:
+        st.dataframe(pd.DataFrame(rows, columns=DIFF_FIELDS), use_container_width=True, hide_index=True)
+    st.markdown(f"*Page {page} of {page_count(total)}, {total:,} matching differences.*")
+
+def _format_stat(value, digits=4):
+    """Format an optional statistic for display"""
+    if value is None:
+        return ""
+    return f"{value:.{digits}g}" if isinstance(value, float) else f"{value:,}"
+
+def render_column_stats(column_stats):
+    """Render a summary table of the statistics of the columns with differences"""
+    st.markdown("### Column Statistics")
+
+    for sheet, stats in column_stats.items():
+        # Only list the columns whose values or nulls changed
+        changed = {
+            col: col_stats for col, col_stats in stats.items()
+            if col_stats["mismatches"] or col_stats["became_null"] or col_stats["became_filled"]
+        }
+        if not changed:
+            continue
+
+        with st.expander(f"Column statistics in '{sheet}'", expanded=True):
+            stats_df = pd.DataFrame([
+                {
+                    "Column": str(col),
+                    "Mismatches": col_stats["mismatches"],
+                    "Mismatch Rate": f"{col_stats['mismatches'] / col_stats['compared']:.2%}" if col_stats["compared"] else "",
+                    "Nulls File 1": _format_stat(col_stats["nulls_file1"]),
+                    "Nulls File 2": _format_stat(col_stats["nulls_file2"]),
+                    "Became Null": _format_stat(col_stats["became_null"]),
+                    "Filled In": _format_stat(col_stats["became_filled"]),
+                    "Max |Drift|": _format_stat(col_stats["max_abs_drift"]),
+                    "Mean Drift": _format_stat(col_stats["mean_drift"]),
+                    "Mean |Drift|": _format_stat(col_stats["mean_abs_drift"])
+                }
+                for col, col_stats in changed.items()
+            ])
+            st.dataframe(stats_df, use_container_width=True, hide_index=True)
+
+            # Show the drift histogram of a numeric column
+            numeric_columns = [col for col, col_stats in changed.items() if col_stats["drift_histogram"]]
+            if numeric_columns:
+                col = st.selectbox(
+                    "Drift histogram (file 2 - file 1)", numeric_columns,
+                    format_func=str, key=f"drift_histogram_{sheet}"
+                )
+                histogram = changed[col]["drift_histogram"]
+                edges = histogram["bin_edges"]
+                st.bar_chart(pd.DataFrame(
+                    {"Differences": histogram["counts"]},
+                    index=pd.Index([(edges[i] + edges[i + 1]) / 2 for i in range(len(histogram["counts"]))], name="Drift")
+                ))
+
+def render_performance_report(performance):
+    """Render the per-stage timings and memory usage of the comparison"""
+    st.subheader("Performance Metrics")
+
+    if not performance["stages"]:
+        st.info("No performance metrics were recorded for this comparison.")
+        return
+
+    # Show the overall numbers
+    col1, col2 = st.columns(2)
+    with col1:
+        total = [stage for stage in performance["stages"] if stage["stage"] == "total"]
+        if total:
+            st.metric("Total time", f"{total[0]['seconds']:.2f} s")
+    with col2:
+        if performance["peak_rss_mb"] is not None:
+            st.metric("Peak memory (RSS)", f"{performance['peak_rss_mb']:.1f} MB")
+
+    # Show the per-stage table
+    stages_df = pd.DataFrame(performance["stages"])
+    st.dataframe(stages_df, use_container_width=True)
+
+    st.download_button(
+        label="Download Performance Metrics (JSON)",
+        data=metrics_to_json(performance),
+        file_name="performance_metrics.json",
+        mime="application/json"
+    )
+
+def render_profile_download(artifact):
+    """Render the download for the profile captured during the comparison"""
+    st.markdown("---")
+    st.header("Profile")
+
+    if artifact["summary"]:
+        with st.expander(f"Profile summary ({artifact['mode']})", expanded=False):
+            st.text(artifact["summary"])
+
+    st.download_button(
+        label="Download Profile",
+        data=artifact["data"],
+        file_name=artifact["file_name"],
+        mime=artifact["mime"]
+    )
+
+def render_job_status(job):
+    """
+    Render the status of a background comparison job. Returns True if the
+    cancel button was clicked.
+    """
+    start = job["started"] or job["submitted"]
+    elapsed = time.time() - start
+
+    if job["status"] == "queued":
+        st.info(f"Comparison queued, waiting for a free worker ({elapsed:.0f}s)...")
+        return st.button("Cancel Comparison")
+
+    st.info(f"Comparing files in the background ({elapsed:.0f}s elapsed). You can keep using the page or refresh it.")
+    if job["progress"]:
+        render_progress(job["progress"])
+    return False
+
+def _format_duration(seconds):
+    """Format a number of seconds as a short duration"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+
+def render_progress(event):
+    """Render a progress event as a progress bar with throughput and ETA"""
+    # Files read at the same time get a bar each
+    if event.get("files"):
+        for file_event in event["files"]:
+            render_progress(file_event)
+        return
+
+    # Describe what is being processed
+    if event["phase"] == "reading":
+        label = f"Reading {os.path.basename(event.get('file', ''))}"
+    else:
+        label = "Comparing"
+    if event.get("candidate"):
+        label += f" - {os.path.basename(event['candidate'])}"
+    if event.get("sheet"):
+        label += f" - sheet '{event['sheet']}'"
+    if event.get("stage"):
+        label += f" ({event['stage'].replace('_', ' ')})"
+
+    # Add the amounts processed and the rates
+    details = []
+    if event["sheets_total"]:
+        details.append(f"{event['sheets_done']} of {event['sheets_total']} sheets")
+    details.append(f"{event['rows_done']:,} rows")
+    if event["rows_per_second"]:
+        details.append(f"{event['rows_per_second']:,.0f} rows/s")
+    if event["bytes_per_second"]:
+        details.append(f"{event['bytes_per_second'] / (1024 * 1024):.1f} MB/s")
+    if event["eta_seconds"] is not None:
+        details.append(f"ETA {_format_duration(event['eta_seconds'])}")
+
+    st.progress(event["fraction"] or 0.0, text=label)
+    st.caption(" | ".join(details))
+
+def render_difference_matrix(result):
+    """Render the difference matrix of a baseline vs many comparison"""
+    st.markdown("---")
+    st.header("Candidate Comparison")
+
+    matrix = result["matrix"]
+    differing = int((matrix["total"] > 0).sum())
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Baseline", result["baseline"])
+    col2.metric("Candidates", len(matrix))
+    col3.metric("Candidates with differences", differing)
+
+    if not differing:
+        st.success("Every candidate matches the baseline.")
+        return
+
+    # Show where each candidate differs, highlighting the places with differences
+    st.subheader("Where each candidate differs")
+    st.write("Each cell counts the differences of a candidate in a sheet column or sheet structure; 0 means it matches the baseline.")
+    styled = matrix.style.applymap(lambda count: f"background-color: {ERROR_COLOR}; color: white" if count else "")
+    st.dataframe(styled, use_container_width=True)
+
+    st.download_button(
+        label="Download Difference Matrix",
+        data=matrix.to_csv().encode("utf-8"),
+        file_name="difference_matrix.csv",
+        mime="text/csv"
+    )
+
+    # Describe the differences of each candidate
+    for candidate in result["candidates"]:
+        differences = matrix.loc[candidate["name"]]
+        differences = differences[(differences > 0) & (differences.index != "total")]
+        if differences.empty:
+            continue
+        with st.expander(f"{candidate['name']} ({int(matrix.loc[candidate['name'], 'total'])} differences)", expanded=False):
+            if candidate["type_change"]:
+                st.markdown(f"- File types are different: {candidate['type_change'][0]} vs {candidate['type_change'][1]}")
+            for place, count in differences.items():
+                st.markdown(f"- {place}: {count}")
+
 def render_download_section(data1, data2, error_details, detailed_report, summary_report):
     """Render the download section for highlighted files and reports"""
     st.markdown("---")
     st.header("Download Highlighted Files")
 
-    from src.highlighting import highlight_differences_excel, highlight_differences_csv
+    from src.highlighting import (
+        highlight_differences_excel, highlight_differences_csv, highlight_both_files, highlight_side_by_side
+    )
 
     col1, col2 = st.columns(2)
 
     with col1:
-        if data1["type"] == "excel":
-            highlighted_file1 = highlight_differences_excel(data1, data2, error_details)
-            if highlighted_file1:
-                st.download_button(
-                    label="Download File 1 with Highlights",
-                    data=highlighted_file1,
-                    file_name="file1_highlighted.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-        elif data1["type"] == "csv":
-            highlighted_file1 = highlight_differences_csv(data1, data2, error_details)
-            if highlighted_file1:
-                st.download_button(
-                    label="Download File 1 with Highlights",
-                    data=highlighted_file1,
-                    file_name="file1_highlighted.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+        if data1["data"] is None:
+            st.info("Highlighted files are not available with the SQL and sorted backends, which compare the files without loading them.")
+        else:
+            highlight_output = st.radio(
+                "Highlighted workbooks",
+                HIGHLIGHT_OUTPUTS,
+                horizontal=True,
+                help="Both files are highlighted in one pass over the differences. "
+                     "Side by side shows both values in each changed cell of file 1."
+            )
+            metrics = error_details.get("performance")
+
+            # Highlighted workbooks as (label, bytes, file name)
+            downloads = []
+            if highlight_output == "File 1":
+                highlight = highlight_differences_excel if isinstance(data1["data"], dict) else highlight_differences_csv
+                downloads.append(("Download File 1 with Highlights", highlight(data1, data2, error_details, metrics), "file1_highlighted.xlsx"))
+            elif highlight_output == "Both files":
+                highlighted_file1, highlighted_file2 = highlight_both_files(data1, data2, error_details, metrics)
+                downloads.append(("Download File 1 with Highlights", highlighted_file1, "file1_highlighted.xlsx"))
+                downloads.append(("Download File 2 with Highlights", highlighted_file2, "file2_highlighted.xlsx"))
+            else:
+                downloads.append(("Download Side by Side Workbook", highlight_side_by_side(data1, data2, error_details, metrics), "side_by_side.xlsx"))
+
+            for label, highlighted, file_name in downloads:
+                if highlighted:
+                    st.download_button(
+                        label=label,
+                        data=highlighted,
+                        file_name=file_name,
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
 
     with col2:
         # Generate detailed report as Excel
@@ -371,4 +914,31 @@ def render_download_section(data1, data2, error_details, detailed_report, summar
             data=report_bytes,
             file_name="comparison_report.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
\ No newline at end of file
+        )
+
+    render_differences_export(error_details)
+
+def render_differences_export(error_details):
+    """Render the export of the stored differences as JSON lines, CSV or Parquet"""
+    from src.exporters import EXPORT_FORMATS, export_differences
+
+    st.subheader("Export Differences")
+    st.write(
+        "Export every stored difference (sheet, key or row, column, old and new value, difference type) "
+        "for loading into other systems. Much faster than the highlighted workbooks for large results."
+    )
+
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        file_format = st.selectbox("Export format", EXPORT_FORMATS, index=0)
+    with col2:
+        # Only build the export when asked, since the page reruns on every interaction
+        if st.button("Export Differences"):
+            output = BytesIO()
+            count = export_differences(error_details, output, file_format, error_details.get("performance"))
+            st.download_button(
+                label=f"Download {count:,} Differences",
+                data=output.getvalue(),
+                file_name=f"differences.{file_format}",
+                mime=EXPORT_MIME_TYPES[file_format]
+            )
\ No newline at end of file